@@ -3,29 +3,23 @@
 DNS Benchmark Script - PCAP Edition
 Usage: python3 benchmark.py <pcap_file.pcap>
 """
+import os
 import sys
 import subprocess
 import time
 import re
-from scapy.all import rdpcap, DNS, DNSQR
+
+# pcap_stream.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pcap_stream
 
 def extract_domains_from_pcap(pcap_file):
-    """Reads a pcap file and returns a unique set of DNS query domains."""
-    domains = set()
+    """
+    Streams a pcap/pcapng file and returns the unique DNS query domains,
+    in order of first appearance.
+    """
     try:
-        packets = rdpcap(pcap_file)
-        
-        # Filter for DNS Query packets
-        for pkt in packets:
-            if pkt.haslayer(DNS) and pkt.haslayer(DNSQR) and pkt[DNS].qr == 0:
-                # pkt[DNS].qr == 0 means it's a query
-                try:
-                    # qname is like b'google.com.' - decode and strip trailing dot
-                    domain = pkt[DNSQR].qname.decode('utf-8').rstrip('.')
-                    domains.add(domain)
-                except Exception as e:
-                    print(f"Error decoding domain name: {e}", file=sys.stderr)
-                    
+        domains = pcap_stream.unique_domains(pcap_file)
     except FileNotFoundError:
         print(f"Error: File not found: {pcap_file}", file=sys.stderr)
         return []
@@ -36,7 +30,7 @@ def extract_domains_from_pcap(pcap_file):
     if not domains:
         print(f"No DNS queries found in {pcap_file}", file=sys.stderr)
         
-    return list(domains)
+    return domains
 
 def benchmark(urls):
     """Runs the dig benchmark on a list of URLs."""
@@ -3,15 +3,22 @@
 CS331 Custom DNS Resolver - Starter Code
 Author: [Your Name]
 """
+import argparse
 import socket
 import socketserver
+import threading
 import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Real DNS server to forward queries to (e.g., Google's)
 UPSTREAM_DNS_SERVER = "8.8.8.8"
 UPSTREAM_DNS_PORT = 53
 
+# --- Concurrency ---
+DEFAULT_WORKERS = 32          # Worker threads answering queries (0 = single-threaded)
+DEFAULT_MAX_INFLIGHT = 256    # Queries queued or running before we stop reading the socket
+
 # --- For Bonus Part F: Caching ---
 # A simple cache: {domain: (ip, ttl_expiration_time)}
 DNS_CACHE = {}
@@ -95,7 +102,8 @@ class DNSRequestHandler(socketserver.BaseRequestHandler):
             print("e. Step:              Forwarded to Upstream")
             
             # Get response from upstream
-            response, _ = forward_sock.recvfrom(512)
+            # 512 bytes would cut off EDNS0 responses; take the largest UDP datagram
+            response, _ = forward_sock.recvfrom(65535)
             end_fwd_time = time.time()
             
             rtt = (end_fwd_time - start_fwd_time) * 1000 # in ms
@@ -120,13 +128,74 @@ class DNSRequestHandler(socketserver.BaseRequestHandler):
             print("------------------------\n")
 
 
+class BoundedThreadPoolUDPServer(socketserver.UDPServer):
+    """
+    UDP server that hands each datagram to a fixed pool of worker threads,
+    so one slow upstream lookup no longer stalls every other client.
+    At most max_inflight queries are queued or running at once; past that
+    the serve loop stops reading from the socket (backpressure) until a
+    worker frees a slot.
+    """
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS,
+                 max_inflight=DEFAULT_MAX_INFLIGHT):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dns-worker")
+        self.inflight = threading.BoundedSemaphore(max(max_inflight, workers))
+
+    def process_request(self, request, client_address):
+        self.inflight.acquire()
+        try:
+            self.executor.submit(self.process_request_thread, request, client_address)
+        except RuntimeError:
+            # Executor already shut down
+            self.inflight.release()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.inflight.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CS331 custom DNS resolver")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="worker threads serving queries concurrently "
+                             "(0 = original single-threaded server)")
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT,
+                        help="maximum queries queued or in progress before the "
+                             "server stops reading new datagrams")
+    return parser.parse_args()
+
+
+def create_server(server_address, args):
+    """Builds the UDP server selected on the command line."""
+    if args.workers <= 0:
+        return socketserver.UDPServer(server_address, DNSRequestHandler)
+    return BoundedThreadPoolUDPServer(server_address, DNSRequestHandler,
+                                      workers=args.workers,
+                                      max_inflight=args.max_inflight)
+
+
 if __name__ == "__main__":
+    args = parse_args()
     HOST, PORT = "10.0.0.5", 53 # Listen on the 'dns' host's IP
     print(f"Custom DNS Resolver starting on {HOST}:{PORT}...")
+    if args.workers > 0:
+        print(f"Serving with {args.workers} worker threads, "
+              f"at most {args.max_inflight} queries in flight")
     
     # Listen on UDP
     try:
-        with socketserver.UDPServer((HOST, PORT), DNSRequestHandler) as server:
+        with create_server((HOST, PORT), args) as server:
             server.serve_forever()
     except Exception as e:
         print(f"!!! [Resolver] FAILED TO START: {e} !!!")
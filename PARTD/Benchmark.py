@@ -1,31 +1,33 @@
 #!/usr/bin/python3
 """
 DNS Benchmark Script - PCAP Edition
-Usage: python3 benchmark.py <pcap_file.pcap>
+Usage: python3 benchmark.py <pcap_file.pcap> [--concurrency N | --qps R] [--server IP]
+                                             [--output CSV]
+       python3 benchmark.py <pcap_file.pcap> --replay [--speed X] [--window S]
+
+By default queries are built and sent by the native load generator
+(loadgen.py). Use --engine dig for the original one-dig-per-query benchmark.
 """
+import argparse
+import os
 import sys
 import subprocess
 import time
 import re
-from scapy.all import rdpcap, DNS, DNSQR
+
+import dns_wire
+import loadgen
+# pcap_stream.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pcap_stream
 
 def extract_domains_from_pcap(pcap_file):
-    """Reads a pcap file and returns a unique set of DNS query domains."""
-    domains = set()
+    """
+    Streams a pcap/pcapng file and returns the unique DNS query domains,
+    in order of first appearance.
+    """
     try:
-        packets = rdpcap(pcap_file)
-        
-        # Filter for DNS Query packets
-        for pkt in packets:
-            if pkt.haslayer(DNS) and pkt.haslayer(DNSQR) and pkt[DNS].qr == 0:
-                # pkt[DNS].qr == 0 means it's a query
-                try:
-                    # qname is like b'google.com.' - decode and strip trailing dot
-                    domain = pkt[DNSQR].qname.decode('utf-8').rstrip('.')
-                    domains.add(domain)
-                except Exception as e:
-                    print(f"Error decoding domain name: {e}", file=sys.stderr)
-                    
+        domains = pcap_stream.unique_domains(pcap_file)
     except FileNotFoundError:
         print(f"Error: File not found: {pcap_file}", file=sys.stderr)
         return []
@@ -36,7 +38,7 @@ def extract_domains_from_pcap(pcap_file):
     if not domains:
         print(f"No DNS queries found in {pcap_file}", file=sys.stderr)
         
-    return list(domains)
+    return domains
 
 def benchmark(urls):
     """Runs the dig benchmark on a list of URLs."""
@@ -89,17 +91,160 @@ def benchmark(urls):
     print(f"Average Latency:      {avg_latency:.2f} ms")
     print(f"Average Throughput:   {avg_throughput:.2f} queries/sec")
 
+def default_nameserver():
+    """The first nameserver in /etc/resolv.conf (what dig would use)."""
+    try:
+        with open("/etc/resolv.conf") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    return fields[1]
+    except OSError:
+        pass
+    return "127.0.0.1"
+
+
+def print_results(results, label):
+    """Prints the summary of a native load generator run."""
+    summary = results.summary()
+    latency = summary["latency_ms"]
+    print("--- DNS Benchmark Results ---")
+    print(f"Mode:                 {label}")
+    print(f"Total Queries:        {summary['queries']}")
+    print(f"Successful:           {summary['successful']}")
+    print(f"Failed:               {summary['failed']}")
+    print(f"Timeouts:             {summary['timeouts']} "
+          f"({summary['timeouts'] / max(summary['queries'], 1) * 100:.1f}%)")
+    print(f"Truncated (TC=1):     {summary['truncated']}")
+    print("Response Codes:       " + ", ".join(
+        f"{name}={count}" for name, count in sorted(summary["rcodes"].items())))
+    print(f"Average Latency:      {latency['mean']:.2f} ms")
+    print(f"Latency p50/p90/p99:  {latency['p50']:.2f} / {latency['p90']:.2f} / "
+          f"{latency['p99']:.2f} ms")
+    print(f"Max Latency:          {latency['max']:.2f} ms")
+    print(f"Achieved Throughput:  {summary['achieved_qps']:.2f} queries/sec")
+
+
+def native_benchmark(urls, args):
+    """Benchmarks the resolver with the native UDP load generator."""
+    if not urls:
+        print("Error: No URLs to benchmark.")
+        return None
+    queries = [(url, args.qtype) for url in urls]
+    if args.qps:
+        label = f"open loop at {args.qps:g} queries/sec"
+        results = loadgen.run_open_loop(args.server, loadgen.fixed_rate(queries, args.qps),
+                                        port=args.port, timeout=args.timeout)
+    else:
+        label = f"closed loop, {args.concurrency} outstanding"
+        results = loadgen.run_closed_loop(args.server, queries, args.concurrency,
+                                          port=args.port, timeout=args.timeout)
+    print_results(results, label)
+    return results
+
+
+def print_windows(results, width, speed):
+    """Prints per-window throughput and latency of a replay run."""
+    print(f"--- Latency per {width:g} s window ---")
+    print(f"{'start_s':>8} {'queries':>8} {'qps':>9} {'timeouts':>8} "
+          f"{'p50_ms':>9} {'p99_ms':>9} {'max_ms':>9}")
+    for row in results.windows(width):
+        print(f"{row['start_s']:>8.1f} {row['queries']:>8} {row['qps']:>9.1f} "
+              f"{row['timeouts']:>8} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+              f"{row['max_ms']:>9.2f}")
+    if speed > 0:
+        print(f"(window start times are run time; capture time = run time x {speed:g})")
+
+
+def replay_benchmark(pcap_file, args):
+    """
+    Re-sends every query of the capture in order, keeping its qtype and the
+    original inter-packet gaps scaled by --speed.
+    """
+    queries = pcap_stream.iter_queries(pcap_file)
+    label = (f"replay at {args.speed:g}x capture speed" if args.speed > 0
+             else "replay as fast as possible")
+    results = loadgen.run_open_loop(args.server, loadgen.replay_schedule(queries, args.speed),
+                                    port=args.port, timeout=args.timeout)
+    if not results.total:
+        print(f"No DNS queries found in {pcap_file}. Benchmark aborted.")
+        return None
+    print_results(results, label)
+    print_windows(results, args.window, args.speed)
+    return results
+
+
+def save_results(results, path):
+    """Writes the per-query results of a run to path, if one was given."""
+    if results is None or not path:
+        return
+    results.write_csv(path)
+    print(f"Per-query results saved to {path}")
+
+
+def query_type(text):
+    """argparse type for --qtype: a type name such as AAAA, or its number."""
+    if text.isdigit() and int(text) <= 0xFFFF:
+        return int(text)
+    codes = {name: code for code, name in dns_wire.TYPE_NAMES.items()}
+    if text.upper() not in codes:
+        raise argparse.ArgumentTypeError(
+            f"unknown query type {text!r} (use a number or one of {', '.join(sorted(codes))})")
+    return codes[text.upper()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark DNS resolution of the "
+                                                 "queries found in a PCAP file")
+    parser.add_argument("pcap_file")
+    parser.add_argument("--engine", choices=("native", "dig"), default="native",
+                        help="native UDP load generator, or the original dig loop")
+    parser.add_argument("--server", default=None,
+                        help="resolver to query (default: first nameserver in /etc/resolv.conf)")
+    parser.add_argument("--port", type=int, default=53)
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="queries kept outstanding at once (closed loop)")
+    parser.add_argument("--qps", type=float, default=None,
+                        help="send at this fixed rate instead (open loop)")
+    parser.add_argument("--replay", action="store_true",
+                        help="re-send every captured query in order with its original "
+                             "qtype and timing, instead of the unique domains")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed-up factor (1 = real time, 10 = ten times "
+                             "faster, 0 = as fast as possible)")
+    parser.add_argument("--window", type=float, default=1.0,
+                        help="seconds per window in the replay latency report")
+    parser.add_argument("--timeout", type=float, default=loadgen.DEFAULT_TIMEOUT,
+                        help="seconds before a query counts as timed out")
+    parser.add_argument("--output", metavar="CSV", default=None,
+                        help="save every query's send time, latency and rcode to this file "
+                             "(native engine), for plot_logs.py --analyze")
+    parser.add_argument("--qtype", type=query_type, default=dns_wire.TYPE_A,
+                        help="query type (A, AAAA, ... or a number)")
+    args = parser.parse_args()
+    if args.replay and not os.path.isfile(args.pcap_file):
+        parser.error(f"capture file not found: {args.pcap_file}")
+    if args.server is None:
+        args.server = default_nameserver()
+    return args
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print(f"Usage: python3 {sys.argv[0]} <pcap_file.pcap>")
-        sys.exit(1)
-        
-    pcap_file = sys.argv[1]
+    args = parse_args()
+    pcap_file = args.pcap_file
+    if args.replay:
+        print(f"Replaying DNS queries from {pcap_file}...")
+        save_results(replay_benchmark(pcap_file, args), args.output)
+        sys.exit(0)
+
     print(f"Extracting domains from {pcap_file}...")
     domains_to_test = extract_domains_from_pcap(pcap_file)
     
     if domains_to_test:
         print(f"Found {len(domains_to_test)} unique domains. Starting benchmark...")
-        benchmark(domains_to_test)
+        if args.engine == "dig":
+            benchmark(domains_to_test)
+        else:
+            save_results(native_benchmark(domains_to_test, args), args.output)
     else:
-        print("Benchmark aborted.")
\ No newline at end of file
+        print("Benchmark aborted.")
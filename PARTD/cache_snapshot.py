@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Cache snapshots
+Saves the answer cache and the iterative resolver's delegation cache to a
+compact binary file, and loads them back at startup so a restarted resolver
+does not begin cold. Entries keep their absolute store and expiry times, so
+after a reload their TTLs are simply aged by the time the resolver was down;
+anything that expired in the meantime is skipped.
+
+File layout (network byte order):
+    header      magic "DNSSNAP1", saved_at f64, entry count u32, zone count u32
+    entry       qname, qtype u16, qclass u16, kind u8, ttl u32, stored_at f64,
+                expires_at f64, hits u32, TTL offset count u16,
+                (offset u16, ttl u32) * count, response length u32, response
+    zone        zone name, expires_at f64, NS count u16,
+                (NS name, address count u8, IPv4 address 4 bytes * count) * count
+where a name is a u16 length followed by UTF-8 bytes.
+"""
+import mmap
+import os
+import socket
+import struct
+import time
+
+import dns_cache
+
+MAGIC = b"DNSSNAP1"
+
+_HEADER = struct.Struct("!8sdII")
+_ENTRY = struct.Struct("!HHBIddIH")
+_TTL = struct.Struct("!HI")
+_ZONE = struct.Struct("!dH")
+_U8 = struct.Struct("!B")
+_U16 = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+
+
+def _pack_name(name):
+    raw = name.encode("utf-8")
+    return _U16.pack(len(raw)) + raw
+
+
+def _read_name(buf, offset):
+    length = _U16.unpack_from(buf, offset)[0]
+    offset += 2
+    return bytes(buf[offset:offset + length]).decode("utf-8"), offset + length
+
+
+def save(path, cache, delegations=None, shared=None):
+    """
+    Writes a snapshot of cache (a DNSCache) and delegations (a DelegationCache
+    or None) to path. shared, a shared_cache.SharedAnswerTable, adds the
+    answers cached by the other worker processes. The file is replaced
+    atomically, but never by an empty snapshot.
+    Returns (entries written, zones written).
+    """
+    entries = cache.snapshot()
+    if shared is not None:
+        local = {entry[0] for entry in entries}
+        entries += [entry for entry in shared.snapshot() if entry[0] not in local]
+    zones = delegations.snapshot() if delegations is not None else []
+    if not entries and not zones and os.path.exists(path):
+        return 0, 0  # Nothing cached yet: keep the last good snapshot
+    parts = [_HEADER.pack(MAGIC, time.time(), len(entries), len(zones))]
+    for (qname, qtype, qclass), response, ttls, ttl, stored_at, expires_at, kind, hits in entries:
+        parts.append(_pack_name(qname))
+        parts.append(_ENTRY.pack(qtype, qclass, dns_cache.KINDS.index(kind), ttl, stored_at,
+                                 expires_at, hits, len(ttls)))
+        parts.extend(_TTL.pack(offset, value) for offset, value in ttls)
+        parts.append(_U32.pack(len(response)))
+        parts.append(response)
+    for zone, ns_names, addresses, expires_at in zones:
+        parts.append(_pack_name(zone))
+        parts.append(_ZONE.pack(expires_at, len(ns_names)))
+        for name in ns_names:
+            ips = addresses.get(name, ())[:255]
+            parts.append(_pack_name(name))
+            parts.append(_U8.pack(len(ips)))
+            parts.extend(socket.inet_aton(ip) for ip in ips)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(tmp, path)
+    return len(entries), len(zones)
+
+
+def load(path, cache, delegations=None):
+    """
+    Restores a snapshot written by save(). Entries and zones that have
+    expired since are skipped. Returns (entries loaded, zones loaded).
+    Raises ValueError if the file is not a snapshot.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise ValueError(f"{path} is too short to be a cache snapshot")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _load(buf, cache, delegations)
+
+
+def _load(buf, cache, delegations):
+    magic, _, entry_count, zone_count = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("not a cache snapshot")
+    offset = _HEADER.size
+    now = time.time()
+    entries = []
+    for _ in range(entry_count):
+        qname, offset = _read_name(buf, offset)
+        (qtype, qclass, kind, ttl, stored_at, expires_at,
+         hits, ttl_count) = _ENTRY.unpack_from(buf, offset)
+        offset += _ENTRY.size
+        ttls = [_TTL.unpack_from(buf, offset + i * _TTL.size) for i in range(ttl_count)]
+        offset += ttl_count * _TTL.size
+        length = _U32.unpack_from(buf, offset)[0]
+        offset += 4
+        response = bytes(buf[offset:offset + length])
+        offset += length
+        entries.append(((qname, qtype, qclass), response, ttls, ttl, stored_at,
+                        expires_at, dns_cache.KINDS[kind], hits))
+    loaded = cache.restore(entries, now)
+
+    zones = 0
+    for _ in range(zone_count):
+        zone, offset = _read_name(buf, offset)
+        expires_at, ns_count = _ZONE.unpack_from(buf, offset)
+        offset += _ZONE.size
+        ns_names, addresses = [], {}
+        for _ in range(ns_count):
+            name, offset = _read_name(buf, offset)
+            ip_count = buf[offset]
+            offset += 1
+            ns_names.append(name)
+            if ip_count:
+                addresses[name] = [socket.inet_ntoa(buf[offset + 4 * i:offset + 4 * i + 4])
+                                   for i in range(ip_count)]
+            offset += 4 * ip_count
+        if delegations is not None and expires_at > now:
+            delegations.restore(zone, ns_names, addresses, expires_at)
+            zones += 1
+    return loaded, zones
@@ -0,0 +1,428 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Compact answer store
+A DNSCache whose entries live in a few large flat buffers instead of one
+Python object graph per name (OrderedDict node, key tuple, _Entry, TTL list),
+so millions of answers fit in a bounded, predictable amount of memory. The
+caching rules (TTLs, negative answers, prefetch, serve-stale, shared table)
+are DNSCache's; only the storage is different:
+
+- Slabs: each entry's key, TTL offsets and wire-format response are packed
+  into one fixed-size slot of the smallest size class that fits them.
+  A class grows a CHUNK_BYTES chunk at a time until max_bytes is used up;
+  after that a class reuses its own slots, evicting with the CLOCK algorithm
+  (a reference bit set on every hit approximates LRU at one byte per entry).
+- Per-slot metadata (hash, times, hits, kind, ...) sits in parallel
+  array.array columns of the slab.
+- Index: an open-addressing hash table (linear probing, backward-shift
+  deletion) of slot ids in one array('q'), sized up front for max_entries.
+- Expiry: a timing wheel of one-second buckets. Each entry is filed under
+  the second it can be dropped, and every put advances the wheel to now,
+  so expired entries are freed without scanning the cache.
+
+    python3 compact_cache.py --entries 3000000     (fill it and print bytes per entry)
+"""
+import argparse
+import bisect
+import resource
+import struct
+import time
+from array import array
+
+import dns_cache
+
+CHUNK_BYTES = 64 * 1024
+# Slot sizes; each is about 1.5x the previous, so at most a third of a slot is unused
+SIZE_CLASSES = (64, 96, 128, 192, 256, 384, 512, 768, 1024, 1536, 2048, 3072, 4096, 6144,
+                8192, 12288, 16384, 24576, 32768, 49152, 65536 + 512)
+CLASS_BITS = 5                 # Slot id = slot << CLASS_BITS | size class
+WHEEL_SECONDS = 4096           # Longer lifetimes go round the wheel more than once
+LOAD_FACTOR = 0.75             # Index slots per entry is at least 1 / LOAD_FACTOR
+
+# Key length, response length, TTL offset count; then key, (offset, TTL) pairs, response
+_RECORD = struct.Struct("!HHB")
+_TTL = struct.Struct("!HI")
+_FREE = 0                      # kind column: 0 = free slot, else KINDS index + 1
+
+
+def _key_bytes(key):
+    qname, qtype, qclass = key
+    return f"{qname}/{qtype}/{qclass}".encode("utf-8")
+
+
+class _Slab:
+    """The slots of one size class and their metadata columns."""
+
+    __slots__ = ("size", "per_chunk", "data", "slots", "free", "hand", "live",
+                 "hash", "ttl", "hits", "stored_at", "expires_at", "refresh_at", "wheel_at",
+                 "kind", "referenced")
+
+    def __init__(self, size):
+        self.size = size
+        self.per_chunk = max(CHUNK_BYTES // size, 1)
+        self.data = bytearray()
+        self.slots = 0
+        self.free = array("I")      # Stack of free slot numbers
+        self.hand = 0               # CLOCK hand
+        self.live = 0
+        self.hash = array("q")
+        self.ttl = array("I")
+        self.hits = array("I")
+        self.stored_at = array("d")
+        self.expires_at = array("d")
+        self.refresh_at = array("d")
+        self.wheel_at = array("I")  # Second the entry is filed under in the wheel
+        self.kind = array("B")
+        self.referenced = array("B")
+
+    def grow(self):
+        n = self.per_chunk
+        self.data.extend(bytes(n * self.size))
+        for column, width in ((self.hash, 8), (self.ttl, 4), (self.hits, 4),
+                              (self.stored_at, 8), (self.expires_at, 8), (self.refresh_at, 8),
+                              (self.wheel_at, 4), (self.kind, 1), (self.referenced, 1)):
+            column.frombytes(bytes(n * width))
+        # Lowest slot on top, so slots are handed out in order
+        self.free.extend(range(self.slots + n - 1, self.slots - 1, -1))
+        self.slots += n
+
+    def metadata_bytes(self):
+        columns = 8 + 4 + 4 + 8 + 8 + 8 + 4 + 1 + 1
+        return self.slots * columns + self.free.itemsize * len(self.free)
+
+
+class _SlotEntry:
+    """
+    A stored entry seen through the _Entry attributes DNSCache reads and
+    updates (cache lock held). hits and refresh_at write through to the slab.
+    """
+
+    __slots__ = ("slab", "slot", "ttl", "stored_at", "expires_at", "kind", "_record")
+
+    def __init__(self, slab, slot):
+        self.slab = slab
+        self.slot = slot
+        self.ttl = slab.ttl[slot]
+        self.stored_at = slab.stored_at[slot]
+        self.expires_at = slab.expires_at[slot]
+        self.kind = dns_cache.KINDS[slab.kind[slot] - 1]
+        self._record = None
+
+    def _read(self):
+        """(ttls, response) unpacked from the slot."""
+        if self._record is None:
+            data, base = self.slab.data, self.slot * self.slab.size
+            key_len, resp_len, ttl_count = _RECORD.unpack_from(data, base)
+            offset = base + _RECORD.size + key_len
+            ttls = [_TTL.unpack_from(data, offset + i * _TTL.size) for i in range(ttl_count)]
+            offset += ttl_count * _TTL.size
+            self._record = ttls, bytes(data[offset:offset + resp_len])
+        return self._record
+
+    @property
+    def response(self):
+        return self._read()[1]
+
+    @property
+    def ttls(self):
+        return self._read()[0]
+
+    @property
+    def hits(self):
+        return self.slab.hits[self.slot]
+
+    @hits.setter
+    def hits(self, value):
+        self.slab.hits[self.slot] = min(value, 0xFFFFFFFF)
+
+    @property
+    def refresh_at(self):
+        return self.slab.refresh_at[self.slot]
+
+    @refresh_at.setter
+    def refresh_at(self, value):
+        self.slab.refresh_at[self.slot] = value
+
+
+class CompactDNSCache(dns_cache.DNSCache):
+    """
+    DNSCache with slab storage. max_bytes bounds the slabs (the answers);
+    the index is sized for max_entries when the cache is created.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, **options):
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, **options)
+        self._entries = None
+        self.slabs = [_Slab(size) for size in SIZE_CLASSES]
+        self.count = 0
+        self.evictions = 0
+        self.expirations = 0
+        capacity = 1024
+        while capacity * LOAD_FACTOR < max_entries:
+            capacity *= 2
+        self._mask = capacity - 1
+        self._index = array("q", bytes(8 * capacity))   # slot id + 1, 0 = empty
+        self._wheel = [array("q") for _ in range(WHEEL_SECONDS)]
+        self._wheel_now = int(time.time())
+
+    def __len__(self):
+        return self.count
+
+    def footprint(self):
+        """Bytes of every buffer the store holds: slabs, metadata, index and wheel."""
+        wheel = sum(len(bucket) for bucket in self._wheel) * 8 + WHEEL_SECONDS * 64
+        return (self.bytes_used + sum(slab.metadata_bytes() for slab in self.slabs)
+                + len(self._index) * self._index.itemsize + wheel)
+
+    def report(self):
+        """Printable lines: entries, footprint, bytes per entry and slab use per size class."""
+        lines = [f"{self.count} entries in {self.footprint() / 2 ** 20:.1f} MB "
+                 f"({self.bytes_per_entry():.0f} bytes per entry; {self.evictions} evicted, "
+                 f"{self.expirations} expired)"]
+        for slab in self.slabs:
+            if slab.slots:
+                lines.append(f"  {slab.size:>6}-byte slots: {slab.live:>9} used of {slab.slots}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            entries = []
+            for slab in self.slabs:
+                for slot in range(slab.slots):
+                    if slab.kind[slot] != _FREE:
+                        entry = _SlotEntry(slab, slot)
+                        entries.append((self._key_of(slab, slot), entry.response, entry.ttls,
+                                        entry.ttl, entry.stored_at, entry.expires_at,
+                                        entry.kind, entry.hits))
+            return entries
+
+    # --- Storage (lock held) ---
+
+    def _find(self, raw_key, key_hash):
+        """(index position, slot id) of raw_key, or (position of the empty slot, None)."""
+        index, mask = self._index, self._mask
+        position = key_hash & mask
+        while True:
+            value = index[position]
+            if not value:
+                return position, None
+            slot_id = value - 1
+            slab = self.slabs[slot_id & ((1 << CLASS_BITS) - 1)]
+            slot = slot_id >> CLASS_BITS
+            if slab.hash[slot] == key_hash:
+                base = slot * slab.size
+                key_len = _RECORD.unpack_from(slab.data, base)[0]
+                start = base + _RECORD.size
+                if slab.data[start:start + key_len] == raw_key:
+                    return position, slot_id
+            position = (position + 1) & mask
+
+    def _key_of(self, slab, slot):
+        base = slot * slab.size
+        key_len = _RECORD.unpack_from(slab.data, base)[0]
+        qname, qtype, qclass = bytes(slab.data[base + _RECORD.size:
+                                               base + _RECORD.size + key_len]).decode(
+            "utf-8").rsplit("/", 2)
+        return qname, int(qtype), int(qclass)
+
+    def _lookup(self, key):
+        raw_key = _key_bytes(key)
+        _, slot_id = self._find(raw_key, hash(raw_key))
+        if slot_id is None:
+            return None
+        return _SlotEntry(self.slabs[slot_id & ((1 << CLASS_BITS) - 1)], slot_id >> CLASS_BITS)
+
+    def _touch(self, key, entry):
+        entry.slab.referenced[entry.slot] = 1
+
+    def _insert(self, key, entry):
+        self._advance_wheel(time.time())
+        raw_key = _key_bytes(key)
+        response, ttls = entry.response, entry.ttls
+        size = _RECORD.size + len(raw_key) + len(ttls) * _TTL.size + len(response)
+        if size > SIZE_CLASSES[-1] or len(raw_key) > 0xFFFF or len(ttls) > 0xFF:
+            return entry  # Served this once, never stored
+        key_hash = hash(raw_key)
+        existing = self._find(raw_key, key_hash)[1]
+        if existing is not None:
+            self._free(existing)
+        cls = bisect.bisect_left(SIZE_CLASSES, size)
+        if self.count >= self.max_entries:
+            self._evict(cls)
+        slab = self.slabs[cls]
+        if not slab.free:
+            if self.bytes_used + slab.per_chunk * slab.size <= self.max_bytes:
+                slab.grow()
+                self.bytes_used += slab.per_chunk * slab.size
+            elif slab.live:
+                self._evict(cls)
+            else:
+                return entry  # No room for this size class
+        # Only now: freeing entries moves others around in the index
+        position = self._find(raw_key, key_hash)[0]
+        slot = slab.free.pop()
+
+        base = slot * slab.size
+        data = slab.data
+        _RECORD.pack_into(data, base, len(raw_key), len(response), len(ttls))
+        offset = base + _RECORD.size
+        data[offset:offset + len(raw_key)] = raw_key
+        offset += len(raw_key)
+        for ttl_offset, value in ttls:
+            _TTL.pack_into(data, offset, ttl_offset, value)
+            offset += _TTL.size
+        data[offset:offset + len(response)] = response
+        slab.hash[slot] = key_hash
+        slab.ttl[slot] = entry.ttl
+        slab.hits[slot] = min(entry.hits, 0xFFFFFFFF)
+        slab.stored_at[slot] = entry.stored_at
+        slab.expires_at[slot] = entry.expires_at
+        slab.refresh_at[slot] = entry.refresh_at
+        slab.kind[slot] = dns_cache.KINDS.index(entry.kind) + 1
+        slab.referenced[slot] = 0
+        slab.live += 1
+        self.count += 1
+        slot_id = slot << CLASS_BITS | cls
+        self._index[position] = slot_id + 1
+        self._schedule(slot_id, slab, slot)
+        return _SlotEntry(slab, slot)
+
+    def _remove(self, key):
+        raw_key = _key_bytes(key)
+        _, slot_id = self._find(raw_key, hash(raw_key))
+        if slot_id is not None:
+            self._free(slot_id)
+
+    def _free(self, slot_id):
+        """Removes an entry from the index and returns its slot to the free stack."""
+        slab = self.slabs[slot_id & ((1 << CLASS_BITS) - 1)]
+        slot = slot_id >> CLASS_BITS
+        index, mask = self._index, self._mask
+        position = slab.hash[slot] & mask
+        while index[position] != slot_id + 1:
+            position = (position + 1) & mask
+        # Backward-shift deletion: pull later entries of the probe run into the gap
+        hole = position
+        while True:
+            position = (position + 1) & mask
+            value = index[position]
+            if not value:
+                break
+            other = value - 1
+            home = self.slabs[other & ((1 << CLASS_BITS) - 1)].hash[other >> CLASS_BITS] & mask
+            if (position - home) & mask >= (position - hole) & mask:
+                index[hole] = value
+                hole = position
+        index[hole] = 0
+        slab.kind[slot] = _FREE
+        slab.free.append(slot)
+        slab.live -= 1
+        self.count -= 1
+
+    def _evict(self, cls):
+        """Frees one entry with CLOCK, from size class cls if it has any, else the fullest."""
+        slab = self.slabs[cls]
+        if not slab.live:
+            cls = max(range(len(self.slabs)), key=lambda i: self.slabs[i].live)
+            slab = self.slabs[cls]
+            if not slab.live:
+                return
+        kind, referenced = slab.kind, slab.referenced
+        while True:
+            slot = slab.hand
+            slab.hand = (slot + 1) % slab.slots
+            if kind[slot] == _FREE:
+                continue
+            if referenced[slot]:
+                referenced[slot] = 0
+                continue
+            self._free(slot << CLASS_BITS | cls)
+            self.evictions += 1
+            return
+
+    def _drop_at(self, slab, slot):
+        """When an entry can be freed: its expiry, plus the stale window unless it is a failure."""
+        if slab.kind[slot] == dns_cache.KINDS.index(dns_cache.FAILURE_HIT) + 1:
+            return slab.expires_at[slot]
+        return slab.expires_at[slot] + self.stale_window
+
+    def _schedule(self, slot_id, slab, slot):
+        second = max(int(self._drop_at(slab, slot)) + 1, self._wheel_now + 1)
+        slab.wheel_at[slot] = second
+        self._wheel[second % WHEEL_SECONDS].append(slot_id)
+
+    def _advance_wheel(self, now):
+        """Frees the entries filed under every second up to now (at most one full turn)."""
+        now_second = int(now)
+        first = self._wheel_now + 1
+        for second in range(first, min(now_second, first + WHEEL_SECONDS - 1) + 1):
+            bucket_index = second % WHEEL_SECONDS
+            bucket = self._wheel[bucket_index]
+            if not bucket:
+                continue
+            self._wheel[bucket_index] = array("q")
+            seen = set()
+            for slot_id in bucket:
+                slab = self.slabs[slot_id & ((1 << CLASS_BITS) - 1)]
+                slot = slot_id >> CLASS_BITS
+                filed = slab.wheel_at[slot]
+                # Freed, or refiled elsewhere since: this reference is stale
+                if (slab.kind[slot] == _FREE or filed % WHEEL_SECONDS != bucket_index
+                        or slot_id in seen):
+                    continue
+                seen.add(slot_id)
+                if filed > now_second:
+                    self._wheel[bucket_index].append(slot_id)   # A later turn of the wheel
+                elif now >= self._drop_at(slab, slot):
+                    self._free(slot_id)
+                    self.expirations += 1
+                else:
+                    self._schedule(slot_id, slab, slot)   # stale_window grew since it was filed
+        self._wheel_now = max(self._wheel_now, now_second)
+
+
+def _max_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main():
+    """Fills a cache with synthetic A answers and reports what it costs per entry."""
+    import dns_wire
+
+    parser = argparse.ArgumentParser(description="Measure the compact answer store")
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--mb", type=float, default=1024, help="slab memory limit")
+    parser.add_argument("--plain", action="store_true",
+                        help="measure the OrderedDict DNSCache instead, for comparison")
+    args = parser.parse_args()
+    cls = dns_cache.DNSCache if args.plain else CompactDNSCache
+    cache = cls(max_entries=args.entries, max_bytes=int(args.mb * 2 ** 20))
+    before = _max_rss_bytes()
+    start = time.perf_counter()
+    for i in range(args.entries):
+        name = f"host{i}.example{i % 97}.com"
+        query = dns_wire.build_query(name, dns_wire.TYPE_A, i & 0xFFFF)
+        record = dns_wire.make_record(name, dns_wire.TYPE_A, dns_wire.CLASS_IN, 300,
+                                      struct.pack("!I", i))
+        cache.put(dns_cache.cache_key(name, dns_wire.TYPE_A, dns_wire.CLASS_IN),
+                  dns_wire.build_response(query, dns_wire.RCODE_NOERROR, [record]))
+    filled = time.perf_counter() - start
+    grown = _max_rss_bytes() - before
+    start = time.perf_counter()
+    hits = sum(cache.get(dns_cache.cache_key(f"host{i}.example{i % 97}.com", dns_wire.TYPE_A,
+                                             dns_wire.CLASS_IN), 1) is not None
+               for i in range(0, args.entries, 7))
+    looked_up = time.perf_counter() - start
+    print(f"{cls.__name__}: {len(cache)} entries stored in {filled:.1f}s "
+          f"({args.entries / filled:,.0f}/s), {hits} hits in {looked_up:.1f}s")
+    print(f"Process memory grew {grown / 2 ** 20:.1f} MB: {grown / max(len(cache), 1):.0f} "
+          f"bytes per entry")
+    if isinstance(cache, CompactDNSCache):
+        for line in cache.report():
+            print(line)
+    else:
+        print(f"Estimated {cache.bytes_per_entry():.0f} bytes per entry")
+
+
+if __name__ == "__main__":
+    main()
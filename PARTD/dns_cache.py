@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Bonus F: Answer Cache
+A TTL-aware answer cache keyed on (qname, qtype, qclass) with LRU eviction.
+Responses are stored in wire format and handed back with the client's
+transaction ID and TTLs reduced by the time spent in the cache.
+
+Negative answers (NXDOMAIN and NODATA) are cached as described in RFC 2308:
+for the smaller of the SOA record's TTL and its MINIMUM field, capped by
+max_negative_ttl. Upstream failures (SERVFAIL or a timeout) can be cached for
+a few seconds (RFC 2308 section 7) so clients retrying a broken name do not
+each wait for the upstream again.
+
+Each entry counts its hits. A hit on a popular entry in the last part of its
+TTL asks the caller to refresh it in the background (prefetch), and within
+stale_window seconds after expiry an entry can still be served with a short
+TTL while it is refreshed (RFC 8767 serve-stale). A failed refresh leaves
+the old entry in place.
+
+With several worker processes, `shared` is a shared_cache.SharedAnswerTable:
+entries are written through to it, and a local miss is looked up there
+before it counts as a miss.
+"""
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import dns_wire
+
+# Rough per-entry bookkeeping cost added to the response size when
+# enforcing the byte limit (key tuple, entry object, TTL offsets).
+ENTRY_OVERHEAD = 200
+
+DEFAULT_MAX_NEGATIVE_TTL = 3600
+DEFAULT_FAILURE_TTL = 5
+
+DEFAULT_PREFETCH_MIN_HITS = 3      # Hits before an entry is worth refreshing early (0 = never)
+DEFAULT_PREFETCH_THRESHOLD = 0.1   # Refresh once this share of the TTL is left
+DEFAULT_STALE_WINDOW = 0           # Seconds past expiry an entry may be served (0 = never)
+STALE_TTL = 30                     # TTL handed out with stale answers (RFC 8767 section 4)
+REFRESH_RETRY = 5                  # Seconds before a refresh that went nowhere is retried
+
+# Kinds of cache entries, also used as the cache_status logged for a hit
+HIT = "HIT"
+NEGATIVE_HIT = "NEGATIVE HIT"
+FAILURE_HIT = "SERVFAIL HIT"
+STALE_HIT = "STALE HIT"
+# Kinds that are stored, in the order used by snapshots and shared memory
+KINDS = (HIT, NEGATIVE_HIT, FAILURE_HIT)
+
+
+def cache_key(qname, qtype, qclass):
+    """DNS names are case-insensitive, so the key uses the lower-cased name."""
+    return (qname.lower(), qtype, qclass)
+
+
+def negative_ttl(message):
+    """
+    The RFC 2308 negative-caching TTL of an NXDOMAIN/NODATA response:
+    min(SOA TTL, SOA MINIMUM) of the SOA in the authority section, or None.
+    """
+    for rr in message.authority:
+        if rr.rtype == dns_wire.TYPE_SOA:
+            return min(rr.ttl, dns_wire.soa_minimum(rr))
+    return None
+
+
+class _Entry:
+    __slots__ = ("response", "ttls", "ttl", "stored_at", "expires_at", "kind", "hits",
+                 "refresh_at")
+
+    def __init__(self, response, ttls, ttl, now, kind, hits):
+        self.response = response
+        self.ttls = ttls
+        self.ttl = ttl
+        self.stored_at = now
+        self.expires_at = now + ttl
+        self.kind = kind
+        self.hits = hits
+        self.refresh_at = now  # No refresh is started for this entry before this time
+
+
+class DNSCache:
+    """
+    Thread-safe LRU cache of upstream responses.
+    An entry expires after the smallest TTL found in the response, and the
+    least recently used entries are evicted once either max_entries or
+    max_bytes is exceeded.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, max_ttl=86400,
+                 max_negative_ttl=DEFAULT_MAX_NEGATIVE_TTL, failure_ttl=DEFAULT_FAILURE_TTL,
+                 prefetch_min_hits=DEFAULT_PREFETCH_MIN_HITS,
+                 prefetch_threshold=DEFAULT_PREFETCH_THRESHOLD,
+                 stale_window=DEFAULT_STALE_WINDOW):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self.max_negative_ttl = max_negative_ttl
+        self.failure_ttl = failure_ttl
+        self.prefetch_min_hits = prefetch_min_hits
+        self.prefetch_threshold = prefetch_threshold
+        self.stale_window = stale_window
+        self.bytes_used = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.shared_hits = 0
+        self.shared = None  # Optional second-level table shared between processes
+        self._entries = OrderedDict()  # key -> _Entry
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, txid):
+        """
+        Returns (response rewritten for txid, kind, refresh) or None on a miss.
+        kind is HIT, NEGATIVE_HIT, FAILURE_HIT or STALE_HIT; refresh is True
+        when the caller should look the name up again in the background.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None and self.shared is not None:
+                entry = self._from_shared(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            stale = now >= entry.expires_at
+            if stale and (entry.kind == FAILURE_HIT
+                          or now >= entry.expires_at + self.stale_window):
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._touch(key, entry)
+            entry.hits += 1
+            if stale:
+                kind = STALE_HIT
+                self.stale_hits += 1
+                refresh = True
+            else:
+                kind = entry.kind
+                if kind == HIT:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+                refresh = (kind != FAILURE_HIT and self.prefetch_min_hits > 0
+                           and entry.hits >= self.prefetch_min_hits
+                           and entry.expires_at - now <= entry.ttl * self.prefetch_threshold)
+            if refresh:
+                if now < entry.refresh_at:
+                    refresh = False  # Already being refreshed
+                else:
+                    entry.refresh_at = now + REFRESH_RETRY
+                    self.refreshes += 1
+            response, ttls, stored_at = entry.response, entry.ttls, entry.stored_at
+        if stale:
+            return dns_wire.rewrite_response(
+                response, txid, [(offset, STALE_TTL) for offset, _ in ttls], 0), kind, refresh
+        return dns_wire.rewrite_response(response, txid, ttls, int(now - stored_at)), kind, refresh
+
+    def put(self, key, response):
+        """
+        Stores an upstream response if it is cacheable: a positive answer, an
+        NXDOMAIN/NODATA answer carrying an SOA, or a SERVFAIL.
+        Returns the TTL it was cached with, or 0 if it was not cached.
+        """
+        try:
+            message = dns_wire.Message(response)
+            if message.truncated:
+                return 0
+            rcode = message.rcode
+            if rcode == dns_wire.RCODE_NOERROR and message.ancount:
+                kind = HIT
+                ttls = dns_wire.ttl_offsets(message)
+                ttl = min(min((t for _, t in ttls), default=0), self.max_ttl)
+            elif rcode in (dns_wire.RCODE_NOERROR, dns_wire.RCODE_NXDOMAIN):
+                kind = NEGATIVE_HIT
+                ttl = negative_ttl(message)
+                if ttl is None:
+                    return 0  # No SOA: RFC 2308 says not to cache
+                ttl = min(ttl, self.max_negative_ttl)
+                # Never hand out the SOA with a TTL longer than the negative TTL
+                ttls = [(offset, min(t, ttl)) for offset, t in dns_wire.ttl_offsets(message)]
+            elif rcode == dns_wire.RCODE_SERVFAIL:
+                return self.put_failure(key, response)
+            else:
+                return 0
+        except (IndexError, ValueError, struct.error):
+            return 0
+
+        if ttl <= 0:
+            return 0
+        self._store(key, bytes(response), ttls, ttl, kind)
+        return ttl
+
+    def put_failure(self, key, response):
+        """
+        Caches a SERVFAIL response (e.g. synthesised after a timeout) for
+        failure_ttl, unless a good answer that can still be served is cached.
+        """
+        if self.failure_ttl <= 0:
+            return 0
+        response = bytes(response)
+        with self._lock:
+            # Checked and stored under one lock hold, so a good answer stored
+            # in between by another thread is never replaced by the failure
+            entry = self._lookup(key)
+            if (entry is not None and entry.kind != FAILURE_HIT
+                    and time.time() < entry.expires_at + self.stale_window):
+                return 0  # RFC 8767: keep serving what we have
+            if not self._store_locked(key, response, [], self.failure_ttl, FAILURE_HIT):
+                return 0
+        return self.failure_ttl
+
+    def snapshot(self):
+        """
+        Every cached entry, least recently used first, as tuples of
+        (key, response, ttls, ttl, stored_at, expires_at, kind, hits).
+        """
+        with self._lock:
+            return [(key, e.response, e.ttls, e.ttl, e.stored_at, e.expires_at, e.kind, e.hits)
+                    for key, e in self._entries.items()]
+
+    def restore(self, entries, now=None):
+        """
+        Adds entries in the form returned by snapshot(), skipping those that
+        can no longer be served. Returns the number of entries added.
+        """
+        now = time.time() if now is None else now
+        added = 0
+        with self._lock:
+            for key, response, ttls, ttl, stored_at, expires_at, kind, hits in entries:
+                limit = expires_at if kind == FAILURE_HIT else expires_at + self.stale_window
+                if now >= limit or self._lookup(key) is not None:
+                    continue
+                entry = _Entry(response, ttls, ttl, stored_at, kind, hits)
+                entry.expires_at = expires_at
+                self._insert(key, entry)
+                added += 1
+        return added
+
+    def _from_shared(self, key, now):
+        """Copies a usable entry from the shared table into this cache (lock held)."""
+        record = self.shared.get(key)
+        if record is None:
+            return None
+        response, ttls, ttl, stored_at, expires_at, kind = record
+        if now >= (expires_at if kind == FAILURE_HIT else expires_at + self.stale_window):
+            return None
+        entry = _Entry(response, ttls, ttl, stored_at, kind, 0)
+        entry.expires_at = expires_at
+        entry = self._insert(key, entry)
+        self.shared_hits += 1
+        return entry
+
+    def _store(self, key, response, ttls, ttl, kind):
+        with self._lock:
+            self._store_locked(key, response, ttls, ttl, kind)
+
+    def _store_locked(self, key, response, ttls, ttl, kind):
+        """Stores a response (lock held). Returns False if it is too big to cache."""
+        if len(response) + ENTRY_OVERHEAD > self.max_bytes:
+            return False
+        now = time.time()
+        hits = 0
+        old = self._lookup(key)
+        if old is not None:
+            # Popularity carries over, so a refreshed hot entry stays hot
+            hits = old.hits
+            self._remove(key)
+        entry = _Entry(response, ttls, ttl, now, kind, hits)
+        self._insert(key, entry)
+        if self.shared is not None:
+            # Under the same lock, so the shared table ends with the same winner
+            self.shared.put(key, response, ttls, ttl, now, entry.expires_at, kind)
+        return True
+
+    def footprint(self):
+        """Estimated bytes held by the cache (responses plus ENTRY_OVERHEAD each)."""
+        return self.bytes_used
+
+    def bytes_per_entry(self):
+        return self.footprint() / len(self) if len(self) else 0.0
+
+    # --- Storage: the methods a different entry store overrides (lock held) ---
+
+    def _lookup(self, key):
+        """The entry stored for key, or None."""
+        return self._entries.get(key)
+
+    def _touch(self, key, entry):
+        """Marks key (stored as entry) as just used, for eviction."""
+        self._entries.move_to_end(key)
+
+    def _insert(self, key, entry):
+        """Stores an _Entry, evicting as needed. Returns the stored entry."""
+        self._entries[key] = entry
+        self.bytes_used += len(entry.response) + ENTRY_OVERHEAD
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self.bytes_used > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def _remove(self, key):
+        response = self._entries.pop(key).response
+        self.bytes_used -= len(response) + ENTRY_OVERHEAD
@@ -0,0 +1,560 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - DNS wire-format codec
+One parser and builder shared by the resolver, the cache and the load
+generator. Messages are parsed through a memoryview without copying: a
+Message only unpacks the header up front, and its records are RecordViews
+whose names and RDATA are decoded on first access. Compressed names are
+followed on decode and MessageBuilder compresses names on encode.
+EDNS0 (RFC 6891) payload sizes and TCP framing (RFC 1035 4.2.2) are handled
+here too.
+"""
+import socket
+import struct
+
+HEADER_LEN = 12
+
+TYPE_A = 1
+TYPE_NS = 2
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_PTR = 12
+TYPE_MX = 15
+TYPE_TXT = 16
+TYPE_AAAA = 28
+TYPE_OPT = 41
+TYPE_ANY = 255
+CLASS_IN = 1
+
+TYPE_NAMES = {TYPE_A: "A", TYPE_NS: "NS", TYPE_CNAME: "CNAME", TYPE_SOA: "SOA",
+              TYPE_PTR: "PTR", TYPE_MX: "MX", TYPE_TXT: "TXT", TYPE_AAAA: "AAAA",
+              TYPE_OPT: "OPT", 33: "SRV", 65: "HTTPS", TYPE_ANY: "ANY"}
+
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_NAMES = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN",
+               4: "NOTIMP", 5: "REFUSED"}
+
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+FLAG_RA = 0x0080
+OPCODE_MASK = 0x7800
+
+MAX_UDP_PAYLOAD = 512         # Largest UDP response a client without EDNS0 accepts
+DEFAULT_EDNS_PAYLOAD = 1232   # Advertised upstream; avoids IP fragmentation (DNS flag day 2020)
+
+MAX_POINTER_JUMPS = 64
+MAX_POINTER_OFFSET = 0x3FFF
+
+# Types whose RDATA is a single domain name that may be compressed (RFC 1035)
+_NAME_RDATA_TYPES = (TYPE_NS, TYPE_CNAME, TYPE_PTR)
+
+_HEADER = struct.Struct("!6H")
+_RR_FIXED = struct.Struct("!HHIH")
+_QUESTION_FIXED = struct.Struct("!HH")
+_U16 = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+
+
+# --- Names ---
+
+def skip_name(data, offset):
+    """Returns the offset just past the (possibly compressed) name at offset."""
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            # A compression pointer always ends the name
+            return offset + 2
+        offset += length + 1
+
+
+def read_name(data, offset):
+    """
+    Decodes the (possibly compressed) name at offset.
+    Returns (name, offset just past the name in its original position).
+    """
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > MAX_POINTER_JUMPS:
+                raise ValueError("compression pointer loop")
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        if length & 0xC0:
+            raise ValueError("unsupported label type")
+        offset += 1
+        if length == 0:
+            break
+        if offset + length > len(data):
+            raise ValueError("label runs past end of message")
+        labels.append(bytes(data[offset:offset + length]).decode("utf-8", "replace"))
+        offset += length
+    return ".".join(labels), (end if end is not None else offset)
+
+
+def encode_name(name):
+    """Encodes a dotted name as uncompressed wire-format labels."""
+    out = bytearray()
+    for label in name.rstrip(".").split("."):
+        if label:
+            raw = label.encode("utf-8")
+            if len(raw) > 63:
+                raise ValueError(f"label too long: {label!r}")
+            out.append(len(raw))
+            out += raw
+    out.append(0)
+    return bytes(out)
+
+
+# --- Parsing ---
+
+class RecordView:
+    """
+    A resource record inside a message buffer. The fixed fields are unpacked
+    when the view is created; the owner name and RDATA are decoded lazily.
+    """
+
+    __slots__ = ("buf", "offset", "rtype", "rclass", "ttl", "rdata_offset", "rdlength", "_name")
+
+    def __init__(self, buf, offset):
+        self.buf = buf
+        self.offset = offset
+        fixed = skip_name(buf, offset)
+        self.rtype, self.rclass, self.ttl, self.rdlength = _RR_FIXED.unpack_from(buf, fixed)
+        self.rdata_offset = fixed + 10
+        if self.rdata_offset + self.rdlength > len(buf):
+            raise ValueError("resource record runs past end of message")
+        self._name = None
+
+    @property
+    def end(self):
+        return self.rdata_offset + self.rdlength
+
+    @property
+    def ttl_offset(self):
+        """Offset of the 32-bit TTL field within the message."""
+        return self.rdata_offset - 6
+
+    @property
+    def name(self):
+        if self._name is None:
+            self._name = read_name(self.buf, self.offset)[0]
+        return self._name
+
+    @property
+    def raw_rdata(self):
+        """The RDATA exactly as it appears in the message (may hold pointers)."""
+        return self.buf[self.rdata_offset:self.end]
+
+    @property
+    def target(self):
+        """The domain name carried by an NS, CNAME, PTR or MX record."""
+        if self.rtype == TYPE_MX:
+            return read_name(self.buf, self.rdata_offset + 2)[0]
+        return read_name(self.buf, self.rdata_offset)[0]
+
+    @property
+    def rdata(self):
+        """RDATA with any compressed names expanded, so it can be copied elsewhere."""
+        buf, offset = self.buf, self.rdata_offset
+        if self.rtype in _NAME_RDATA_TYPES:
+            return encode_name(read_name(buf, offset)[0])
+        if self.rtype == TYPE_MX:
+            return bytes(buf[offset:offset + 2]) + encode_name(read_name(buf, offset + 2)[0])
+        if self.rtype == TYPE_SOA:
+            mname, pos = read_name(buf, offset)
+            rname, pos = read_name(buf, pos)
+            return encode_name(mname) + encode_name(rname) + bytes(buf[pos:pos + 20])
+        return bytes(self.raw_rdata)
+
+    def __repr__(self):
+        return (f"RecordView({self.name!r}, {TYPE_NAMES.get(self.rtype, self.rtype)}, "
+                f"ttl={self.ttl}, {rdata_text(self)!r})")
+
+
+def make_record(name, rtype, rclass, ttl, rdata):
+    """Builds a standalone record (uncompressed RDATA) as a RecordView."""
+    return RecordView(encode_name(name) + _RR_FIXED.pack(rtype, rclass, ttl, len(rdata))
+                      + bytes(rdata), 0)
+
+
+class Message:
+    """
+    A parsed DNS message backed by a memoryview of the original bytes.
+    Only the header is unpacked up front; the question and the record
+    sections are parsed on first access.
+    """
+
+    __slots__ = ("buf", "txid", "flags", "qdcount", "ancount", "nscount", "arcount",
+                 "_question", "_question_end", "_sections")
+
+    def __init__(self, data):
+        self.buf = data if isinstance(data, memoryview) else memoryview(data)
+        if len(self.buf) < HEADER_LEN:
+            raise ValueError("message shorter than a DNS header")
+        (self.txid, self.flags, self.qdcount, self.ancount,
+         self.nscount, self.arcount) = _HEADER.unpack_from(self.buf, 0)
+        self._question = None
+        self._question_end = None
+        self._sections = None
+
+    @property
+    def rcode(self):
+        return self.flags & 0x0F
+
+    @property
+    def is_response(self):
+        return bool(self.flags & FLAG_QR)
+
+    @property
+    def truncated(self):
+        return bool(self.flags & FLAG_TC)
+
+    def _parse_questions(self):
+        offset = HEADER_LEN
+        for i in range(self.qdcount):
+            name, offset = read_name(self.buf, offset)
+            qtype, qclass = _QUESTION_FIXED.unpack_from(self.buf, offset)
+            offset += 4
+            if i == 0:
+                self._question = (name, qtype, qclass)
+        self._question_end = offset
+
+    @property
+    def question(self):
+        """(qname, qtype, qclass) of the first question, or None."""
+        if self._question_end is None:
+            self._parse_questions()
+        return self._question
+
+    @property
+    def question_end(self):
+        if self._question_end is None:
+            self._parse_questions()
+        return self._question_end
+
+    def _parse_sections(self):
+        offset = self.question_end
+        sections = []
+        for count in (self.ancount, self.nscount, self.arcount):
+            records = []
+            for _ in range(count):
+                record = RecordView(self.buf, offset)
+                records.append(record)
+                offset = record.end
+            sections.append(records)
+        self._sections = sections
+
+    @property
+    def answers(self):
+        if self._sections is None:
+            self._parse_sections()
+        return self._sections[0]
+
+    @property
+    def authority(self):
+        if self._sections is None:
+            self._parse_sections()
+        return self._sections[1]
+
+    @property
+    def additional(self):
+        if self._sections is None:
+            self._parse_sections()
+        return self._sections[2]
+
+    def records(self):
+        """Every record of the answer, authority and additional sections."""
+        return self.answers + self.authority + self.additional
+
+
+def parse_message(data):
+    """Wraps data in a lazily-parsed Message."""
+    return Message(data)
+
+
+def parse_question(data):
+    """
+    Parses the first question of a DNS message.
+    Returns (qname, qtype, qclass, end_offset) or None if the packet is malformed.
+    """
+    try:
+        if _HEADER.unpack_from(data, 0)[2] == 0:
+            return None
+        qname, offset = read_name(data, HEADER_LEN)
+        qtype, qclass = _QUESTION_FIXED.unpack_from(data, offset)
+        return qname, qtype, qclass, offset + 4
+    except (IndexError, ValueError, struct.error):
+        return None
+
+
+def get_rcode(data):
+    return data[3] & 0x0F
+
+
+def is_truncated(data):
+    return bool(_U16.unpack_from(data, 2)[0] & FLAG_TC)
+
+
+def ttl_offsets(data):
+    """
+    Returns a list of (offset, ttl) pairs, one per record whose TTL field can
+    be aged. OPT pseudo-records are skipped because their TTL field holds EDNS flags.
+    """
+    message = data if isinstance(data, Message) else Message(data)
+    return [(rr.ttl_offset, rr.ttl) for rr in message.records() if rr.rtype != TYPE_OPT]
+
+
+def rewrite_response(data, txid, ttls, age):
+    """
+    Returns a copy of a cached response with the transaction ID set to txid
+    and every TTL in ttls (from ttl_offsets) reduced by age seconds. The
+    TTLs are written even at age 0, since the cache may have lowered them
+    (negative answers are capped at the SOA minimum) below those in data.
+    """
+    out = bytearray(data)
+    _U16.pack_into(out, 0, txid)
+    for offset, ttl in ttls:
+        _U32.pack_into(out, offset, ttl - age if ttl > age else 0)
+    return bytes(out)
+
+
+# --- Record helpers ---
+
+def rdata_name(rr):
+    """The target name of an NS, CNAME, PTR or MX record."""
+    return rr.target
+
+
+def rdata_text(rr):
+    """A short human-readable form of a record's RDATA."""
+    if rr.rtype == TYPE_A and rr.rdlength == 4:
+        return socket.inet_ntop(socket.AF_INET, rr.raw_rdata)
+    if rr.rtype == TYPE_AAAA and rr.rdlength == 16:
+        return socket.inet_ntop(socket.AF_INET6, rr.raw_rdata)
+    if rr.rtype in _NAME_RDATA_TYPES or rr.rtype == TYPE_MX:
+        return rr.target
+    return bytes(rr.raw_rdata).hex()
+
+
+def soa_minimum(rr):
+    """The MINIMUM field of an SOA record (the negative-caching TTL)."""
+    return _U32.unpack_from(rr.buf, rr.end - 4)[0]
+
+
+# --- Building ---
+
+class MessageBuilder:
+    """
+    Builds a DNS message section by section, compressing every owner name
+    and every name inside NS/CNAME/PTR/MX/SOA RDATA against names already
+    written.
+    """
+
+    def __init__(self, txid, flags):
+        self.txid = txid
+        self.flags = flags
+        self.buf = bytearray(HEADER_LEN)
+        self.counts = [0, 0, 0, 0]
+        self._names = {}  # lower-cased name suffix -> offset
+        self._section = 0
+
+    def write_name(self, name):
+        labels = [label for label in name.rstrip(".").split(".") if label]
+        for i in range(len(labels)):
+            suffix = ".".join(labels[i:]).lower()
+            pointer = self._names.get(suffix)
+            if pointer is not None:
+                self.buf += _U16.pack(0xC000 | pointer)
+                return
+            if len(self.buf) <= MAX_POINTER_OFFSET:
+                self._names[suffix] = len(self.buf)
+            raw = labels[i].encode("utf-8")
+            if len(raw) > 63:
+                raise ValueError(f"label too long: {labels[i]!r}")
+            self.buf.append(len(raw))
+            self.buf += raw
+        self.buf.append(0)
+
+    def _enter(self, section):
+        if section < self._section:
+            raise ValueError("sections must be written in order")
+        self._section = section
+
+    def add_question(self, qname, qtype, qclass=CLASS_IN):
+        self._enter(0)
+        self.write_name(qname)
+        self.buf += _QUESTION_FIXED.pack(qtype, qclass)
+        self.counts[0] += 1
+
+    def add_record(self, section, rr, ttl=None):
+        """Appends rr (a RecordView) to section 1 (answer), 2 (authority) or 3 (additional)."""
+        self._enter(section)
+        self.write_name(rr.name)
+        self.buf += _RR_FIXED.pack(rr.rtype, rr.rclass, rr.ttl if ttl is None else ttl, 0)
+        rdlength_at = len(self.buf) - 2
+        rtype, src, offset = rr.rtype, rr.buf, rr.rdata_offset
+        if rtype in _NAME_RDATA_TYPES:
+            self.write_name(read_name(src, offset)[0])
+        elif rtype == TYPE_MX:
+            self.buf += src[offset:offset + 2]
+            self.write_name(read_name(src, offset + 2)[0])
+        elif rtype == TYPE_SOA:
+            mname, pos = read_name(src, offset)
+            rname, pos = read_name(src, pos)
+            self.write_name(mname)
+            self.write_name(rname)
+            self.buf += src[pos:pos + 20]
+        else:
+            self.buf += rr.raw_rdata
+        _U16.pack_into(self.buf, rdlength_at, len(self.buf) - rdlength_at - 2)
+        self.counts[section] += 1
+
+    def to_bytes(self):
+        _HEADER.pack_into(self.buf, 0, self.txid, self.flags, *self.counts)
+        return bytes(self.buf)
+
+
+def build_query(qname, qtype, txid, qclass=CLASS_IN, recursion_desired=True,
+                edns_size=None):
+    """Builds a single-question query message, with an OPT record if edns_size is set."""
+    flags = FLAG_RD if recursion_desired else 0
+    query = (_HEADER.pack(txid, flags, 1, 0, 0, 1 if edns_size else 0)
+             + encode_name(qname) + _QUESTION_FIXED.pack(qtype, qclass))
+    if edns_size:
+        query += bytes(make_opt(edns_size).buf)
+    return query
+
+
+def build_response(query, rcode, answers=(), authority=(), additional=()):
+    """
+    Builds a compressed response to a client query from lists of records.
+    The question, opcode and RD bit are copied from the query.
+    """
+    message = query if isinstance(query, Message) else Message(query)
+    flags = FLAG_QR | FLAG_RA | (message.flags & (FLAG_RD | OPCODE_MASK)) | (rcode & 0x0F)
+    builder = MessageBuilder(message.txid, flags)
+    question = message.question
+    if question is not None:
+        builder.add_question(*question)
+    for section, records in ((1, answers), (2, authority), (3, additional)):
+        for rr in records:
+            builder.add_record(section, rr)
+    return builder.to_bytes()
+
+
+# --- EDNS0 (RFC 6891) ---
+
+def make_opt(payload_size=DEFAULT_EDNS_PAYLOAD):
+    """An OPT pseudo-record advertising payload_size, with no flags or options."""
+    return RecordView(b"\x00" + _RR_FIXED.pack(TYPE_OPT, payload_size, 0, 0), 0)
+
+
+def edns_payload(data):
+    """
+    The UDP payload size advertised in a message's OPT record, or None if it
+    has no OPT record (the sender does not support EDNS0).
+    """
+    try:
+        message = data if isinstance(data, Message) else Message(data)
+        if not message.arcount:
+            return None
+        for rr in message.additional:
+            if rr.rtype == TYPE_OPT:
+                # Values below 512 are treated as 512 (RFC 6891 6.2.5)
+                return max(rr.rclass, MAX_UDP_PAYLOAD)
+    except (IndexError, ValueError, struct.error):
+        pass
+    return None
+
+
+def add_edns(query, payload_size=DEFAULT_EDNS_PAYLOAD):
+    """Returns query with an OPT record appended, unless it already has one."""
+    if edns_payload(query) is not None:
+        return bytes(query)
+    out = bytearray(query)
+    _U16.pack_into(out, 10, _U16.unpack_from(out, 10)[0] + 1)
+    return bytes(out + bytes(make_opt(payload_size).buf))
+
+
+def fit_response(response, payload_size, limit=None):
+    """
+    Prepares a response for a client that advertised payload_size (None
+    without EDNS0). The OPT record is dropped for clients without EDNS0, and
+    a response longer than limit (by default the client's UDP payload size)
+    is cut down to its header and question with TC set, telling the client
+    to retry over TCP.
+    """
+    limit = limit or payload_size or MAX_UDP_PAYLOAD
+    message = Message(response)
+    strip_opt = payload_size is None and message.arcount and any(
+        rr.rtype == TYPE_OPT for rr in message.additional)
+    if len(response) <= limit and not strip_opt:
+        return response
+
+    builder = MessageBuilder(message.txid, message.flags)
+    if message.question is not None:
+        builder.add_question(*message.question)
+    for section, records in ((1, message.answers), (2, message.authority),
+                             (3, message.additional)):
+        for rr in records:
+            if rr.rtype == TYPE_OPT and strip_opt:
+                continue
+            builder.add_record(section, rr)
+    out = builder.to_bytes()
+    if len(out) <= limit:
+        return out
+
+    builder = MessageBuilder(message.txid, message.flags | FLAG_TC)
+    if message.question is not None:
+        builder.add_question(*message.question)
+    if payload_size is not None:
+        builder.add_record(3, make_opt(payload_size))
+    return builder.to_bytes()
+
+
+# --- TCP framing (RFC 1035 4.2.2) ---
+
+def tcp_frame(message):
+    """Prefixes a message with its two-byte length for sending over TCP."""
+    return _U16.pack(len(message)) + bytes(message)
+
+
+def _recv_exact(sock, size, started=False):
+    data = bytearray()
+    while len(data) < size:
+        try:
+            chunk = sock.recv(size - len(data))
+        except socket.timeout:
+            if data or started:
+                # The rest of the frame may still arrive and would be read as a new one
+                raise ConnectionError("timed out in the middle of a TCP message")
+            raise
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def recv_tcp_message(sock):
+    """
+    Reads one length-prefixed message from a TCP socket; None once it is
+    closed. A timeout before the message starts raises socket.timeout and
+    the connection can still be used; a timeout part way through raises
+    ConnectionError, since the stream is no longer at a message boundary.
+    """
+    header = _recv_exact(sock, 2)
+    if header is None:
+        return None
+    return _recv_exact(sock, _U16.unpack(header)[0], started=True)
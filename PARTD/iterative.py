@@ -0,0 +1,309 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Bonus E: Iterative Resolution
+Resolves names starting from the root servers and following NS referrals,
+using glue records where present, resolving glue-less name server names, and
+following CNAME chains. Every server contacted is recorded as a Hop with its
+own RTT. Delegations (NS names and addresses per zone cut) are cached so later
+lookups under the same TLD or zone skip the root and TLD hops.
+Queries advertise an EDNS0 buffer, and truncated replies are retried over TCP.
+"""
+import socket
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import dns_wire
+
+# IPv4 addresses of the 13 root name servers (IANA root hints)
+ROOT_HINTS = (
+    ("a.root-servers.net", "198.41.0.4"),
+    ("b.root-servers.net", "170.247.170.2"),
+    ("c.root-servers.net", "192.33.4.12"),
+    ("d.root-servers.net", "199.7.91.13"),
+    ("e.root-servers.net", "192.203.230.10"),
+    ("f.root-servers.net", "192.5.5.241"),
+    ("g.root-servers.net", "192.112.36.4"),
+    ("h.root-servers.net", "198.97.190.53"),
+    ("i.root-servers.net", "192.36.148.17"),
+    ("j.root-servers.net", "192.58.128.30"),
+    ("k.root-servers.net", "193.0.14.129"),
+    ("l.root-servers.net", "199.7.83.42"),
+    ("m.root-servers.net", "202.12.27.33"),
+)
+
+DNS_PORT = 53
+DEFAULT_HOP_TIMEOUT = 1.0     # seconds to wait for one server before trying the next
+MAX_HOPS = 40                 # servers contacted for one client query, all lookups included
+MAX_CNAME_CHAIN = 8
+MAX_NS_LOOKUP_DEPTH = 3       # nesting of glue-less name server lookups
+MAX_DELEGATION_TTL = 86400
+
+Hop = namedtuple("Hop", "server_ip zone step response rtt_ms finished_at")
+Resolution = namedtuple("Resolution", "rcode answers authority hops")
+
+
+def normalize(name):
+    return name.rstrip(".").lower()
+
+
+def is_subdomain(name, zone):
+    """True if name is zone or lies below it (the root zone is '')."""
+    return zone == "" or name == zone or name.endswith("." + zone)
+
+
+def zone_step(zone):
+    """Names the level of the hierarchy a zone cut belongs to."""
+    if zone == "":
+        return "Root (.)"
+    if "." not in zone:
+        return f"TLD ({zone}.)"
+    return f"Authoritative ({zone}.)"
+
+
+class Delegation:
+    """NS names and known addresses for one zone cut."""
+
+    __slots__ = ("zone", "ns_names", "addresses", "expires_at")
+
+    def __init__(self, zone, ns_names, addresses, expires_at):
+        self.zone = zone
+        self.ns_names = ns_names
+        self.addresses = addresses      # ns name -> list of IPv4 addresses
+        self.expires_at = expires_at
+
+    def server_ips(self):
+        return [ip for name in self.ns_names for ip in self.addresses.get(name, ())]
+
+
+class DelegationCache:
+    """
+    LRU cache of zone cuts learned from referrals.
+    The root zone is always present, built from ROOT_HINTS.
+    """
+
+    def __init__(self, max_zones=10000):
+        self.max_zones = max_zones
+        self._zones = OrderedDict()
+        self._lock = threading.Lock()
+        self.root = Delegation("", [name for name, _ in ROOT_HINTS],
+                               {name: [ip] for name, ip in ROOT_HINTS}, float("inf"))
+
+    def __len__(self):
+        return len(self._zones)
+
+    def closest(self, qname):
+        """Returns the deepest cached, unexpired delegation enclosing qname."""
+        now = time.time()
+        labels = qname.split(".") if qname else []
+        with self._lock:
+            for i in range(len(labels)):
+                zone = ".".join(labels[i:])
+                delegation = self._zones.get(zone)
+                if delegation is None:
+                    continue
+                if delegation.expires_at <= now:
+                    del self._zones[zone]
+                    continue
+                self._zones.move_to_end(zone)
+                return delegation
+        return self.root
+
+    def put(self, zone, ns_names, addresses, ttl):
+        delegation = Delegation(zone, ns_names, addresses,
+                                time.time() + min(ttl, MAX_DELEGATION_TTL))
+        with self._lock:
+            self._zones[zone] = delegation
+            self._zones.move_to_end(zone)
+            while len(self._zones) > self.max_zones:
+                self._zones.popitem(last=False)
+        return delegation
+
+    def snapshot(self):
+        """Every cached zone cut as (zone, ns_names, addresses, expires_at)."""
+        with self._lock:
+            return [(d.zone, list(d.ns_names), dict(d.addresses), d.expires_at)
+                    for d in self._zones.values()]
+
+    def restore(self, zone, ns_names, addresses, expires_at):
+        """Adds a zone cut saved by snapshot() unless a newer one is cached."""
+        with self._lock:
+            if zone in self._zones:
+                return
+            self._zones[zone] = Delegation(zone, ns_names, addresses, expires_at)
+            while len(self._zones) > self.max_zones:
+                self._zones.popitem(last=False)
+
+    def add_addresses(self, delegation, ns_name, ips):
+        """Records addresses found for a glue-less name server."""
+        with self._lock:
+            delegation.addresses[ns_name] = ips
+
+
+class _Lookup:
+    """Per-client-query state shared by nested lookups."""
+
+    def __init__(self):
+        self.hops = []
+
+
+class IterativeResolver:
+    """Resolves names from the root using the shared upstream socket pool."""
+
+    def __init__(self, pool, delegations=None, hop_timeout=DEFAULT_HOP_TIMEOUT, tcp=None):
+        self.pool = pool
+        self.tcp = tcp  # upstream.UpstreamTCPPool for truncated replies, or None
+        self.delegations = delegations if delegations is not None else DelegationCache()
+        self.hop_timeout = hop_timeout
+
+    def resolve(self, qname, qtype, qclass=dns_wire.CLASS_IN):
+        """Returns a Resolution with the final rcode, records and every Hop taken."""
+        lookup = _Lookup()
+        rcode, answers, authority = self._resolve(lookup, normalize(qname), qtype, qclass, 0)
+        return Resolution(rcode, answers, authority, lookup.hops)
+
+    def _resolve(self, lookup, qname, qtype, qclass, depth):
+        answers = []
+        for _ in range(MAX_CNAME_CHAIN + 1):
+            rcode, records, authority, cname = self._resolve_name(lookup, qname, qtype,
+                                                                  qclass, depth)
+            answers += records
+            if cname is None:
+                return rcode, answers, authority
+            qname = cname
+        return dns_wire.RCODE_SERVFAIL, answers, []
+
+    def _resolve_name(self, lookup, qname, qtype, qclass, depth):
+        """
+        Walks the delegation tree for one name.
+        Returns (rcode, answer records, authority records, CNAME target or None).
+        """
+        delegation = self.delegations.closest(qname)
+        while len(lookup.hops) < MAX_HOPS:
+            servers = self._server_ips(lookup, delegation, depth)
+            message = None
+            for ip in servers:
+                message = self._ask(lookup, ip, delegation.zone, qname, qtype, qclass, depth)
+                if message is not None:
+                    break
+                if len(lookup.hops) >= MAX_HOPS:
+                    break
+            if message is None:
+                return dns_wire.RCODE_SERVFAIL, [], [], None
+
+            if message.rcode == dns_wire.RCODE_NXDOMAIN:
+                return message.rcode, [], message.authority, None
+
+            if message.answers:
+                records, cname = self._follow_answers(message.answers, qname, qtype)
+                if records or cname:
+                    return dns_wire.RCODE_NOERROR, records, [], cname
+
+            referral = self._referral(message, qname, delegation.zone)
+            if referral is None:
+                # NOERROR with no usable answer and no deeper delegation: NODATA
+                return dns_wire.RCODE_NOERROR, [], message.authority, None
+            delegation = referral
+        return dns_wire.RCODE_SERVFAIL, [], [], None
+
+    def _ask(self, lookup, ip, zone, qname, qtype, qclass, depth):
+        """Sends one non-recursive query and records it as a Hop."""
+        query = dns_wire.build_query(qname, qtype, 0, qclass, recursion_desired=False,
+                                     edns_size=dns_wire.DEFAULT_EDNS_PAYLOAD)
+        step = zone_step(zone)
+        if depth:
+            step = f"NS Lookup {step}"
+        start = time.time()
+        try:
+            data = self.pool.query(query, (ip, DNS_PORT), timeout=self.hop_timeout)
+            if self.tcp is not None and dns_wire.is_truncated(data):
+                data = self.tcp.query(query, (ip, DNS_PORT), timeout=self.hop_timeout)
+                step = f"{step} (Truncated; Retried over TCP)"
+            message = dns_wire.parse_message(data)
+        except socket.timeout:
+            message, response = None, "Timed Out"
+        except (ValueError, IndexError, OSError) as e:
+            message, response = None, f"Error: {e}"
+        else:
+            if message.rcode not in (dns_wire.RCODE_NOERROR, dns_wire.RCODE_NXDOMAIN):
+                response = dns_wire.RCODE_NAMES.get(message.rcode, str(message.rcode))
+                message = None
+            elif message.answers:
+                response = "Answer"
+            elif message.rcode == dns_wire.RCODE_NXDOMAIN:
+                response = "NXDOMAIN"
+            elif any(rr.rtype == dns_wire.TYPE_NS for rr in message.authority):
+                response = "Referral"
+            else:
+                response = "NODATA"
+        end = time.time()
+        lookup.hops.append(Hop(ip, zone, step, response, (end - start) * 1000, end))
+        return message
+
+    def _follow_answers(self, records, qname, qtype):
+        """
+        Follows a CNAME chain inside one answer section.
+        Returns (records to add to the answer, CNAME target still to resolve or None).
+        """
+        chain = []
+        name = qname
+        for _ in range(MAX_CNAME_CHAIN + 1):
+            matches = [rr for rr in records if normalize(rr.name) == name
+                       and (rr.rtype == qtype or qtype == 255)]
+            if matches:
+                return chain + matches, None
+            cnames = [rr for rr in records if normalize(rr.name) == name
+                      and rr.rtype == dns_wire.TYPE_CNAME]
+            if not cnames:
+                break
+            chain.append(cnames[0])
+            name = normalize(dns_wire.rdata_name(cnames[0]))
+        if chain:
+            return chain, name
+        return [], None
+
+    def _referral(self, message, qname, current_zone):
+        """Builds and caches the delegation from a referral response, if any."""
+        ns_records = [rr for rr in message.authority if rr.rtype == dns_wire.TYPE_NS]
+        if not ns_records:
+            return None
+        zone = normalize(ns_records[0].name)
+        # Only accept a referral that moves us closer to qname
+        if not is_subdomain(qname, zone) or zone == current_zone \
+                or not is_subdomain(zone, current_zone):
+            return None
+
+        ns_names = []
+        for rr in ns_records:
+            if normalize(rr.name) == zone:
+                name = normalize(dns_wire.rdata_name(rr))
+                if name not in ns_names:
+                    ns_names.append(name)
+        addresses = {}
+        for rr in message.additional:
+            name = normalize(rr.name)
+            # Glue is only trusted inside the sending server's own zone (its bailiwick);
+            # other NS names are looked up on their own by _server_ips
+            if (rr.rtype == dns_wire.TYPE_A and name in ns_names
+                    and is_subdomain(name, current_zone)):
+                addresses.setdefault(name, []).append(dns_wire.rdata_text(rr))
+        ttl = min(rr.ttl for rr in ns_records)
+        return self.delegations.put(zone, ns_names, addresses, ttl)
+
+    def _server_ips(self, lookup, delegation, depth):
+        """Addresses for a delegation, resolving one glue-less NS name if needed."""
+        ips = delegation.server_ips()
+        if ips or depth >= MAX_NS_LOOKUP_DEPTH:
+            return ips
+        for ns_name in delegation.ns_names:
+            if is_subdomain(ns_name, delegation.zone):
+                continue  # In-bailiwick name without glue cannot be resolved
+            rcode, records, _ = self._resolve(lookup, ns_name, dns_wire.TYPE_A,
+                                              dns_wire.CLASS_IN, depth + 1)
+            found = [dns_wire.rdata_text(rr) for rr in records if rr.rtype == dns_wire.TYPE_A]
+            if found:
+                self.delegations.add_addresses(delegation, ns_name, found)
+                return found
+            if len(lookup.hops) >= MAX_HOPS:
+                break
+        return []
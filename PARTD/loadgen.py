@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+"""
+CS331 DNS Benchmark - Native load generator
+Builds DNS queries itself and sends them over UDP with asyncio, either
+closed-loop (a fixed number of queries outstanding at once) or open-loop
+(queries sent on a schedule, e.g. a target QPS, whether or not earlier
+ones have been answered). Latency is measured per query with perf_counter_ns.
+"""
+import asyncio
+import csv
+import random
+import struct
+import time
+from collections import Counter, namedtuple
+
+import dns_wire
+
+DEFAULT_TIMEOUT = 2.0
+MAX_OUTSTANDING = 60000   # Transaction IDs are 16 bits; keep well below 65536 in flight
+
+# rcode is None when the query timed out; truncated is set for TC=1 answers,
+# which a rate-limiting server sends instead of dropping some responses
+QueryResult = namedtuple("QueryResult", "qname qtype sent_at latency_ns rcode answers truncated",
+                         defaults=(False,))
+# Columns of BenchmarkResults.write_csv, read by plot_logs.py --analyze
+RESULT_COLUMNS = ("qname", "qtype", "sent_at_s", "latency_ms", "rcode", "answers", "truncated")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class BenchmarkResults:
+    """Per-query results of one run plus the summary statistics derived from them."""
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def total(self):
+        return len(self.results)
+
+    @property
+    def timeouts(self):
+        return sum(1 for r in self.results if r.rcode is None)
+
+    @property
+    def truncated(self):
+        return sum(1 for r in self.results if r.truncated)
+
+    @property
+    def successful(self):
+        """Queries answered with NOERROR and at least one answer record."""
+        return sum(1 for r in self.results if r.rcode == dns_wire.RCODE_NOERROR and r.answers)
+
+    def rcodes(self):
+        return Counter(dns_wire.RCODE_NAMES.get(r.rcode, str(r.rcode))
+                       for r in self.results if r.rcode is not None)
+
+    def latencies_ms(self):
+        """Sorted latencies of every query that got a response."""
+        return sorted(r.latency_ns / 1e6 for r in self.results if r.rcode is not None)
+
+    def achieved_qps(self):
+        return self.total / self.elapsed if self.elapsed > 0 else 0
+
+    def windows(self, width):
+        """
+        Groups queries by send time into windows of width seconds.
+        Returns a list of dicts with per-window counts, QPS and latency percentiles.
+        """
+        buckets = {}
+        for r in self.results:
+            buckets.setdefault(int(r.sent_at // width), []).append(r)
+        rows = []
+        for index in sorted(buckets):
+            results = buckets[index]
+            latencies = sorted(r.latency_ns / 1e6 for r in results if r.rcode is not None)
+            rows.append({
+                "start_s": index * width,
+                "queries": len(results),
+                "qps": len(results) / width,
+                "timeouts": len(results) - len(latencies),
+                "p50_ms": percentile(latencies, 50),
+                "p99_ms": percentile(latencies, 99),
+                "max_ms": latencies[-1] if latencies else 0,
+            })
+        return rows
+
+    def write_csv(self, path):
+        """Saves one row per query (latency and rcode empty on timeout)."""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(RESULT_COLUMNS)
+            for r in self.results:
+                answered = r.rcode is not None
+                writer.writerow((r.qname, r.qtype, f"{r.sent_at:.6f}",
+                                 f"{r.latency_ns / 1e6:.4f}" if answered else "",
+                                 dns_wire.RCODE_NAMES.get(r.rcode, r.rcode) if answered else "",
+                                 r.answers, int(r.truncated)))
+
+    def summary(self):
+        latencies = self.latencies_ms()
+        return {
+            "queries": self.total,
+            "successful": self.successful,
+            "failed": self.total - self.successful,
+            "timeouts": self.timeouts,
+            "truncated": self.truncated,
+            "rcodes": dict(self.rcodes()),
+            "elapsed_s": self.elapsed,
+            "achieved_qps": self.achieved_qps(),
+            "latency_ms": {
+                "mean": sum(latencies) / len(latencies) if latencies else 0,
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1] if latencies else 0,
+            },
+        }
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    """Matches responses to outstanding queries by transaction ID and question."""
+
+    def __init__(self):
+        self.pending = {}  # txid -> (future, qname, qtype)
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        recv_ns = time.perf_counter_ns()
+        if len(data) < dns_wire.HEADER_LEN:
+            return
+        entry = self.pending.get(struct.unpack_from("!H", data)[0])
+        if entry is None:
+            return
+        future, qname, qtype = entry
+        question = dns_wire.parse_question(data)
+        if question is None or question[0].lower() != qname or question[1] != qtype:
+            return
+        if not future.done():
+            future.set_result((data, recv_ns))
+
+    def error_received(self, exc):
+        # ICMP port unreachable etc.; the affected queries simply time out
+        pass
+
+
+class LoadGenerator:
+    """Sends DNS queries to one server and collects a QueryResult for each."""
+
+    def __init__(self, server, port=53, timeout=DEFAULT_TIMEOUT, source=None):
+        self.server = server
+        self.port = port
+        self.timeout = timeout
+        self.source = source  # Local address to send from, e.g. to look like another client
+        self._rng = random.Random()
+
+    async def _one_query(self, protocol, qname, qtype, start_ns):
+        txid = self._rng.randrange(0x10000)
+        while txid in protocol.pending:
+            txid = self._rng.randrange(0x10000)
+        future = asyncio.get_running_loop().create_future()
+        protocol.pending[txid] = (future, qname.lower(), qtype)
+        query = dns_wire.build_query(qname, qtype, txid)
+        sent_ns = time.perf_counter_ns()
+        try:
+            protocol.transport.sendto(query)
+            data, recv_ns = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            return QueryResult(qname, qtype, (sent_ns - start_ns) / 1e9, None, None, 0)
+        finally:
+            protocol.pending.pop(txid, None)
+        response = dns_wire.Message(data)
+        return QueryResult(qname, qtype, (sent_ns - start_ns) / 1e9, recv_ns - sent_ns,
+                           response.rcode, response.ancount, response.truncated)
+
+    async def _endpoint(self):
+        loop = asyncio.get_running_loop()
+        return await loop.create_datagram_endpoint(
+            _ClientProtocol, remote_addr=(self.server, self.port),
+            local_addr=(self.source, 0) if self.source else None)
+
+    async def closed_loop(self, queries, concurrency):
+        """
+        Keeps `concurrency` queries outstanding until `queries`, an iterable of
+        (qname, qtype), is exhausted.
+        """
+        transport, protocol = await self._endpoint()
+        source = iter(queries)
+        results = []
+        start_ns = time.perf_counter_ns()
+
+        async def worker():
+            for qname, qtype in source:
+                results.append(await self._one_query(protocol, qname, qtype, start_ns))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+        finally:
+            transport.close()
+        return BenchmarkResults(results, (time.perf_counter_ns() - start_ns) / 1e9)
+
+    async def open_loop(self, schedule):
+        """
+        Sends each query of `schedule`, an iterable of (offset_s, qname, qtype),
+        at its offset from the start of the run without waiting for earlier
+        answers. Queries that fall behind schedule are sent immediately.
+        """
+        transport, protocol = await self._endpoint()
+        tasks = []
+        start_ns = time.perf_counter_ns()
+        try:
+            for offset, qname, qtype in schedule:
+                delay = offset - (time.perf_counter_ns() - start_ns) / 1e9
+                # Always yield to the event loop so responses are read while sending
+                await asyncio.sleep(max(delay, 0))
+                while len(protocol.pending) >= MAX_OUTSTANDING:
+                    await asyncio.sleep(0.001)
+                tasks.append(asyncio.ensure_future(
+                    self._one_query(protocol, qname, qtype, start_ns)))
+            results = list(await asyncio.gather(*tasks))
+        finally:
+            transport.close()
+        return BenchmarkResults(results, (time.perf_counter_ns() - start_ns) / 1e9)
+
+
+def replay_schedule(queries, speed=1.0):
+    """
+    Turns captured queries (objects with timestamp, qname, qtype, in capture
+    order) into an open-loop schedule that keeps the original inter-arrival
+    gaps divided by speed. speed=0 sends them back-to-back as fast as possible.
+    """
+    first = None
+    for query in queries:
+        if first is None:
+            first = query.timestamp
+        offset = (query.timestamp - first) / speed if speed > 0 else 0
+        yield max(offset, 0), query.qname.rstrip("."), query.qtype
+
+
+def fixed_rate(queries, qps):
+    """Turns (qname, qtype) pairs into an open-loop schedule at a constant rate."""
+    for i, (qname, qtype) in enumerate(queries):
+        yield i / qps, qname, qtype
+
+
+def run_closed_loop(server, queries, concurrency, port=53, timeout=DEFAULT_TIMEOUT, source=None):
+    generator = LoadGenerator(server, port, timeout, source)
+    return asyncio.run(generator.closed_loop(queries, concurrency))
+
+
+def run_open_loop(server, schedule, port=53, timeout=DEFAULT_TIMEOUT, source=None):
+    return asyncio.run(LoadGenerator(server, port, timeout, source).open_loop(schedule))
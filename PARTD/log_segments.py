@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Binary query log
+An alternative to dns_log.csv (--log-format binary) that stores every field
+with its own type, so nothing needs quoting and the query type has its own
+column. Each logger flush appends one block of records to the current
+segment file; segments are rotated by size and every worker process writes
+its own.
+
+Inside a block the records are stored column by column: numbers as packed
+arrays, strings as 32-bit codes into a dictionary that grows with the
+segment (a block carries only the strings that are new in it). A reader maps
+each segment into memory, skips blocks outside the requested time range or
+that cannot contain a wanted value, and decodes only the columns it needs.
+
+Segment layout (little-endian):
+    header      magic "DNSLOG01", created_at f64, pid u32
+    block       magic "BLK1", rows u32, dictionary bytes u32, column bytes u32,
+                first timestamp f64, last timestamp f64,
+                per string column: new string count u32, (u16 length, UTF-8) * count,
+                per column in COLUMNS order: rows values of its type
+"""
+import array
+import datetime
+import glob
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"DNSLOG01"
+BLOCK_MAGIC = b"BLK1"
+SUFFIX = ".seg"
+DEFAULT_DIR = "dns_log.d"
+DEFAULT_PREFIX = "dns_log"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Column name -> array typecode; "S" columns are strings stored as dictionary codes
+COLUMNS = (("timestamp", "d"), ("domain", "S"), ("qtype", "H"), ("mode", "S"),
+           ("server_ip", "S"), ("step", "S"), ("response", "S"), ("rtt_ms", "f"),
+           ("total_time_ms", "f"), ("cache_status", "S"), ("servers_visited", "H"))
+COLUMN_TYPES = dict(COLUMNS)
+STRING_COLUMNS = tuple(name for name, kind in COLUMNS if kind == "S")
+CODE = "I"   # Typecode of dictionary codes
+
+_HEADER = struct.Struct("<8sdI")
+_BLOCK = struct.Struct("<4sIIIdd")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_SWAP = sys.byteorder != "little"   # array() works in native byte order
+
+
+def _typecode(kind):
+    return CODE if kind == "S" else kind
+
+
+_ITEMSIZE = {name: array.array(_typecode(kind)).itemsize for name, kind in COLUMNS}
+
+
+def _epoch(timestamp):
+    """Log timestamps are ISO strings on the request path; stored as epoch seconds."""
+    if isinstance(timestamp, str):
+        return datetime.datetime.fromisoformat(timestamp).timestamp()
+    return float(timestamp)
+
+
+def clear(directory=DEFAULT_DIR, prefix=DEFAULT_PREFIX):
+    """Creates the log directory, or removes the segments already in it."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, f"{prefix}-*{SUFFIX}")):
+        os.remove(path)
+
+
+class SegmentWriter:
+    """Appends blocks of query records to size-rotated segment files."""
+
+    def __init__(self, directory=DEFAULT_DIR, prefix=DEFAULT_PREFIX,
+                 segment_bytes=DEFAULT_SEGMENT_BYTES, keep=0):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.keep = keep    # Segments kept per process, oldest removed first (0 = all)
+        self.path = None
+        self._fd = None
+        self._size = 0
+        self._strings = {}  # String column -> {string: code} for the current segment
+
+    def write(self, records):
+        """Appends records (query_log.QueryRecord) as one block. Returns its size."""
+        if not records:
+            return 0
+        if self._fd is None or self._size >= self.segment_bytes:
+            self._rotate()
+        block = memoryview(self._encode(records))
+        size = len(block)
+        while block:
+            block = block[os.write(self._fd, block):]
+        self._size += size
+        return size
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _rotate(self):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        pid = os.getpid()
+        # Named by creation time first, so sorting the names sorts the segments by age
+        self.path = os.path.join(self.directory, f"{self.prefix}-{time.time_ns() // 1000:016d}"
+                                                 f"-{pid}{SUFFIX}")
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        header = _HEADER.pack(MAGIC, time.time(), pid)
+        os.write(self._fd, header)
+        self._size = len(header)
+        self._strings = {name: {} for name in STRING_COLUMNS}
+        if self.keep:
+            own = sorted(glob.glob(os.path.join(self.directory,
+                                                f"{self.prefix}-*-{pid}{SUFFIX}")))
+            for old in own[:-self.keep]:
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+
+    def _encode(self, records):
+        timestamps = [_epoch(record.timestamp) for record in records]
+        dictionary, columns = [], []
+        for name, kind in COLUMNS:
+            if name == "timestamp":
+                values = array.array("d", timestamps)
+            elif kind == "S":
+                known = self._strings[name]
+                new = []
+                values = array.array(CODE)
+                for record in records:
+                    value = getattr(record, name)
+                    code = known.get(value)
+                    if code is None:
+                        code = known[value] = len(known)
+                        new.append(value)
+                    values.append(code)
+                dictionary.append(_U32.pack(len(new)))
+                for value in new:
+                    raw = str(value).encode("utf-8")[:0xFFFF]
+                    dictionary.append(_U16.pack(len(raw)))
+                    dictionary.append(raw)
+            elif kind == "H":
+                values = array.array("H", (min(max(int(getattr(record, name)), 0), 0xFFFF)
+                                           for record in records))
+            else:
+                values = array.array(kind, (getattr(record, name) for record in records))
+            if _SWAP:
+                values.byteswap()
+            columns.append(values.tobytes())
+        dictionary = b"".join(dictionary)
+        columns = b"".join(columns)
+        return b"".join((_BLOCK.pack(BLOCK_MAGIC, len(records), len(dictionary), len(columns),
+                                     min(timestamps), max(timestamps)), dictionary, columns))
+
+
+def segment_paths(path):
+    """The segment files of a log directory, oldest first (or [path] for a single file)."""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, f"*{SUFFIX}")), key=os.path.basename)
+    return [path]
+
+
+class LogScan:
+    """
+    Reads the binary log a block at a time. Iterating yields one dict per
+    block that has matching rows, holding only the requested columns:
+    numbers as array.array, strings as array.array of codes into
+    self.categories[column], a list shared by all blocks and segments.
+
+    where and exclude map a column to the values to keep or drop, and
+    since/until bound the timestamp (epoch seconds). Blocks that cannot
+    match are skipped without decoding their columns.
+    """
+
+    def __init__(self, path, columns=None, where=None, exclude=None, since=None, until=None):
+        self.path = path
+        self.columns = [name for name, _ in COLUMNS if columns is None or name in columns]
+        unknown = (set(columns or ()) | set(where or ()) | set(exclude or ())) - set(COLUMN_TYPES)
+        if unknown:
+            raise ValueError(f"unknown log columns: {', '.join(sorted(unknown))}")
+        self.where = {name: set(values) for name, values in (where or {}).items()}
+        self.exclude = {name: set(values) for name, values in (exclude or {}).items()}
+        self.since = since
+        self.until = until
+        self.categories = {name: [] for name in STRING_COLUMNS}
+        self._codes = {name: {} for name in STRING_COLUMNS}   # string -> code in categories
+        self.blocks_read = 0
+        self.blocks_skipped = 0
+
+    def __iter__(self):
+        for path in segment_paths(self.path):
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < _HEADER.size:
+                    continue  # Created but nothing written yet
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    yield from self._scan_segment(buf, size, path)
+
+    def read(self):
+        """Every matching row, as one dict of columns (the same form as a block)."""
+        result = {name: array.array(_typecode(COLUMN_TYPES[name])) for name in self.columns}
+        for block in self:
+            for name, values in block.items():
+                result[name].extend(values)
+        return result
+
+    def strings(self, name, codes):
+        """Decodes a string column's codes back to a list of strings."""
+        categories = self.categories[name]
+        return [categories[code] for code in codes]
+
+    def _scan_segment(self, buf, size, path):
+        magic, _, _ = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary query log segment")
+        needed = set(self.columns) | set(self.where) | set(self.exclude)
+        # Per string column: segment code -> shared code, and the segment codes of
+        # strings selected by where/exclude (numeric columns are compared by value)
+        remap = {name: [] for name in STRING_COLUMNS}
+        identity = dict.fromkeys(STRING_COLUMNS, True)
+        wanted = {name: set() if name in remap else set(values)
+                  for name, values in self.where.items()}
+        dropped = {name: set() if name in remap else set(values)
+                   for name, values in self.exclude.items()}
+
+        offset = _HEADER.size
+        while offset + _BLOCK.size <= size:
+            (magic, rows, dict_bytes, column_bytes, first,
+             last) = _BLOCK.unpack_from(buf, offset)
+            end = offset + _BLOCK.size + dict_bytes + column_bytes
+            if magic != BLOCK_MAGIC or end > size:
+                return  # A block cut short by a crash ends the segment
+            pos = offset + _BLOCK.size
+            # The dictionary deltas are always read: later blocks refer to them
+            for name in STRING_COLUMNS:
+                count = _U32.unpack_from(buf, pos)[0]
+                pos += 4
+                for _ in range(count):
+                    length = _U16.unpack_from(buf, pos)[0]
+                    pos += 2
+                    if name in needed:
+                        value = bytes(buf[pos:pos + length]).decode("utf-8", "replace")
+                        local = len(remap[name])
+                        code = self._code(name, value)
+                        remap[name].append(code)
+                        identity[name] = identity[name] and code == local
+                        if value in self.where.get(name, ()):
+                            wanted[name].add(local)
+                        if value in self.exclude.get(name, ()):
+                            dropped[name].add(local)
+                    pos += length
+            data = offset + _BLOCK.size + dict_bytes
+            offset = end
+
+            if ((self.since is not None and last < self.since)
+                    or (self.until is not None and first > self.until)
+                    or any(not codes for codes in wanted.values())):
+                self.blocks_skipped += 1
+                continue
+            block = self._decode_block(buf, data, rows, first, last, wanted, dropped)
+            if block is None:
+                self.blocks_skipped += 1
+                continue
+            self.blocks_read += 1
+            for name in self.columns:
+                if COLUMN_TYPES[name] == "S" and not identity[name]:
+                    table = remap[name]
+                    block[name] = array.array(CODE, [table[code] for code in block[name]])
+            yield block
+
+    def _code(self, name, value):
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self.categories[name].append(value)
+        return code
+
+    def _decode_block(self, buf, data, rows, first, last, wanted, dropped):
+        """Decodes the needed columns of one block and applies the row filters."""
+        offsets = {}
+        for name, _ in COLUMNS:
+            offsets[name] = data
+            data += rows * _ITEMSIZE[name]
+
+        def column(name):
+            values = array.array(_typecode(COLUMN_TYPES[name]))
+            start = offsets[name]
+            values.frombytes(buf[start:start + rows * _ITEMSIZE[name]])
+            if _SWAP:
+                values.byteswap()
+            return values
+
+        decoded = {}
+        keep = None
+        for name, codes in wanted.items():
+            decoded[name] = column(name)
+            mask = [code in codes for code in decoded[name]]
+            keep = mask if keep is None else list(map(bool.__and__, keep, mask))
+        for name, codes in dropped.items():
+            if not codes:
+                continue
+            decoded.setdefault(name, column(name))
+            mask = [code not in codes for code in decoded[name]]
+            keep = mask if keep is None else list(map(bool.__and__, keep, mask))
+        if ((self.since is not None and first < self.since)
+                or (self.until is not None and last > self.until)):
+            decoded["timestamp"] = column("timestamp")
+            since = float("-inf") if self.since is None else self.since
+            until = float("inf") if self.until is None else self.until
+            mask = [since <= t <= until for t in decoded["timestamp"]]
+            keep = mask if keep is None else list(map(bool.__and__, keep, mask))
+
+        block = {name: decoded[name] if name in decoded else column(name)
+                 for name in self.columns}
+        if keep is not None and not all(keep):
+            if not any(keep):
+                return None
+            block = {name: array.array(values.typecode, list(itertools.compress(values, keep)))
+                     for name, values in block.items()}
+        return block
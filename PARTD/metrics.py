@@ -0,0 +1,289 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Live metrics
+In-process counters and log-bucketed latency histograms, rendered in the
+Prometheus text format and served over HTTP (GET /metrics) while the resolver
+runs. Recording a value is a bisect and an increment under a lock, cheap
+enough to leave on for every query.
+"""
+import bisect
+import http.server
+import threading
+import time
+
+# Histogram bucket upper bounds in ms: 0.01 ms to ~42 s, four buckets per doubling
+BUCKET_BOUNDS_MS = tuple(0.01 * 2 ** (i / 4) for i in range(89))
+# Phases of a query take microseconds: 0.5 us to ~8 s, four buckets per doubling
+PHASE_BOUNDS_MS = tuple(0.0005 * 2 ** (i / 4) for i in range(97))
+# Where a client query's time goes, in order (see PhaseTimer)
+PHASES = ("receive", "parse", "cache_lookup", "upstream_send", "upstream_receive",
+          "response_write", "log_enqueue")
+RATE_WINDOW = 10   # Seconds averaged for the queries-per-second gauge
+DEFAULT_METRICS_PORT = 9153
+
+
+class Histogram:
+    """Counts observations in fixed logarithmic buckets; estimates percentiles from them."""
+
+    def __init__(self, bounds=BUCKET_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # Last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def percentile(self, pct):
+        """Estimate of the pct-th percentile, interpolated within its bucket."""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+        rank = pct / 100.0 * count
+        seen = 0
+        for index, n in enumerate(counts):
+            if n and seen + n >= rank:
+                low = self.bounds[index - 1] if index > 0 else 0.0
+                high = self.bounds[index] if index < len(self.bounds) else low * 2
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+    def render(self, name, labels=""):
+        """
+        Prometheus histogram lines: a cumulative bucket for every bound, so
+        each scrape has the same series, then sum and count. Observations are
+        in ms but rendered in seconds, the Prometheus base unit.
+        """
+        with self._lock:
+            counts, total, count = list(self.counts), self.total, self.count
+        sep = "," if labels else ""
+        suffix = f"{{{labels}}}" if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.bounds, counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound / 1000:.6g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{suffix} {total / 1000:.9f}")
+        lines.append(f"{name}_count{suffix} {count}")
+        return lines
+
+
+class PhaseTimer:
+    """
+    perf_counter_ns timestamps of one query. Each mark(phase) charges the
+    time since the previous mark to that phase.
+    """
+
+    __slots__ = ("started", "last", "phases")
+
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = {}
+
+    def mark(self, phase):
+        now = time.perf_counter_ns()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last
+        self.last = now
+
+    def split(self, first, second, second_ns):
+        """Marks the time since the last mark as second_ns of second, the rest as first."""
+        now = time.perf_counter_ns()
+        second_ns = min(max(second_ns, 0), now - self.last)
+        self.phases[first] = self.phases.get(first, 0) + now - self.last - second_ns
+        self.phases[second] = self.phases.get(second, 0) + second_ns
+        self.last = now
+
+
+class PhaseTimings:
+    """
+    Per-phase histograms of client queries. Off by default; while off,
+    start() is never called and a query costs one attribute check per phase.
+    "own" is everything but upstream_receive: the time spent in the resolver.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {phase: Histogram(PHASE_BOUNDS_MS)
+                           for phase in PHASES + ("own", "total")}
+
+    def start(self, received_ns=None):
+        return PhaseTimer(received_ns or time.perf_counter_ns())
+
+    def observe(self, timer):
+        """Adds a finished query's phases to the histograms."""
+        histograms = self.histograms
+        for phase, elapsed in timer.phases.items():
+            histograms[phase].observe(elapsed / 1e6)
+        total = timer.last - timer.started
+        histograms["total"].observe(total / 1e6)
+        histograms["own"].observe((total - timer.phases.get("upstream_receive", 0)) / 1e6)
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        return self.enabled
+
+    def report(self):
+        """One line per phase that saw queries: count, mean, p50 and p99 in microseconds."""
+        lines = []
+        for phase, histogram in self.histograms.items():
+            if histogram.count:
+                lines.append(f"{phase:<17} {histogram.count:>8} queries  "
+                             f"mean {histogram.total / histogram.count * 1000:>10.1f} us  "
+                             f"p50 {histogram.percentile(50) * 1000:>10.1f} us  "
+                             f"p99 {histogram.percentile(99) * 1000:>10.1f} us")
+        return lines
+
+
+class RateMeter:
+    """Events per second over the last RATE_WINDOW whole seconds."""
+
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self._slots = [0] * (window + 1)
+        self._seconds = [0] * (window + 1)
+        self._lock = threading.Lock()
+
+    def mark(self):
+        second = int(time.monotonic())
+        slot = second % len(self._slots)
+        with self._lock:
+            if self._seconds[slot] != second:
+                self._seconds[slot] = second
+                self._slots[slot] = 0
+            self._slots[slot] += 1
+
+    def rate(self):
+        now = int(time.monotonic())
+        with self._lock:
+            total = sum(n for n, second in zip(self._slots, self._seconds)
+                        if now - self.window <= second < now)
+        return total / self.window
+
+
+class Metrics:
+    """Everything the resolver records about the queries it answers."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.qps = RateMeter()
+        self.latency = {}          # cache status -> Histogram of total time
+        self.upstream_rtt = {}     # upstream IP -> Histogram
+        self.upstream_timeouts = 0
+        self.hop_rtt = Histogram()  # Iterative mode: every server contacted
+        self.phases = PhaseTimings()
+        self._lock = threading.Lock()
+        # Extra gauges and counters read from other objects at render time:
+        # name -> (type, help, function returning [(labels, value)])
+        self.collectors = {}
+
+    def observe_query(self, cache_status, total_ms):
+        """Called once per client query with its cache status and total time."""
+        self.qps.mark()
+        histogram = self.latency.get(cache_status)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(cache_status, Histogram())
+        histogram.observe(total_ms)
+
+    def observe_upstream(self, server_ip, rtt_ms):
+        histogram = self.upstream_rtt.get(server_ip)
+        if histogram is None:
+            with self._lock:
+                histogram = self.upstream_rtt.setdefault(server_ip, Histogram())
+        histogram.observe(rtt_ms)
+
+    def upstream_timeout(self):
+        with self._lock:
+            self.upstream_timeouts += 1
+
+    def render(self):
+        """The full metrics page in the Prometheus text exposition format."""
+        lines = [
+            "# HELP dns_uptime_seconds Seconds since the resolver started.",
+            "# TYPE dns_uptime_seconds gauge",
+            f"dns_uptime_seconds {time.time() - self.started:.3f}",
+            f"# HELP dns_queries_per_second Client queries per second over the last "
+            f"{self.qps.window} s.",
+            "# TYPE dns_queries_per_second gauge",
+            f"dns_queries_per_second {self.qps.rate():.3f}",
+            "# HELP dns_queries_total Client queries answered, by cache status.",
+            "# TYPE dns_queries_total counter",
+        ]
+        latency = sorted(self.latency.items())
+        for status, histogram in latency:
+            lines.append(f'dns_queries_total{{cache_status="{status}"}} {histogram.count}')
+        lines += ["# HELP dns_query_duration_seconds Time to answer a client query, "
+                  "by cache status.",
+                  "# TYPE dns_query_duration_seconds histogram"]
+        for status, histogram in latency:
+            lines += histogram.render("dns_query_duration_seconds", f'cache_status="{status}"')
+        lines += ["# HELP dns_query_duration_quantile_seconds Estimated p50/p99 answer time "
+                  "by cache status.",
+                  "# TYPE dns_query_duration_quantile_seconds gauge"]
+        for status, histogram in latency:
+            for quantile in (50, 99):
+                lines.append(f'dns_query_duration_quantile_seconds{{cache_status="{status}",'
+                             f'quantile="0.{quantile}"}} '
+                             f'{histogram.percentile(quantile) / 1000:.7f}')
+        lines += ["# HELP dns_upstream_timeouts_total Forwarded queries no upstream answered.",
+                  "# TYPE dns_upstream_timeouts_total counter",
+                  f"dns_upstream_timeouts_total {self.upstream_timeouts}",
+                  "# HELP dns_upstream_rtt_seconds RTT of the winning upstream per "
+                  "forwarded query.",
+                  "# TYPE dns_upstream_rtt_seconds histogram"]
+        for server_ip, histogram in sorted(self.upstream_rtt.items()):
+            lines += histogram.render("dns_upstream_rtt_seconds", f'upstream="{server_ip}"')
+        if self.hop_rtt.count:
+            lines += ["# HELP dns_iterative_hop_rtt_seconds RTT of each server contacted "
+                      "in iterative mode.",
+                      "# TYPE dns_iterative_hop_rtt_seconds histogram"]
+            lines += self.hop_rtt.render("dns_iterative_hop_rtt_seconds")
+        lines += ["# HELP dns_phase_timing_enabled 1 while per-phase query timing is on.",
+                  "# TYPE dns_phase_timing_enabled gauge",
+                  f"dns_phase_timing_enabled {int(self.phases.enabled)}"]
+        timed = [(phase, h) for phase, h in self.phases.histograms.items() if h.count]
+        if timed:
+            lines += ["# HELP dns_query_phase_seconds Time client queries spend in each phase "
+                      "(own = all but upstream_receive).",
+                      "# TYPE dns_query_phase_seconds histogram"]
+            for phase, histogram in timed:
+                lines += histogram.render("dns_query_phase_seconds", f'phase="{phase}"')
+        for name, (kind, help_text, collect) in sorted(self.collectors.items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in collect():
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not worth a console line each
+
+
+def serve_metrics(metrics, address):
+    """Starts the /metrics HTTP endpoint on a daemon thread and returns the server."""
+    server = http.server.ThreadingHTTPServer(address, _MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
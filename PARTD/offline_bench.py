@@ -0,0 +1,391 @@
+#!/usr/bin/python3
+"""
+CS331 DNS Benchmark - Offline benchmark suite
+Measures partd_custom_resolver.py without the internet: every scenario starts
+a local stub upstream (stub_upstream.py) with its own zone latencies, losses
+and answer sizes, starts the resolver as a subprocess forwarding to it, and
+drives it with the native load generator using the queries of a PCAP (or a
+seeded synthetic workload). A scenario with "noise" also floods the resolver from a second
+address for the whole pass, to measure how well the other client is shielded
+from it. Results are written as JSON so runs can be kept and compared
+across commits:
+
+    python3 offline_bench.py --pcap PCAP_1_H1.pcap --output before.json
+    ... change the resolver ...
+    python3 offline_bench.py --pcap PCAP_1_H1.pcap --output after.json --compare before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import dns_wire
+import loadgen
+# pcap_stream.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pcap_stream
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESOLVER = os.path.join(HERE, "partd_custom_resolver.py")
+STUB = os.path.join(HERE, "stub_upstream.py")
+HOST = "127.0.0.1"
+START_TIMEOUT = 10.0   # Seconds to wait for the stub and the resolver to answer
+STOP_TIMEOUT = 10.0
+
+# Used when --suite is not given. Zones are stub_upstream settings; a scenario's
+# "zones" are merged over the suite's, zone by zone.
+DEFAULT_SUITE = {
+    "seed": 1,
+    "zones": {
+        ".": {"latency_ms": 20},
+        "slow.test": {"latency_ms": 250, "jitter_ms": 50},
+        "big.test": {"size": 1400},
+        "nx.test": {"rcode": "NXDOMAIN"},
+    },
+    "synthetic": {"names": 2000, "queries": 5000, "zipf": 1.0},
+    "scenarios": [
+        {"name": "forwarding", "passes": 2, "concurrency": 16},
+        {"name": "single-threaded", "resolver_args": ["--workers", "0"], "concurrency": 16},
+        {"name": "lossy-upstream", "zones": {".": {"loss": 0.05}},
+         "resolver_args": ["--upstream-timeout", "1"], "concurrency": 16},
+        {"name": "open-loop", "qps": 1000},
+        # A second client floods the resolver while the workload is sent at a steady rate
+        {"name": "noisy-neighbour-fifo", "qps": 200, "noise": {"concurrency": 64},
+         "resolver_args": ["--queue", "fifo"]},
+        {"name": "noisy-neighbour", "qps": 200, "noise": {"concurrency": 64}},
+        {"name": "noisy-neighbour-limited", "qps": 200, "noise": {"concurrency": 64},
+         "resolver_args": ["--client-qps", "300"]},
+    ],
+}
+# Metrics page series copied into the results (see metrics.py)
+RESOLVER_METRICS = ("dns_cache_lookups_total", "dns_coalesced_total",
+                    "dns_upstream_timeouts_total", "dns_upstream_hedged_total",
+                    "dns_log_dropped_total", "dns_throttled_total")
+# The noisy client of a scenario with "noise" sends from here, so the resolver
+# sees it as a different client (all of 127.0.0.0/8 is loopback on Linux)
+NOISE_SOURCE = "127.0.0.2"
+
+
+def free_port():
+    """A port nothing is bound to right now, for both UDP and TCP."""
+    while True:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+            udp.bind((HOST, 0))
+            port = udp.getsockname()[1]
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as tcp:
+                tcp.bind((HOST, port))
+            return port
+        except OSError:
+            continue
+
+
+def wait_until_answering(port, timeout=START_TIMEOUT):
+    """Sends a query every 100 ms until something on port answers it."""
+    deadline = time.monotonic() + timeout
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(0.1)
+        while time.monotonic() < deadline:
+            sock.sendto(dns_wire.build_query("ready.bench.invalid", dns_wire.TYPE_A, 1),
+                        (HOST, port))
+            try:
+                sock.recv(4096)
+                return True
+            except OSError:
+                continue
+    return False
+
+
+def stop_process(process):
+    """SIGTERM, then SIGKILL if it does not exit in time. Returns its output."""
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+    try:
+        output, _ = process.communicate(timeout=STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        output, _ = process.communicate()
+    return output or ""
+
+
+def scrape_metrics(port):
+    """The RESOLVER_METRICS series of the resolver's /metrics page as {series: value}."""
+    try:
+        with urllib.request.urlopen(f"http://{HOST}:{port}/metrics", timeout=2) as response:
+            page = response.read().decode("utf-8")
+    except OSError:
+        return {}
+    values = {}
+    for line in page.splitlines():
+        if line.startswith(RESOLVER_METRICS):
+            series, _, value = line.rpartition(" ")
+            values[series] = float(value)
+    return values
+
+
+# --- Workloads ---
+
+def pcap_workload(pcap_file, replay):
+    """(qname, qtype) pairs: every captured query in order, or the unique names as A queries."""
+    if replay:
+        return [(q.qname.rstrip("."), q.qtype) for q in pcap_stream.iter_queries(pcap_file)
+                if q.qname.rstrip(".")]
+    return [(name, dns_wire.TYPE_A) for name in pcap_stream.unique_domains(pcap_file)]
+
+
+def synthetic_workload(zones, names=2000, queries=5000, zipf=1.0, seed=1):
+    """
+    Seeded stand-in for a capture: names queried with Zipf-distributed
+    popularity, so some are hot and most are not. Half of them fall in the
+    default zone and the rest are spread over the suite's other zones.
+    """
+    rng = random.Random(seed)
+    others = [zone.strip(".") for zone in zones if zone.strip(".")]
+    suffixes = ["example"] * max(len(others), 1) + others
+    pool = [f"host{i}.{suffixes[i % len(suffixes)]}" for i in range(names)]
+    weights = [1.0 / (rank ** zipf) for rank in range(1, names + 1)]
+    return [(name, dns_wire.TYPE_A) for name in rng.choices(pool, weights, k=queries)]
+
+
+# --- Running a scenario ---
+
+def run_scenario(scenario, suite, workload, work_dir):
+    """Starts the stub and the resolver, runs every pass and returns the results dict."""
+    name = scenario["name"]
+    scenario_dir = os.path.join(work_dir, name)
+    os.makedirs(scenario_dir, exist_ok=True)
+    zones = {zone: dict(settings) for zone, settings in suite["zones"].items()}
+    for zone, settings in scenario.get("zones", {}).items():
+        zones.setdefault(zone, {}).update(settings)
+    zones_file = os.path.join(scenario_dir, "zones.json")
+    with open(zones_file, "w") as f:
+        json.dump(zones, f, indent=2, sort_keys=True)
+
+    stub_port, port, metrics_port = free_port(), free_port(), free_port()
+    stub = subprocess.Popen([sys.executable, STUB, "--host", HOST, "--port", str(stub_port),
+                             "--zones", zones_file, "--seed", str(suite.get("seed", 0))],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    resolver = None
+    try:
+        if not wait_until_answering(stub_port):
+            raise RuntimeError(f"stub upstream did not start:\n{stop_process(stub)}")
+        resolver_args = [sys.executable, RESOLVER, "--host", HOST, "--port", str(port),
+                         "--upstream", f"{HOST}:{stub_port}", "--verbosity", "0",
+                         "--snapshot-file", "", "--metrics-host", HOST,
+                         "--metrics-port", str(metrics_port)] + scenario.get("resolver_args", [])
+        with open(os.path.join(scenario_dir, "resolver.out"), "w") as out:
+            # Run in the scenario directory so its dns_log.csv is kept there
+            resolver = subprocess.Popen(resolver_args, cwd=scenario_dir, stdout=out,
+                                        stderr=subprocess.STDOUT)
+        if not wait_until_answering(port):
+            raise RuntimeError(f"resolver did not start; see {scenario_dir}/resolver.out")
+
+        passes = []
+        for number in range(1, scenario.get("passes", 1) + 1):
+            before = scrape_metrics(metrics_port)
+            results, noise = drive(port, workload, scenario)
+            after = scrape_metrics(metrics_port)
+            summary = results.summary()
+            summary["pass"] = number
+            if noise is not None:
+                summary["noise"] = noise.summary()
+            summary["resolver_metrics"] = {series: after[series] - before.get(series, 0)
+                                           for series in sorted(after)}
+            passes.append(summary)
+            print_pass(name, summary)
+    finally:
+        if resolver is not None:
+            stop_process(resolver)
+        stub_output = stop_process(stub).strip().splitlines()
+
+    try:
+        stub_stats = json.loads(stub_output[-1]) if stub_output else {}
+    except ValueError:
+        stub_stats = {}
+    return {
+        "resolver_args": scenario.get("resolver_args", []),
+        "zones": zones,
+        "load": {key: scenario[key] for key in ("concurrency", "qps", "noise")
+                 if key in scenario},
+        "passes": passes,
+        "stub": stub_stats,
+    }
+
+
+def drive(port, workload, scenario):
+    """
+    One pass of the workload: closed loop by default, open loop if the
+    scenario has a qps. Returns (results, results of the noisy client or None).
+    """
+    timeout = scenario.get("timeout", loadgen.DEFAULT_TIMEOUT)
+    stop = threading.Event()
+    noise = None
+    if scenario.get("noise"):
+        noise = ThreadPoolExecutor(max_workers=1).submit(flood, port, workload,
+                                                         scenario["noise"], timeout, stop)
+    try:
+        if scenario.get("qps"):
+            results = loadgen.run_open_loop(HOST, loadgen.fixed_rate(workload, scenario["qps"]),
+                                            port=port, timeout=timeout)
+        else:
+            results = loadgen.run_closed_loop(HOST, workload, scenario.get("concurrency", 1),
+                                              port=port, timeout=timeout)
+    finally:
+        stop.set()
+    return results, noise.result() if noise is not None else None
+
+
+def flood(port, workload, settings, timeout, stop):
+    """Closed-loop queries from NOISE_SOURCE, cycling through workload until stop is set."""
+    def queries():
+        while not stop.is_set():
+            for query in workload:
+                if stop.is_set():
+                    return
+                yield query
+
+    return loadgen.run_closed_loop(HOST, queries(), settings.get("concurrency", 64), port=port,
+                                   timeout=timeout, source=NOISE_SOURCE)
+
+
+def print_pass(name, summary):
+    for label, result in ((f"pass {summary['pass']}", summary), ("noise", summary.get("noise"))):
+        if result is None:
+            continue
+        latency = result["latency_ms"]
+        print(f"[Bench] {name} {label}: {result['queries']} queries, "
+              f"{result['timeouts']} timeouts, {result['achieved_qps']:.0f} qps, "
+              f"p50 {latency['p50']:.2f} / p90 {latency['p90']:.2f} / "
+              f"p99 {latency['p99']:.2f} ms")
+
+
+def _rounded(value):
+    """Floats rounded to 3 decimals so result files diff cleanly."""
+    if isinstance(value, float):
+        return round(value, 3)
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rounded(item) for item in value]
+    return value
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True,
+                              capture_output=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(old, new):
+    """Prints the change in latency, QPS and timeouts of every pass found in both results."""
+    print(f"--- {old.get('commit') or 'old'} -> {new.get('commit') or 'new'} ---")
+    print(f"{'scenario':<22} {'pass':>4} {'p50_ms':>17} {'p99_ms':>17} {'qps':>17} "
+          f"{'timeouts':>11}")
+
+    def change(before, after):
+        if not before:
+            return f"{before:.1f}->{after:.1f}"
+        return f"{after:.1f} ({(after - before) / before * 100:+.0f}%)"
+
+    for name, scenario in new["scenarios"].items():
+        old_scenario = old.get("scenarios", {}).get(name, {})
+        old_passes = {p["pass"]: p for p in old_scenario.get("passes", [])}
+        for summary in scenario.get("passes", []):
+            before = old_passes.get(summary["pass"])
+            if before is None:
+                continue
+            print(f"{name:<22} {summary['pass']:>4} "
+                  f"{change(before['latency_ms']['p50'], summary['latency_ms']['p50']):>17} "
+                  f"{change(before['latency_ms']['p99'], summary['latency_ms']['p99']):>17} "
+                  f"{change(before['achieved_qps'], summary['achieved_qps']):>17} "
+                  f"{before['timeouts']:>5}->{summary['timeouts']:<5}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Part D resolver against a "
+                                                 "local stub upstream (no network needed)")
+    parser.add_argument("--pcap", default=None,
+                        help="capture to take the queries from (default: the suite's seeded "
+                             "synthetic workload)")
+    parser.add_argument("--replay", action="store_true",
+                        help="send every captured query in order with its qtype, instead of "
+                             "each unique name once")
+    parser.add_argument("--suite", default=None,
+                        help="JSON file with seed, zones, synthetic and scenarios "
+                             "(default: the built-in suite)")
+    parser.add_argument("--scenario", action="append",
+                        help="run only this scenario; repeat for several")
+    parser.add_argument("--output", default="bench_results.json", help="results file (JSON)")
+    parser.add_argument("--compare", metavar="JSON", default=None,
+                        help="earlier results file to compare against")
+    parser.add_argument("--work-dir", default="bench_runs",
+                        help="where each scenario's zones, resolver output and logs are kept")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    suite = DEFAULT_SUITE
+    if args.suite:
+        with open(args.suite) as f:
+            suite = json.load(f)
+    scenarios = [s for s in suite["scenarios"] if not args.scenario or s["name"] in args.scenario]
+    if not scenarios:
+        print(f"No scenarios to run (have: {', '.join(s['name'] for s in suite['scenarios'])})")
+        return 1
+
+    if args.pcap:
+        workload = pcap_workload(args.pcap, args.replay)
+        source = {"pcap": os.path.basename(args.pcap), "replay": args.replay}
+    else:
+        synthetic = dict(DEFAULT_SUITE["synthetic"], **suite.get("synthetic", {}))
+        workload = synthetic_workload(suite["zones"], seed=suite.get("seed", 1), **synthetic)
+        source = dict(synthetic, seed=suite.get("seed", 1))
+    if not workload:
+        print("The workload has no queries.")
+        return 1
+    source.update(queries=len(workload), unique=len(set(workload)))
+    print(f"[Bench] Workload: {source}")
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "workload": source,
+        "scenarios": {},
+    }
+    work_dir = os.path.abspath(args.work_dir)
+    for scenario in scenarios:
+        print(f"[Bench] Scenario {scenario['name']}...")
+        try:
+            results["scenarios"][scenario["name"]] = run_scenario(scenario, suite, workload,
+                                                                  work_dir)
+        except RuntimeError as e:
+            print(f"[Bench] Scenario {scenario['name']} failed: {e}")
+            results["scenarios"][scenario["name"]] = {"error": str(e)}
+
+    with open(args.output, "w") as f:
+        json.dump(_rounded(results), f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"[Bench] Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), _rounded(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
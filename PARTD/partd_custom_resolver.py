@@ -3,30 +3,84 @@
 CS331 Custom DNS Resolver - Part D Solution
 This version logs all required data to the console and 'dns_log.csv'.
 """
+import argparse
+import os
+import signal
 import socket
 import socketserver
+import struct
+import sys
+import threading
 import time
+import traceback
 import datetime
-import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cache_snapshot
+import compact_cache
+import dns_cache
+import dns_wire
+import iterative
+import log_segments
+import metrics
+import query_log
+import ratelimit
+import shared_cache
+import singleflight
+import upstream
 
 # Real DNS server to forward queries to (e.g., Google's)
-UPSTREAM_DNS_SERVER = "8.8.8.8"
+UPSTREAM_DNS_SERVERS = ["8.8.8.8", "1.1.1.1"]  # Raced per query, see upstream.UpstreamSet
 UPSTREAM_DNS_PORT = 53
+UPSTREAM_TIMEOUT = 2.0
+UPSTREAM_POOL = None  # Shared upstream.UpstreamPool, created at startup
+UPSTREAMS = None      # upstream.UpstreamSet over UPSTREAM_DNS_SERVERS, created at startup
+UPSTREAM_TCP = None   # upstream.UpstreamTCPPool for truncated answers, created at startup
+HOST, PORT = "10.0.0.5", 53   # Listen on the 'dns' host's IP by default
 LOG_FILE = "dns_log.csv"
+LOG_DIR = log_segments.DEFAULT_DIR   # Binary log segments (--log-format binary/both)
+
+# Lookups currently in progress, keyed like the cache; identical queries join them
+IN_FLIGHT = singleflight.SingleFlight()
+
+# --- Bonus E: Resolution mode ---
+RESOLUTION_MODE = "forwarding"   # or "iterative" (from the root servers)
+ITERATIVE_RESOLVER = None        # iterative.IterativeResolver, created at startup
+QUERY_LOG = None  # Background query_log.QueryLogger, created at startup
+
+# --- Concurrency ---
+DEFAULT_WORKERS = 32          # Worker threads answering queries (0 = single-threaded)
+DEFAULT_MAX_INFLIGHT = 256    # Queries queued before the busiest client's newest is dropped
+TCP_IDLE_TIMEOUT = 10.0       # Seconds before an idle client TCP connection is closed
+
+# --- Rate limiting and per-client fairness (see ratelimit.py) ---
+CLIENT_LIMITER = None   # ratelimit.TokenBuckets per client IP (--client-qps), None = off
+RRL = None              # ratelimit.ResponseRateLimiter (--rrl-rps), None = off
+FAIR_QUEUE = None       # The threaded UDP server's ratelimit.FairQueue
 
 # --- For Bonus Part F: Caching ---
-DNS_CACHE = {}
-CACHE_ENABLED = False  # Set to False for Part D
-
-# Clear the log file every time the resolver starts
-try:
-    if os.path.exists(LOG_FILE):
-        os.remove(LOG_FILE)
-    # Write the header for the CSV file
-    with open(LOG_FILE, "w") as f:
-        f.write("timestamp,domain,mode,server_ip,step,response,rtt_ms,total_time_ms,cache_status,servers_visited\n")
-except Exception as e:
-    print(f"[Resolver] CRITICAL: Could not write to log file {LOG_FILE}: {e}")
+CACHE_ENABLED = True
+CACHE_MAX_ENTRIES = 10000              # LRU eviction once this many answers are cached
+CACHE_MAX_BYTES = 16 * 1024 * 1024     # ...or once cached responses use this many bytes
+DNS_CACHE = dns_cache.DNSCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES)
+# --cache-store: "lru" (the DNSCache above) or "compact" (compact_cache, for millions of names)
+CACHE_STORES = {"lru": dns_cache.DNSCache, "compact": compact_cache.CompactDNSCache}
+
+# Cache and delegations are saved here periodically and on shutdown, and reloaded at startup
+SNAPSHOT_FILE = "dns_cache.snapshot"
+SNAPSHOT_INTERVAL = 60    # seconds (0 = only on shutdown)
+
+# In-process counters and latency histograms, served on /metrics (see metrics.py)
+METRICS = metrics.Metrics()
+
+# --- Multi-process mode (--processes N) ---
+SHARED_CACHE = None        # shared_cache.SharedAnswerTable behind every worker's DNS_CACHE
+WORKER_STATS = None        # shared_cache.WorkerStats, one row per worker process
+STATS_PUBLISH_INTERVAL = 1.0
+
+# Background refreshes of hot and stale cache entries (see dns_cache)
+PREFETCH_WORKERS = 4
+PREFETCHER = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="dns-prefetch")
 
 class DNSRequestHandler(socketserver.BaseRequestHandler):
     """
@@ -35,35 +89,61 @@ class DNSRequestHandler(socketserver.BaseRequestHandler):
     """
     
     def parse_dns_query(self, data):
-        """A simple DNS query parser to get the domain name."""
-        try:
-            question = data[12:]
-            qname_end = question.find(b'\x00')
-            qname_raw = question[:qname_end]
-            
-            domain_parts = []
-            i = 0
-            while i < len(qname_raw):
-                length = qname_raw[i]
-                i += 1
-                domain_parts.append(qname_raw[i : i + length].decode('utf-8'))
-                i += length
-            domain = ".".join(domain_parts)
-            return domain
-        except Exception as e:
-            print(f"[Resolver] Error parsing domain: {e}")
+        """
+        A simple DNS query parser.
+        Returns (domain, qtype, qclass) for the first question, or None.
+        """
+        question = dns_wire.parse_question(data)
+        if question is None:
+            QUERY_LOG.message("[Resolver] Error parsing domain: malformed question")
             return None
+        domain, qtype, qclass, _ = question
+        return domain, qtype, qclass
 
     def handle(self):
-        data, sock = self.request
-        client_address = self.client_address
-        
+        data, self.sock, received_ns = self.request
+        self.process(data, received_ns)
+
+    def reply(self, query, response):
+        """
+        Sends a response over UDP, truncated (TC=1) if the client cannot take
+        it all or response rate limiting says to slip it.
+        """
+        limit = None
+        if RRL is not None:
+            action = self.rate_limit_response(response)
+            if action == ratelimit.DROP:
+                return
+            if action == ratelimit.SLIP:
+                limit = dns_wire.HEADER_LEN  # Too small for anything: header and question, TC
+        self.sock.sendto(dns_wire.fit_response(response, dns_wire.edns_payload(query), limit),
+                         self.client_address)
+
+    def rate_limit_response(self, response):
+        """What RRL says to do with a response to this client (ratelimit.SEND/SLIP/DROP)."""
+        question = dns_wire.parse_question(response)
+        if question is None:
+            return ratelimit.SEND
+        return RRL.check(self.client_address[0], question[0], question[1],
+                         dns_wire.get_rcode(response))
+
+    def process(self, data, received_ns=None):
+        # Per-phase timing (see metrics.PhaseTimings); timer is None while it is off
+        timer = METRICS.phases.start(received_ns) if METRICS.phases.enabled else None
+        if timer and received_ns:
+            timer.mark("receive")
         # --- Part D Logging - Item (a) ---
         timestamp = datetime.datetime.now().isoformat()
-        domain = self.parse_dns_query(data)
+        start_time = time.time()
+        query = self.parse_dns_query(data)
         
-        if not domain:
+        if not query:
             return
+        domain, qtype, qclass = query
+        txid = int.from_bytes(data[:2], "big")
+        key = dns_cache.cache_key(domain, qtype, qclass)
+        if timer:
+            timer.mark("parse")
 
         # Initialize log variables
         log_mode = "Forwarding" #
@@ -75,91 +155,786 @@ class DNSRequestHandler(socketserver.BaseRequestHandler):
         log_cache_status = "MISS" #
         log_servers_visited = 0
 
-        # --- Part D Logging (Console) ---
-        print("\n--- New DNS Query ---")
-        print(f"a. Timestamp:         {timestamp}")
-        print(f"b. Domain Name:       {domain}")
-
-        
         # --- Bonus F: Caching Logic ---
-        # [This is where you would implement caching logic for Part F]
-        # if CACHE_ENABLED and domain in DNS_CACHE:
-        #    ...
-        
-        if not CACHE_ENABLED:
+        if CACHE_ENABLED:
+            cached = DNS_CACHE.get(key, txid)
+            if timer:
+                timer.mark("cache_lookup")
+            if cached is not None:
+                response, log_cache_status, refresh = cached
+                self.reply(data, response)
+                if timer:
+                    timer.mark("response_write")
+                log_total_time = (time.time() - start_time) * 1000
+                log_step = "Answered from Cache"
+                if log_cache_status == dns_cache.STALE_HIT:
+                    log_step = "Served Stale from Cache"
+                if log_cache_status == dns_cache.HIT:
+                    log_response = "Response Received"
+                else:
+                    log_response = dns_wire.RCODE_NAMES.get(dns_wire.get_rcode(response), "N/A")
+                QUERY_LOG.log(query_log.QueryRecord(
+                    timestamp, domain, "Cache", log_server_ip, log_step,
+                    log_response, log_rtt, log_total_time, log_cache_status,
+                    log_servers_visited, qtype))
+                METRICS.observe_query(log_cache_status, log_total_time)
+                if timer:
+                    timer.mark("log_enqueue")
+                    METRICS.phases.observe(timer)
+                if refresh:
+                    PREFETCHER.submit(prefetch, data, query, key,
+                                      log_cache_status == dns_cache.STALE_HIT)
+                return
+        else:
             log_cache_status = "MISS (Caching Disabled)"
         
-        print(f"i. Cache Status:      {log_cache_status}")
-        
-        
         # --- Bonus E: Recursion Logic ---
-        # [This is where you would implement recursion logic for Part E]
-        # if recursive_mode:
-        #    log_mode = "Recursive"
-        #    ...
-        # else:
-        
-        print(f"c. Resolution Mode:   {log_mode}")
-        
-        forward_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        forward_sock.settimeout(2.0)
+        if RESOLUTION_MODE == "iterative":
+            self.resolve_iteratively(data, query, key, timestamp, start_time,
+                                     log_cache_status, timer)
+            return
         
         try:
             start_fwd_time = time.time()
             
-            log_server_ip = UPSTREAM_DNS_SERVER #
             log_step = "Forwarded to Upstream" #
-            log_servers_visited = 1 # We only contact one server in this simple mode
-            
-            forward_sock.sendto(data, (UPSTREAM_DNS_SERVER, UPSTREAM_DNS_PORT))
-            
-            print(f"d. DNS Server Contacted: {log_server_ip}")
-            print(f"e. Step of Resolution: {log_step}")
             
-            # Get response from upstream
-            response, _ = forward_sock.recvfrom(512)
+            # Identical queries already on their way upstream are joined, not re-sent
+            try:
+                answer, leader = IN_FLIGHT.do(key, lambda: self.forward(data, key, timer))
+            except ConnectionError:
+                # The TCP retry of a truncated answer was refused or reset
+                self.reply(data, dns_wire.build_response(data, dns_wire.RCODE_SERVFAIL))
+                raise
+            if timer:
+                timer.mark("upstream_receive")   # Only the wait for the leader, if coalesced
+            response = answer.response
             end_fwd_time = time.time()
             
-            log_rtt = (end_fwd_time - start_fwd_time) * 1000 # in ms
-            log_total_time = log_rtt # In a simple proxy, RTT is the total time
+            log_server_ip = answer.server.ip # The upstream whose answer arrived first
+            log_servers_visited = answer.asked
+            if answer.asked > 1:
+                log_step = "Hedged to Second Upstream"
+            if answer.transport == "TCP":
+                log_step += " (Truncated; Retried over TCP)"
+            log_rtt = answer.rtt * 1000 # in ms, measured from the send to the winner
+            log_total_time = (end_fwd_time - start_time) * 1000
             log_response = "Response Received" #
-            
-            print(f"f. Response:          {log_response}")
-            print(f"g. RTT to Server:     {log_rtt:.2f} ms")
-            print(f"h. Total Time:        {log_total_time:.2f} ms")
-            
-            # --- TODO: Bonus F: Add to Cache ---
+            if not leader:
+                response = dns_wire.rewrite_response(response, txid, (), 0)
+                log_step = "Coalesced with In-flight Query"
+                log_cache_status = "COALESCED"
+                log_servers_visited = 0
 
             # Send the response back to the original client
-            sock.sendto(response, client_address)
+            self.reply(data, response)
+            if timer:
+                timer.mark("response_write")
 
         except socket.timeout:
             log_response = "Forwarding Timed Out"
-            print(f"f. Response:          {log_response}")
         except Exception as e:
             log_response = f"Error: {e}"
-            print(f"[Resolver] Error forwarding query: {e}")
-        finally:
-            forward_sock.close()
+            QUERY_LOG.message(f"[Resolver] Error forwarding query: {e}")
         
-        # --- Log all data to CSV file ---
+        # --- Part D Logging: queued, written by the background logger ---
+        QUERY_LOG.log(query_log.QueryRecord(
+            timestamp, domain, log_mode, log_server_ip, log_step, log_response,
+            log_rtt, log_total_time, log_cache_status, log_servers_visited, qtype))
+        METRICS.observe_query(log_cache_status, (time.time() - start_time) * 1000)
+        if timer:
+            timer.mark("log_enqueue")
+            METRICS.phases.observe(timer)
+
+    @staticmethod
+    def forward(data, key, timer=None):
+        """
+        Races the query across the upstream servers and caches the answer.
+        Returns the upstream.Answer. The query always carries an EDNS0 OPT
+        record upstream so large answers fit in one UDP response.
+        With a PhaseTimer, the winner's RTT is charged to upstream_receive and
+        the rest of the exchange (picking servers, sending, waking up) to
+        upstream_send.
+        """
         try:
-            with open(LOG_FILE, "a") as f:
-                f.write(f"{timestamp},{domain},{log_mode},{log_server_ip},{log_step},"
-                        f"{log_response},{log_rtt:.4f},{log_total_time:.4f},"
-                        f"{log_cache_status},{log_servers_visited}\n")
+            answer = UPSTREAMS.query(dns_wire.add_edns(data), timeout=UPSTREAM_TIMEOUT)
+            if timer:
+                timer.split("upstream_send", "upstream_receive", int(answer.rtt * 1e9))
+        except socket.timeout:
+            if timer:
+                timer.mark("upstream_receive")
+            METRICS.upstream_timeout()
+            # RFC 2308 section 7: remember the failure briefly so retries are answered locally
+            if CACHE_ENABLED:
+                DNS_CACHE.put_failure(key, dns_wire.build_response(data, dns_wire.RCODE_SERVFAIL))
+            raise
+        except ConnectionError:
+            # The TCP retry was refused or reset; cached like a timeout
+            if CACHE_ENABLED:
+                DNS_CACHE.put_failure(key, dns_wire.build_response(data, dns_wire.RCODE_SERVFAIL))
+            raise
+        METRICS.observe_upstream(answer.server.ip, answer.rtt * 1000)
+        # --- Bonus F: Add to Cache ---
+        # Done before the in-flight entry is released, so no query can slip in between
+        if CACHE_ENABLED:
+            DNS_CACHE.put(key, answer.response)
+            if timer:
+                timer.mark("cache_lookup")   # Storing the answer counts as cache work
+        return answer
+
+    @staticmethod
+    def lookup_iteratively(data, query, key):
+        """Resolves query from the root servers and caches the result."""
+        result = ITERATIVE_RESOLVER.resolve(*query)
+        if CACHE_ENABLED:
+            DNS_CACHE.put(key, dns_wire.build_response(data, result.rcode, result.answers,
+                                                       result.authority))
+        return result
+
+    def resolve_iteratively(self, data, query, key, timestamp, start_time, cache_status,
+                            timer=None):
+        """
+        Bonus E: resolves the query from the root servers.
+        Every server contacted is logged as its own step with its own RTT;
+        total_time_ms and servers_visited are cumulative up to that step.
+        The whole walk is timed as upstream_receive.
+        """
+        domain = query[0]
+        try:
+            result, leader = IN_FLIGHT.do(
+                key, lambda: self.lookup_iteratively(data, query, key))
+            response = dns_wire.build_response(data, result.rcode, result.answers,
+                                               result.authority)
         except Exception as e:
-            print(f"[Resolver] FAILED to write to log file: {e}")
+            QUERY_LOG.message(f"[Resolver] Error resolving {domain} iteratively: {e}")
+            result, leader = None, True
+            response = dns_wire.build_response(data, dns_wire.RCODE_SERVFAIL)
+        if timer:
+            timer.mark("upstream_receive")
+        self.reply(data, response)
+        if timer:
+            timer.mark("response_write")
+        METRICS.observe_query(cache_status if leader else "COALESCED",
+                              (time.time() - start_time) * 1000)
+        self.log_iteration(result, leader, query, timestamp, start_time, cache_status)
+        if timer:
+            timer.mark("log_enqueue")
+            METRICS.phases.observe(timer)
 
+    @staticmethod
+    def log_iteration(result, leader, query, timestamp, start_time, cache_status):
+        """Queues the log rows of an iterative lookup, one per server contacted."""
+        domain = query[0]
+        if not leader:
+            QUERY_LOG.log(query_log.QueryRecord(
+                timestamp, domain, "Iterative", "N/A", "Coalesced with In-flight Query",
+                "Response Received", 0, (time.time() - start_time) * 1000, "COALESCED", 0,
+                query[1]))
+            return
+        if not result or not result.hops:
+            QUERY_LOG.log(query_log.QueryRecord(
+                timestamp, domain, "Iterative", "N/A", "N/A", "Resolution Failed",
+                0, (time.time() - start_time) * 1000, cache_status, 0, query[1]))
+            return
+        for visited, hop in enumerate(result.hops, 1):
+            METRICS.hop_rtt.observe(hop.rtt_ms)
+            QUERY_LOG.log(query_log.QueryRecord(
+                timestamp, domain, "Iterative", hop.server_ip, hop.step, hop.response,
+                hop.rtt_ms, (hop.finished_at - start_time) * 1000, cache_status, visited,
+                query[1]))
 
-if __name__ == "__main__":
-    HOST, PORT = "10.0.0.5", 53 # Listen on the 'dns' host's IP
-    print(f"Custom DNS Resolver starting on {HOST}:{PORT}...")
-    print(f"Logging data to {LOG_FILE}")
-    
+
+def prefetch(data, query, key, stale):
+    """
+    Looks a hot or stale cached name up again in the background, so the
+    next client is answered from a fresh entry instead of waiting for the
+    upstream. Logged as its own row with mode "Prefetch".
+    """
+    timestamp = datetime.datetime.now().isoformat()
+    start_time = time.time()
+    step = "Refreshed Stale Entry" if stale else "Refreshed Ahead of Expiry"
+    server_ip, rtt, visited, response = "N/A", 0, 0, "Response Received"
     try:
-        with socketserver.UDPServer((HOST, PORT), DNSRequestHandler) as server:
+        if RESOLUTION_MODE == "iterative":
+            result, leader = IN_FLIGHT.do(
+                key, lambda: DNSRequestHandler.lookup_iteratively(data, query, key))
+            if result.hops:
+                server_ip, rtt = result.hops[-1].server_ip, result.hops[-1].rtt_ms
+            visited = len(result.hops)
+        else:
+            answer, leader = IN_FLIGHT.do(key, lambda: DNSRequestHandler.forward(data, key))
+            server_ip, rtt, visited = answer.server.ip, answer.rtt * 1000, answer.asked
+        if not leader:
+            return  # A client's lookup got there first and has already been logged
+    except socket.timeout:
+        response = "Refresh Timed Out"
+    except Exception as e:
+        response = f"Error: {e}"
+    QUERY_LOG.log(query_log.QueryRecord(
+        timestamp, query[0], "Prefetch", server_ip, step, response, rtt,
+        (time.time() - start_time) * 1000, "PREFETCH", visited, query[1]))
+
+
+class DNSTCPRequestHandler(DNSRequestHandler):
+    """
+    Handles DNS over TCP (RFC 7766): length-prefixed queries, several per
+    connection, answered in order. Used by clients retrying a truncated answer.
+    """
+
+    def handle(self):
+        self.request.settimeout(TCP_IDLE_TIMEOUT)
+        while True:
+            try:
+                data = dns_wire.recv_tcp_message(self.request)
+            except OSError:
+                break  # Idle timeout or connection reset
+            if data is None:
+                break
+            self.process(data)
+
+    def reply(self, query, response):
+        """Sends the whole response, only dropping OPT for clients without EDNS0."""
+        response = dns_wire.fit_response(response, dns_wire.edns_payload(query), limit=0xFFFF)
+        self.request.sendall(dns_wire.tcp_frame(response))
+
+
+class ThreadingDNSTCPServer(socketserver.ThreadingTCPServer):
+    """TCP listener with one thread per client connection."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class TimestampedUDPServer(socketserver.UDPServer):
+    """
+    UDP server that notes when each datagram was read, for the receive phase,
+    and drops datagrams from clients over their rate before anything else.
+    """
+
+    def get_request(self):
+        data, client_addr = self.socket.recvfrom(self.max_packet_size)
+        return (data, self.socket, time.perf_counter_ns()), client_addr
+
+    def verify_request(self, request, client_address):
+        # Throttled clients cost one dict lookup: no parsing, queueing or upstream work
+        return CLIENT_LIMITER is None or CLIENT_LIMITER.allow(client_address[0])
+
+
+class BoundedThreadPoolUDPServer(TimestampedUDPServer):
+    """
+    UDP server that hands each datagram to a fixed pool of worker threads,
+    so one slow upstream lookup no longer stalls every other client.
+    Datagrams wait in a ratelimit.FairQueue: one queue per client address,
+    served round-robin, so a client sending faster than the workers keep up
+    only lengthens its own queue. At most max_inflight queries are queued;
+    past that the busiest client's newest query is dropped. With fair=False
+    every client shares one FIFO queue instead.
+    """
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS,
+                 max_inflight=DEFAULT_MAX_INFLIGHT, fair=True, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.fair = fair
+        self.queue = ratelimit.FairQueue(max(max_inflight, workers))
+        self.threads = [threading.Thread(target=self.worker_loop, daemon=True,
+                                         name=f"dns-worker-{i}") for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def process_request(self, request, client_address):
+        # Dropped datagrams need no cleanup: shutdown_request does nothing for UDP
+        self.queue.put(client_address[0] if self.fair else None, (request, client_address))
+
+    def worker_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.queue.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CS331 custom DNS resolver")
+    parser.add_argument("--host", default=HOST,
+                        help="address to listen on (the 'dns' host in the topology)")
+    parser.add_argument("--port", type=int, default=PORT, help="port to listen on")
+    parser.add_argument("--mode", choices=("forwarding", "iterative"), default=RESOLUTION_MODE,
+                        help="forward to the upstream resolver, or resolve iteratively "
+                             "from the root servers")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="worker threads serving queries concurrently "
+                             "(0 = original single-threaded server)")
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT,
+                        help="maximum queries queued for the worker threads; past that the "
+                             "client with the most queued loses its newest")
+    parser.add_argument("--queue", choices=("fair", "fifo"), default="fair",
+                        help="serve queued queries round-robin per client, or in arrival order")
+    parser.add_argument("--client-qps", type=float, default=0,
+                        help="queries a second each client IP may send over UDP; the rest "
+                             "are dropped unread (0 = no limit)")
+    parser.add_argument("--client-burst", type=float, default=0,
+                        help="queries a client may send at once above --client-qps "
+                             "(default: one second's worth)")
+    parser.add_argument("--rrl-rps", type=float, default=0,
+                        help="identical responses a second to one client network before "
+                             "response rate limiting drops them (0 = off)")
+    parser.add_argument("--rrl-slip", type=int, default=ratelimit.DEFAULT_SLIP,
+                        help="send every Nth rate-limited response truncated (TC=1) instead "
+                             "of dropping it (0 = drop all)")
+    parser.add_argument("--rrl-prefix-len", type=int, default=ratelimit.DEFAULT_PREFIX_LEN,
+                        help="IPv4 prefix length whose addresses count as one client for "
+                             "response rate limiting")
+    parser.add_argument("--verbosity", type=int, default=query_log.DETAILED,
+                        choices=(query_log.QUIET, query_log.SUMMARY, query_log.DETAILED),
+                        help="console output per query: 0 = none, 1 = one line, "
+                             "2 = full Part D breakdown")
+    parser.add_argument("--log-batch-size", type=int, default=query_log.DEFAULT_BATCH_SIZE,
+                        help="log records buffered before they are written to disk")
+    parser.add_argument("--log-flush-interval", type=float,
+                        default=query_log.DEFAULT_FLUSH_INTERVAL,
+                        help="seconds between log flushes when the batch is not full")
+    parser.add_argument("--log-file", default=LOG_FILE, help="CSV query log")
+    parser.add_argument("--log-format", choices=query_log.LOG_FORMATS, default=query_log.CSV,
+                        help="write the CSV --log-file, typed binary segments in --log-dir, "
+                             "or both")
+    parser.add_argument("--log-dir", default=LOG_DIR,
+                        help="directory of the binary log segments")
+    parser.add_argument("--log-segment-mb", type=float,
+                        default=log_segments.DEFAULT_SEGMENT_BYTES / (1024 * 1024),
+                        help="size at which a binary log segment is rotated")
+    parser.add_argument("--cache-store", choices=sorted(CACHE_STORES), default="lru",
+                        help="how answers are kept: one object per name with exact LRU, or "
+                             "packed into slabs (about a quarter of the memory per entry)")
+    parser.add_argument("--cache-entries", type=int, default=CACHE_MAX_ENTRIES,
+                        help="most answers cached at once")
+    parser.add_argument("--cache-mb", type=float, default=CACHE_MAX_BYTES / (1024 * 1024),
+                        help="memory for cached answers, in MB")
+    parser.add_argument("--negative-ttl-max", type=int, default=dns_cache.DEFAULT_MAX_NEGATIVE_TTL,
+                        help="upper bound in seconds for caching NXDOMAIN/NODATA answers")
+    parser.add_argument("--servfail-ttl", type=int, default=dns_cache.DEFAULT_FAILURE_TTL,
+                        help="seconds to cache upstream failures and timeouts (0 = never)")
+    parser.add_argument("--upstream", action="append", metavar="IP[:PORT]",
+                        help="upstream resolver to forward to; repeat to race several "
+                             f"(default: {', '.join(UPSTREAM_DNS_SERVERS)})")
+    parser.add_argument("--upstream-timeout", type=float, default=UPSTREAM_TIMEOUT,
+                        help="seconds to wait for any upstream before giving up")
+    parser.add_argument("--prefetch-min-hits", type=int,
+                        default=dns_cache.DEFAULT_PREFETCH_MIN_HITS,
+                        help="hits after which a cached name is refreshed before it expires "
+                             "(0 = no prefetch)")
+    parser.add_argument("--prefetch-threshold", type=float,
+                        default=dns_cache.DEFAULT_PREFETCH_THRESHOLD,
+                        help="refresh a hot entry once this fraction of its TTL is left")
+    parser.add_argument("--serve-stale", type=int, default=dns_cache.DEFAULT_STALE_WINDOW,
+                        metavar="SECONDS",
+                        help="keep answering with expired entries for this long while they "
+                             "are refreshed (RFC 8767; 0 = off)")
+    parser.add_argument("--snapshot-file", default=SNAPSHOT_FILE,
+                        help="file the cache is saved to and warm-started from "
+                             "('' = no snapshots)")
+    parser.add_argument("--snapshot-interval", type=float, default=SNAPSHOT_INTERVAL,
+                        help="seconds between cache snapshots (0 = only on shutdown)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes sharing the port with SO_REUSEPORT, "
+                             "to use more than one core")
+    parser.add_argument("--shared-cache-slots", type=int, default=shared_cache.DEFAULT_SLOTS,
+                        help="answers kept in the cache shared by worker processes")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="seconds between combined worker stats reports "
+                             "(0 = only at shutdown)")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="address of the Prometheus /metrics HTTP endpoint (local only by "
+                             "default; e.g. 0.0.0.0 to let other hosts scrape it)")
+    parser.add_argument("--metrics-port", type=int, default=metrics.DEFAULT_METRICS_PORT,
+                        help="port of the /metrics endpoint (0 = off); worker process i "
+                             "uses port + i")
+    parser.add_argument("--no-tcp", action="store_true",
+                        help="do not listen for DNS over TCP or retry truncated answers over TCP")
+    parser.add_argument("--phase-timing", action="store_true",
+                        help="time every query's phases from the start (SIGUSR1 toggles "
+                             "it while running)")
+    parser.add_argument("--upstream-sockets", type=int, default=upstream.DEFAULT_POOL_SIZE,
+                        help="UDP sockets shared for upstream queries, each on its own "
+                             "random source port")
+    parser.add_argument("--upstream-rotate-after", type=int,
+                        default=upstream.DEFAULT_ROTATE_AFTER,
+                        help="queries sent from an upstream socket before it is replaced by "
+                             "one on a new random port (1 = a new port per query)")
+    return parser.parse_args()
+
+
+def save_snapshot():
+    """Writes the cache and delegation state to SNAPSHOT_FILE."""
+    delegations = ITERATIVE_RESOLVER.delegations if ITERATIVE_RESOLVER else None
+    try:
+        # With several workers, SHARED_CACHE holds what the others cached too
+        return cache_snapshot.save(SNAPSHOT_FILE, DNS_CACHE, delegations, SHARED_CACHE)
+    except OSError as e:
+        print(f"[Resolver] Could not save cache snapshot {SNAPSHOT_FILE}: {e}")
+        return 0, 0
+
+
+def load_snapshot():
+    """Warm-starts the cache and delegations from SNAPSHOT_FILE, if there is one."""
+    if not os.path.exists(SNAPSHOT_FILE):
+        return
+    delegations = ITERATIVE_RESOLVER.delegations if ITERATIVE_RESOLVER else None
+    start = time.perf_counter()
+    try:
+        entries, zones = cache_snapshot.load(SNAPSHOT_FILE, DNS_CACHE, delegations)
+    except (OSError, ValueError, struct.error, IndexError, UnicodeDecodeError) as e:
+        print(f"[Resolver] Ignoring unreadable cache snapshot {SNAPSHOT_FILE}: {e}")
+        return
+    print(f"[Resolver] Warm start: {entries} cached answers and {zones} zone cuts "
+          f"loaded from {SNAPSHOT_FILE} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def snapshot_loop(interval):
+    while True:
+        time.sleep(interval)
+        save_snapshot()
+
+
+def _exit_on_signal(signum, frame):
+    # Turn SIGTERM/SIGHUP (e.g. Mininet stopping the host) into a normal exit
+    # so the shutdown snapshot and log flush still happen
+    raise SystemExit(0)
+
+
+def _toggle_phase_timing(signum, frame):
+    enabled = METRICS.phases.toggle()
+    print(f"[Resolver] Per-phase query timing {'on' if enabled else 'off'}", flush=True)
+
+
+def _bind(server, reuse_port):
+    """Binds a server built with bind_and_activate=False, sharing the port if asked."""
+    if reuse_port:
+        # Every worker process binds the same address; the kernel spreads clients over them
+        server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        server.server_bind()
+        server.server_activate()
+    except BaseException:
+        server.server_close()
+        raise
+    return server
+
+
+def create_tcp_server(server_address, reuse_port=False):
+    """Builds the TCP listener that serves alongside the UDP server."""
+    return _bind(ThreadingDNSTCPServer(server_address, DNSTCPRequestHandler,
+                                       bind_and_activate=False), reuse_port)
+
+
+def create_server(server_address, args, reuse_port=False):
+    """Builds the UDP server selected on the command line."""
+    global FAIR_QUEUE
+    if args.workers <= 0:
+        server = TimestampedUDPServer(server_address, DNSRequestHandler,
+                                      bind_and_activate=False)
+    else:
+        server = BoundedThreadPoolUDPServer(server_address, DNSRequestHandler,
+                                            workers=args.workers,
+                                            max_inflight=args.max_inflight,
+                                            fair=args.queue == "fair",
+                                            bind_and_activate=False)
+        FAIR_QUEUE = server.queue
+    return _bind(server, reuse_port)
+
+
+def configure(args, worker=None):
+    """
+    Creates the upstream, cache and logging state from the command line.
+    worker is the worker number when running as one of several processes.
+    """
+    global UPSTREAM_POOL, UPSTREAM_DNS_SERVERS, UPSTREAM_TIMEOUT, UPSTREAM_TCP, UPSTREAMS
+    global RESOLUTION_MODE, ITERATIVE_RESOLVER, SNAPSHOT_FILE, QUERY_LOG, LOG_FILE, LOG_DIR
+    global DNS_CACHE, CLIENT_LIMITER, RRL
+    UPSTREAM_POOL = upstream.UpstreamPool(size=args.upstream_sockets,
+                                          rotate_after=args.upstream_rotate_after)
+    UPSTREAM_DNS_SERVERS = args.upstream or UPSTREAM_DNS_SERVERS
+    UPSTREAM_TIMEOUT = args.upstream_timeout
+    UPSTREAM_TCP = None if args.no_tcp else upstream.UpstreamTCPPool()
+    UPSTREAMS = upstream.UpstreamSet(UPSTREAM_POOL, [
+        upstream.parse_server(server, UPSTREAM_DNS_PORT) for server in UPSTREAM_DNS_SERVERS],
+        tcp=UPSTREAM_TCP)
+    RESOLUTION_MODE = args.mode
+    if args.client_qps > 0:
+        CLIENT_LIMITER = ratelimit.TokenBuckets(args.client_qps, args.client_burst)
+    if args.rrl_rps > 0:
+        RRL = ratelimit.ResponseRateLimiter(args.rrl_rps, slip=args.rrl_slip,
+                                            prefix_len=args.rrl_prefix_len)
+    METRICS.phases.enabled = args.phase_timing
+    signal.signal(signal.SIGUSR1, _toggle_phase_timing)
+    DNS_CACHE = CACHE_STORES[args.cache_store](max_entries=args.cache_entries,
+                                               max_bytes=int(args.cache_mb * 1024 * 1024))
+    DNS_CACHE.max_negative_ttl = args.negative_ttl_max
+    DNS_CACHE.failure_ttl = args.servfail_ttl
+    DNS_CACHE.prefetch_min_hits = args.prefetch_min_hits
+    DNS_CACHE.prefetch_threshold = args.prefetch_threshold
+    DNS_CACHE.stale_window = args.serve_stale
+    DNS_CACHE.shared = SHARED_CACHE
+    ITERATIVE_RESOLVER = iterative.IterativeResolver(UPSTREAM_POOL, tcp=UPSTREAM_TCP)
+    SNAPSHOT_FILE = args.snapshot_file
+    if SNAPSHOT_FILE:
+        load_snapshot()
+        # With several workers only the first one writes the snapshot
+        if args.snapshot_interval > 0 and not worker:
+            threading.Thread(target=snapshot_loop, args=(args.snapshot_interval,),
+                             daemon=True, name="cache-snapshot").start()
+    LOG_FILE = args.log_file
+    LOG_DIR = args.log_dir
+    try:
+        QUERY_LOG = query_log.QueryLogger(LOG_FILE, verbosity=args.verbosity,
+                                          batch_size=args.log_batch_size,
+                                          flush_interval=args.log_flush_interval,
+                                          truncate=worker is None,
+                                          log_format=args.log_format, segment_dir=LOG_DIR,
+                                          segment_bytes=int(args.log_segment_mb * 1024 * 1024))
+    except Exception as e:
+        print(f"[Resolver] CRITICAL: Could not write to log file {LOG_FILE}: {e}")
+        raise SystemExit(1)
+
+
+def throttle_stats():
+    """Queries dropped (or answered truncated) to protect the other clients, by reason."""
+    return {
+        "client_rate": CLIENT_LIMITER.limited if CLIENT_LIMITER else 0,
+        "queue_full": FAIR_QUEUE.dropped if FAIR_QUEUE else 0,
+        "rrl_dropped": RRL.dropped if RRL else 0,
+        "rrl_slipped": RRL.slipped if RRL else 0,
+    }
+
+
+def register_collectors():
+    """Exposes cache, upstream and logging state on the metrics page."""
+    METRICS.collectors.update({
+        "dns_cache_lookups_total": ("counter", "Cache lookups by result.", lambda: [
+            ('result="hit"', DNS_CACHE.hits),
+            ('result="negative_hit"', DNS_CACHE.negative_hits),
+            ('result="stale_hit"', DNS_CACHE.stale_hits),
+            ('result="shared_hit"', DNS_CACHE.shared_hits),
+            ('result="miss"', DNS_CACHE.misses)]),
+        "dns_cache_entries": ("gauge", "Answers currently cached.",
+                              lambda: [("", len(DNS_CACHE))]),
+        "dns_cache_bytes": ("gauge", "Bytes used by cached answers.",
+                            lambda: [("", DNS_CACHE.bytes_used)]),
+        "dns_cache_bytes_per_entry": ("gauge", "Memory held by the cache per cached answer.",
+                                      lambda: [("", f"{DNS_CACHE.bytes_per_entry():.1f}")]),
+        "dns_cache_refreshes_total": ("counter", "Background prefetch/stale refreshes started.",
+                                      lambda: [("", DNS_CACHE.refreshes)]),
+        "dns_coalesced_total": ("counter", "Queries that joined an identical in-flight lookup.",
+                                lambda: [("", IN_FLIGHT.coalesced)]),
+        "dns_upstream_srtt_seconds": ("gauge", "Smoothed RTT per upstream.", lambda: [
+            (f'upstream="{server.ip}"', f"{server.srtt or 0:.6f}")
+            for server in UPSTREAMS.servers]),
+        "dns_upstream_loss_ratio": ("gauge", "Estimated share of queries an upstream missed.",
+                                    lambda: [(f'upstream="{server.ip}"', f"{server.loss:.4f}")
+                                             for server in UPSTREAMS.servers]),
+        "dns_upstream_hedged_total": ("counter", "Queries also sent to a second upstream.",
+                                      lambda: [("", UPSTREAMS.hedged)]),
+        "dns_log_dropped_total": ("counter", "Log records dropped because the queue was full.",
+                                  lambda: [("", QUERY_LOG.dropped)]),
+        "dns_throttled_total": ("counter", "Queries dropped or truncated by rate limiting "
+                                           "and the fair queue.", lambda: [
+            (f'reason="{reason}"', count) for reason, count in throttle_stats().items()]),
+        "dns_queue_depth": ("gauge", "Queries waiting for a worker thread.",
+                            lambda: [("", len(FAIR_QUEUE) if FAIR_QUEUE else 0)]),
+        "dns_queue_clients": ("gauge", "Clients with queries waiting for a worker thread.",
+                              lambda: [("", FAIR_QUEUE.clients if FAIR_QUEUE else 0)]),
+    })
+
+
+def serve(args, address, worker=None):
+    """Serves UDP (and TCP) on address until interrupted, then shuts down cleanly."""
+    reuse_port = worker is not None
+    try:
+        if args.metrics_port:
+            register_collectors()
+            metrics_address = (args.metrics_host, args.metrics_port + (worker or 0))
+            metrics.serve_metrics(METRICS, metrics_address)
+            print(f"{'[Resolver]' if worker is None else f'[Resolver {worker}]'} Metrics on "
+                  f"http://{metrics_address[0]}:{metrics_address[1]}/metrics")
+        if not args.no_tcp:
+            tcp_server = create_tcp_server(address, reuse_port)
+            threading.Thread(target=tcp_server.serve_forever, daemon=True,
+                             name="dns-tcp").start()
+            if not worker:
+                print(f"Also listening for DNS over TCP on {address[0]}:{address[1]}")
+        with create_server(address, args, reuse_port) as server:
             server.serve_forever()
     except Exception as e:
         print(f"!!! [Resolver] FAILED TO START: {e} !!!")
-        print("!!! Did you forget to use 'sudo' to run the script? !!!")
\ No newline at end of file
+        print("!!! Did you forget to use 'sudo' to run the script? !!!")
+    finally:
+        prefix = "[Resolver]" if worker is None else f"[Resolver {worker}]"
+        if RESOLUTION_MODE == "forwarding":
+            print(f"{prefix} Upstreams ({UPSTREAMS.hedged} queries hedged, "
+                  f"{UPSTREAMS.hedge_wins} won by the hedge):")
+            for line in UPSTREAMS.stats(UPSTREAM_TIMEOUT):
+                print(f"{prefix}   {line}")
+        print(f"{prefix} Cache: {len(DNS_CACHE)} answers, "
+              f"{DNS_CACHE.footprint() / (1024 * 1024):.1f} MB, "
+              f"{DNS_CACHE.bytes_per_entry():.0f} bytes per entry")
+        throttled = throttle_stats()
+        if CLIENT_LIMITER or RRL or any(throttled.values()):
+            print(f"{prefix} Overload: {throttled['client_rate']} queries over the client "
+                  f"rate, {throttled['queue_full']} dropped from the full queue, RRL dropped "
+                  f"{throttled['rrl_dropped']} and truncated {throttled['rrl_slipped']} "
+                  f"responses")
+        phase_lines = METRICS.phases.report()
+        if phase_lines:
+            print(f"{prefix} Time per query phase:")
+            for line in phase_lines:
+                print(f"{prefix}   {line}")
+        if UPSTREAM_TCP is not None:
+            UPSTREAM_TCP.close()
+        if SNAPSHOT_FILE and not worker:
+            entries, zones = save_snapshot()
+            if entries or zones:
+                print(f"{prefix} Saved {entries} cached answers and {zones} zone cuts "
+                      f"to {SNAPSHOT_FILE}")
+            else:
+                print(f"{prefix} Nothing cached; {SNAPSHOT_FILE} left as it was")
+        # Flush any records still queued for the log file
+        QUERY_LOG.close()
+
+
+# --- Multi-process mode ---
+
+def publish_stats(worker):
+    """Copies this worker's counters into its row of WORKER_STATS."""
+    WORKER_STATS.publish(worker, {
+        "queries": DNS_CACHE.hits + DNS_CACHE.negative_hits + DNS_CACHE.stale_hits
+                   + DNS_CACHE.misses,
+        "hits": DNS_CACHE.hits,
+        "negative_hits": DNS_CACHE.negative_hits,
+        "stale_hits": DNS_CACHE.stale_hits,
+        "misses": DNS_CACHE.misses,
+        "shared_hits": DNS_CACHE.shared_hits,
+        "refreshes": DNS_CACHE.refreshes,
+        "coalesced": IN_FLIGHT.coalesced,
+        "hedged": UPSTREAMS.hedged,
+        "log_dropped": QUERY_LOG.dropped,
+        "throttled": sum(throttle_stats().values()),
+    })
+
+
+def stats_loop(worker):
+    while True:
+        time.sleep(STATS_PUBLISH_INTERVAL)
+        publish_stats(worker)
+
+
+def run_worker(args, address, worker):
+    """Body of one forked worker process."""
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    signal.signal(signal.SIGHUP, _exit_on_signal)
+    configure(args, worker)
+    threading.Thread(target=stats_loop, args=(worker,), daemon=True,
+                     name="worker-stats").start()
+    try:
+        serve(args, address, worker)
+    finally:
+        publish_stats(worker)
+
+
+def run_workers(args, address):
+    """
+    Forks args.processes workers that all bind address with SO_REUSEPORT,
+    sharing answers through SHARED_CACHE, and waits for them to exit.
+    Prints the workers' combined stats every --stats-interval seconds and
+    at the end.
+    """
+    global SHARED_CACHE, WORKER_STATS
+    SHARED_CACHE = shared_cache.SharedAnswerTable(slots=args.shared_cache_slots)
+    WORKER_STATS = shared_cache.WorkerStats(args.processes)
+    query_log.start_log(args.log_file, args.log_format, args.log_dir)
+    sys.stdout.flush()  # Or the children would print it again
+
+    pids = []
+    for worker in range(args.processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(args, address, worker)
+            except (SystemExit, KeyboardInterrupt):
+                pass
+            except Exception:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                os._exit(0)
+        pids.append(pid)
+    print(f"Started {len(pids)} worker processes: {', '.join(map(str, pids))}")
+
+    def forward(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(signum, frame):
+        forward(signal.SIGTERM, frame)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, forward)
+    running = set(pids)
+    next_report = time.monotonic() + args.stats_interval
+    while running:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            running.discard(pid)
+            continue
+        time.sleep(0.2)
+        if args.stats_interval > 0 and time.monotonic() >= next_report:
+            next_report += args.stats_interval
+            for line in WORKER_STATS.report():
+                print(f"[Resolver] {line}")
+            sys.stdout.flush()
+    print("[Resolver] All workers stopped. Combined stats:")
+    for line in WORKER_STATS.report():
+        print(f"[Resolver] {line}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"Custom DNS Resolver starting on {args.host}:{args.port} ({args.mode} mode)...")
+    if args.processes > 1:
+        print(f"Running {args.processes} worker processes sharing the port (SO_REUSEPORT)")
+    if args.workers > 0:
+        print(f"Serving with {args.workers} worker threads"
+              f"{' per process' if args.processes > 1 else ''}, "
+              f"at most {args.max_inflight} queries queued ({args.queue})")
+    if args.client_qps > 0:
+        print(f"Limiting each client to {args.client_qps:g} queries/sec")
+    if args.rrl_rps > 0:
+        print(f"Response rate limiting at {args.rrl_rps:g} identical responses/sec "
+              f"per /{args.rrl_prefix_len}")
+    if args.mode == "forwarding":
+        print(f"Forwarding to {', '.join(args.upstream or UPSTREAM_DNS_SERVERS)}")
+    if args.log_format != query_log.BINARY:
+        print(f"Logging data to {args.log_file}")
+    if args.log_format != query_log.CSV:
+        print(f"Logging typed binary records to {args.log_dir}/")
+
+    if args.processes > 1:
+        run_workers(args, (args.host, args.port))
+    else:
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+        signal.signal(signal.SIGHUP, _exit_on_signal)
+        configure(args)
+        serve(args, (args.host, args.port))
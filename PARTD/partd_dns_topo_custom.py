@@ -2,92 +2,58 @@
 """
 CS331 Assignment 2: DNS Query Resolution Topology
 THIS FILE IS CONFIGURED FOR PART C & D (Custom DNS Resolver)
+The hosts, links and resolver replicas come from a topology config
+(topologies/partd.json by default, see topo_builder.py).
 """
 
-from mininet.net import Mininet
-from mininet.node import Host, OVSKernelSwitch
+import argparse
+import os
+import sys
+
 from mininet.cli import CLI
-from mininet.link import TCLink
 from mininet.log import setLogLevel, info
 
-def create_topology():
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import topo_builder
+
+DEFAULT_TOPOLOGY = 'partd.json'
+
+def start_network(topology=DEFAULT_TOPOLOGY, resolver_processes=1, resolver_args=''):
+    """
+    Builds and starts the topology with the resolver running on every resolver host.
+    resolver_processes > 1 runs each resolver as that many SO_REUSEPORT
+    worker processes so it can use more than one core.
+    Returns (net, plan, resolver pids); pass net and the pids to stop_network.
+    """
+    config = topo_builder.load_config(topology)
+    resolvers = config.setdefault('resolvers', {})
+    command = resolvers.get('command') or 'sudo python3 partd_custom_resolver.py --host {ip}'
+    resolvers['command'] = f'{command} --processes {resolver_processes} {resolver_args}'.strip()
+    resolvers['workdir'] = resolvers.get('workdir') or 'PARTD'
+    plan = topo_builder.plan(config)
+    net = topo_builder.build(plan)
+    pids = topo_builder.start(net, plan)
+    return net, plan, pids
+
+def stop_network(net, pids):
+    """Stops the resolvers (so they save their cache snapshot) and the network."""
+    topo_builder.stop(net, pids)
+
+def create_topology(resolver_processes=1, topology=DEFAULT_TOPOLOGY):
     """Creates and configures the DNS resolver topology."""
-
-    net = Mininet(
-        controller=None,  # No controller needed
-        switch=OVSKernelSwitch,
-        host=Host,
-        link=TCLink
-    )
-
-    info('*** Adding Hosts\n')
-    h1 = net.addHost('h1', ip='10.0.0.1/24')
-    h2 = net.addHost('h2', ip='10.0.0.2/24')
-    h3 = net.addHost('h3', ip='10.0.0.3/24')
-    h4 = net.addHost('h4', ip='10.0.0.4/24')
-    dns = net.addHost('dns', ip='10.0.0.5/24') # Your custom resolver host
-
-    info('*** Adding Switches\n')
-    # Set failMode to 'standalone' to force L2 learning
-    s1 = net.addSwitch('s1', failMode='standalone')
-    s2 = net.addSwitch('s2', failMode='standalone')
-    s3 = net.addSwitch('s3', failMode='standalone')
-    s4 = net.addSwitch('s4', failMode='standalone')
-
-    info('*** Adding NAT for internet connectivity\n')
-    # connect=False disables the automatic link
-    # Make sure to find your real internet-facing interface (e.g., 'eth0', 'enp0s3')
-    # and add it if 'ping 8.8.8.8' fails for the 'dns' host.
-    # Example: nat = net.addNAT(..., nat_iface='enp0s3')
-    nat = net.addNAT(ip='10.0.0.254/24', inNamespace=False, connect=False)
-    
-    info('*** Adding Links (with BW and Delay)\n')
-    # Manually link NAT to a switch
-    net.addLink(nat, s1) 
-    
-    # Host-to-Switch links
-    net.addLink(h1, s1, bw=100, delay='2ms')
-    net.addLink(h2, s2, bw=100, delay='2ms')
-    net.addLink(h3, s3, bw=100, delay='2ms')
-    net.addLink(h4, s4, bw=100, delay='2ms')
-    net.addLink(dns, s2, bw=100, delay='1ms')
-
-    # Switch-to-Switch links
-    net.addLink(s1, s2, bw=100, delay='5ms')
-    net.addLink(s2, s3, bw=100, delay='8ms')
-    net.addLink(s3, s4, bw=100, delay='10ms')
-
-    info('*** Starting network\n')
-    net.start()
-
-    info('*** Setting default internet route for hosts\n')
-    # Tell all hosts to use the NAT as their gateway
-    for host in [h1, h2, h3, h4, dns]:
-        host.cmd(f'ip route add default via 10.0.0.254')
-
-
-    # --- Configuration for Part C & D ---
-    # This section is now permanently active in this file
-    
-    info('*** Configuring Host DNS settings (for Part C)\n')
-    for host in [h1, h2, h3, h4]:
-        # Set the DNS server to our custom resolver
-        host.cmd(f'echo "nameserver 10.0.0.5" > /etc/resolv.conf')
-        info(f'Set DNS for {host.name} to 10.0.0.5\n')
-    
-    info('*** Starting Custom DNS Resolver on 10.0.0.5 (for Part D)\n')
-    # This command runs your custom_resolver.py on the 'dns' host
-    # We use 'sudo' to grant permission to bind to port 53.
-    # Make sure your resolver filename (e.g., 'custom_resolver.py') is exact!
-    dns.cmd('sudo python3 partd_custom_resolver.py &')
-    info('Resolver script initiated.\n')
-
-    info('*** Running CLI\n')
-    CLI(net)
-
-    info('*** Stopping network\n')
-    net.stop()
+    net, plan, pids = start_network(topology, resolver_processes)
+    try:
+        info('*** Running CLI\n')
+        CLI(net)
+    finally:
+        stop_network(net, pids)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Part C & D DNS topology")
+    parser.add_argument('--resolver-processes', type=int, default=1,
+                        help='worker processes for the resolver on the dns host')
+    parser.add_argument('--topology', default=DEFAULT_TOPOLOGY,
+                        help='topology config (default: topologies/partd.json)')
+    args = parser.parse_args()
     setLogLevel('info')
-    create_topology()
\ No newline at end of file
+    create_topology(args.resolver_processes, args.topology)
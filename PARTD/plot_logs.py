@@ -1,22 +1,67 @@
 #!/usr/bin/python3
 """
 CS331 Assignment 2: Plotting Script
-Reads 'dns_log.csv' and generates plots for Part D.
+Reads 'dns_log.csv' (or the binary log directory 'dns_log.d') and generates
+plots for Part D.
+
+With --analyze it instead works on every query of one or more runs (resolver
+logs, or per-query results saved by Benchmark.py --output): latency CDFs and
+percentiles by cache status, mode and upstream, latency and hit rate over
+time, and the servers-visited distribution, with the runs side by side.
 """
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+import log_segments
+
 LOG_FILE = "dns_log.csv"
+LOG_DIR = log_segments.DEFAULT_DIR
 NUM_URLS_TO_PLOT = 10
+PLOT_COLUMNS = ['timestamp', 'domain', 'mode', 'total_time_ms', 'servers_visited']
+
+
+def read_binary_log(path, columns=None, **filters):
+    """
+    Loads the binary log written with --log-format binary into a DataFrame.
+    Only the named columns are decoded and the filters (see
+    log_segments.LogScan) are applied block by block while reading; string
+    columns come back as categoricals, so millions of rows stay compact.
+    """
+    scan = log_segments.LogScan(path, columns, **filters)
+    data = scan.read()
+    frame = {}
+    for name, values in data.items():
+        if log_segments.COLUMN_TYPES[name] == "S":
+            frame[name] = pd.Categorical.from_codes(values, categories=scan.categories[name])
+        else:
+            frame[name] = np.asarray(values)
+    return pd.DataFrame(frame, columns=scan.columns)
 
-def create_plots():
-    print(f"Reading log data from '{LOG_FILE}'...")
+
+def read_log(path):
+    """The per-query plot columns of the CSV or binary log, without prefetch rows."""
+    # Background cache refreshes are logged with mode "Prefetch"; they are not
+    # client queries, so they are left out of the per-query plots.
+    if os.path.isdir(path):
+        df = read_binary_log(path, PLOT_COLUMNS, exclude={'mode': ['Prefetch']})
+        if df.empty:
+            raise pd.errors.EmptyDataError(f"no log records in {path}")
+        return df
+    df = pd.read_csv(path, usecols=lambda column: column in PLOT_COLUMNS)
+    return df[df['mode'] != 'Prefetch']
+
+
+def create_plots(log_file=LOG_FILE):
+    print(f"Reading log data from '{log_file}'...")
     try:
-        # Read the CSV log file
-        df = pd.read_csv(LOG_FILE)
+        df = read_log(log_file)
     except FileNotFoundError:
         print(f"\n--- ERROR ---")
-        print(f"Log file '{LOG_FILE}' not found.")
+        print(f"Log file '{log_file}' not found.")
         print("Please run the benchmark first to generate the log:")
         print("1. sudo python3 dns_topo_custom.py")
         print("2. mininet> h1 python3 Benchmark.py PCAP_1_H1.pcap")
@@ -24,13 +69,18 @@ def create_plots():
         return
     except pd.errors.EmptyDataError:
         print(f"\n--- ERROR ---")
-        print(f"Log file '{LOG_FILE}' is empty. Did the benchmark fail?")
+        print(f"Log file '{log_file}' is empty. Did the benchmark fail?")
         return
     except Exception as e:
         print(f"Error reading log file: {e}")
         return
 
     # --- Data Preparation ---
+    # In iterative mode every server contacted is logged as its own row. Keep
+    # the last row of each query: it carries the query's total time and the
+    # total number of servers visited.
+    df = df.groupby(['timestamp', 'domain'], sort=False, observed=True).tail(1)
+
     # We only want to plot the first 10 URLs from PCAP_1_H1
     # We find the first 10 *unique* domains that were logged
     
@@ -43,6 +93,7 @@ def create_plots():
 
     # Filter the dataframe to only include the first logged entry for each of these 10 domains
     plot_data = df[df['domain'].isin(domains_to_plot)].drop_duplicates(subset='domain', keep='first')
+    plot_data = plot_data.astype({'domain': str})
 
     print(f"\nPlotting data for the first {len(plot_data)} unique domains...")
     
@@ -82,5 +133,253 @@ def create_plots():
     print(f"Servers visited plot saved to '{servers_plot_file}'")
     plt.close()
 
+
+# --- Analysis mode (--analyze) ---
+
+ANALYSIS_COLUMNS = ['timestamp', 'domain', 'mode', 'server_ip', 'response', 'total_time_ms',
+                    'cache_status', 'servers_visited']
+PERCENTILES = [50, 90, 99, 99.9]
+CDF_POINTS = np.linspace(0, 1, 1001)   # CDFs are drawn from 1001 quantiles, whatever the row count
+HIT_STATUSES = ['HIT', 'NEGATIVE HIT', 'STALE HIT', 'SERVFAIL HIT', 'COALESCED']
+SPLITS = ['cache_status', 'mode', 'upstream']
+DEFAULT_WINDOW = 10   # seconds per point of the over-time plots
+# Responses logged when a query got no answer (its total_time_ms is then 0, not a latency)
+FAILED_RESPONSE = r'Timed Out$|^Error:'
+
+
+def load_run(path):
+    """
+    One run as one row per client query: time_s (seconds since its first
+    query), latency_ms (NaN if it timed out) and, for resolver logs,
+    cache_status, mode, upstream and servers_visited. path is a resolver log
+    (CSV file or binary directory) or a file saved by Benchmark.py --output.
+    """
+    if os.path.isdir(path):
+        df = read_binary_log(path, ANALYSIS_COLUMNS, exclude={'mode': ['Prefetch']})
+        seconds = df['timestamp']
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        if 'latency_ms' in header:
+            df = pd.read_csv(path, usecols=['sent_at_s', 'latency_ms'])
+            return pd.DataFrame({'time_s': df['sent_at_s'] - df['sent_at_s'].min(),
+                                 'latency_ms': df['latency_ms']})
+        df = pd.read_csv(path, usecols=ANALYSIS_COLUMNS,
+                         dtype={'mode': 'category', 'server_ip': 'category',
+                                'response': 'category', 'cache_status': 'category'})
+        df = df[df['mode'] != 'Prefetch']
+        seconds = pd.to_datetime(df['timestamp'])
+        seconds = (seconds - seconds.min()).dt.total_seconds()
+    # Iterative queries have a row per server contacted; the last one has the totals
+    last = ~df.duplicated(['timestamp', 'domain'], keep='last')
+    df, seconds = df[last], seconds[last]
+    failed = df['response'].astype(str).str.contains(FAILED_RESPONSE)
+    return pd.DataFrame({
+        'time_s': seconds - seconds.min(),
+        'latency_ms': df['total_time_ms'].mask(failed),
+        'cache_status': df['cache_status'],
+        'mode': df['mode'],
+        'upstream': df['server_ip'],
+        'servers_visited': df['servers_visited'],
+    })
+
+
+def _groups(df, by):
+    """(value, latencies) pairs of df split by column by, or one 'all' group."""
+    if by is None:
+        return [('all', df['latency_ms'])]
+    return df.groupby(by, observed=True)['latency_ms']
+
+
+def percentile_table(runs, by=None):
+    """Count, timeouts, mean, percentiles and max of latency per run and group."""
+    tables = []
+    for label, df in runs.items():
+        if by is not None and by not in df:
+            continue
+        key = df[by] if by is not None else pd.Series('all', index=df.index)
+        grouped = df['latency_ms'].groupby(key, observed=True)
+        table = grouped.quantile([p / 100 for p in PERCENTILES]).unstack()
+        table.columns = [f"p{p:g}_ms" for p in PERCENTILES]
+        table.insert(0, 'mean_ms', grouped.mean())
+        table.insert(0, 'timeouts', grouped.size() - grouped.count())
+        table.insert(0, 'queries', grouped.size())
+        table['max_ms'] = grouped.max()
+        table.index.name = 'group'
+        tables.append(table.reset_index().assign(run=label, split=by or 'all'))
+    if not tables:
+        return pd.DataFrame()
+    table = pd.concat(tables, ignore_index=True)
+    return table[['run', 'split', 'group'] + [c for c in table.columns
+                                             if c not in ('run', 'split', 'group')]]
+
+
+def compare_runs(runs):
+    """Overall latency and hit rate per run, with percentile changes against the first."""
+    table = percentile_table(runs).set_index('run').drop(columns=['split', 'group'])
+    table['hit_rate'] = [df['cache_status'].isin(HIT_STATUSES).mean()
+                         if 'cache_status' in df else np.nan for df in runs.values()]
+    baseline = table.iloc[0]
+    for p in PERCENTILES:
+        column = f"p{p:g}_ms"
+        table[f"p{p:g}_vs_{table.index[0]}"] = table[column] / baseline[column]
+    return table
+
+
+def plot_cdfs(runs, by, path):
+    """Latency CDF (log x axis) of every run, one line per group."""
+    fig, ax = plt.subplots(figsize=(11, 6))
+    for label, df in runs.items():
+        if by is not None and by not in df:
+            continue
+        for value, latencies in _groups(df, by):
+            latencies = latencies.dropna().to_numpy()
+            if not len(latencies):
+                continue
+            name = f"{label}: {value}" if len(runs) > 1 else str(value)
+            ax.plot(np.quantile(latencies, CDF_POINTS), CDF_POINTS,
+                    label=f"{name} (n={len(latencies)})")
+    ax.set_xscale('log')
+    ax.set_xlabel('Latency (ms, log scale)')
+    ax.set_ylabel('Fraction of queries')
+    ax.set_title(f"Latency CDF by {by}" if by else 'Latency CDF')
+    ax.grid(True, which='both', alpha=0.3)
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def plot_latency_over_time(runs, window, path):
+    """p50 (solid) and p99 (dashed) latency per time window for every run."""
+    fig, ax = plt.subplots(figsize=(11, 6))
+    for label, df in runs.items():
+        bucket = (df['time_s'] // window) * window
+        quantiles = df['latency_ms'].groupby(bucket).quantile([0.5, 0.99]).unstack()
+        line, = ax.plot(quantiles.index, quantiles[0.5], label=f"{label} p50")
+        ax.plot(quantiles.index, quantiles[0.99], linestyle='--', color=line.get_color(),
+                label=f"{label} p99")
+    ax.set_yscale('log')
+    ax.set_xlabel('Time since first query (s)')
+    ax.set_ylabel('Latency (ms, log scale)')
+    ax.set_title(f"Latency over time ({window:g} s windows)")
+    ax.grid(True, which='both', alpha=0.3)
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def plot_hit_rate(runs, window, path):
+    """Cache hit rate per time window and cumulatively over the queries of each run."""
+    runs = {label: df for label, df in runs.items() if 'cache_status' in df}
+    if not runs:
+        return False
+    fig, (per_window, cumulative) = plt.subplots(1, 2, figsize=(14, 6))
+    for label, df in runs.items():
+        hit = df['cache_status'].isin(HIT_STATUSES).astype(float)
+        rate = hit.groupby((df['time_s'] // window) * window).mean()
+        per_window.plot(rate.index, rate.to_numpy(), label=label)
+        cumulative.plot(np.arange(1, len(hit) + 1), hit.cumsum().to_numpy()
+                        / np.arange(1, len(hit) + 1), label=label)
+    per_window.set_xlabel('Time since first query (s)')
+    per_window.set_ylabel('Hit rate')
+    per_window.set_title(f"Cache hit rate per {window:g} s window")
+    cumulative.set_xlabel('Queries')
+    cumulative.set_ylabel('Hit rate so far')
+    cumulative.set_title('Cumulative cache hit rate')
+    for ax in (per_window, cumulative):
+        ax.set_ylim(0, 1)
+        ax.grid(True, alpha=0.3)
+        ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return True
+
+
+def plot_servers_visited(runs, path):
+    """Share of queries by number of DNS servers visited, runs side by side."""
+    runs = {label: df for label, df in runs.items() if 'servers_visited' in df}
+    if not runs:
+        return False
+    shares = pd.DataFrame({label: df['servers_visited'].value_counts(normalize=True)
+                           for label, df in runs.items()}).fillna(0).sort_index()
+    ax = shares.plot.bar(figsize=(11, 6), rot=0)
+    ax.set_xlabel('DNS servers visited')
+    ax.set_ylabel('Fraction of queries')
+    ax.set_title('Servers visited per query')
+    ax.figure.tight_layout()
+    ax.figure.savefig(path)
+    plt.close(ax.figure)
+    return True
+
+
+def analyze(run_paths, window=DEFAULT_WINDOW, out_dir='.'):
+    """--analyze: distribution plots and percentile tables over full runs."""
+    runs = {}
+    for label, path in run_paths:
+        print(f"Reading run '{label}' from '{path}'...")
+        try:
+            runs[label] = load_run(path)
+        except (OSError, ValueError) as e:
+            print(f"Skipping '{path}': {e}")
+            continue
+        print(f"  {len(runs[label])} queries")
+    runs = {label: df for label, df in runs.items() if len(df)}
+    if not runs:
+        print("No queries to analyze.")
+        return
+    os.makedirs(out_dir, exist_ok=True)
+
+    pd.set_option('display.width', 200)
+    summary = compare_runs(runs)
+    print("\n--- Runs compared ---")
+    print(summary.to_string(float_format=lambda v: f"{v:.3f}"))
+    table = pd.concat([percentile_table(runs)] + [percentile_table(runs, by) for by in SPLITS],
+                      ignore_index=True)
+    print("\n--- Latency percentiles by split ---")
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    outputs = [os.path.join(out_dir, 'analysis_percentiles.csv')]
+    table.to_csv(outputs[0], index=False)
+    for by in [None] + SPLITS:
+        if by is None or any(by in df for df in runs.values()):
+            outputs.append(os.path.join(out_dir, f"analysis_cdf_{by or 'all'}.png"))
+            plot_cdfs(runs, by, outputs[-1])
+    outputs.append(os.path.join(out_dir, 'analysis_latency_over_time.png'))
+    plot_latency_over_time(runs, window, outputs[-1])
+    if plot_hit_rate(runs, window, os.path.join(out_dir, 'analysis_hit_rate.png')):
+        outputs.append(os.path.join(out_dir, 'analysis_hit_rate.png'))
+    if plot_servers_visited(runs, os.path.join(out_dir, 'analysis_servers_visited.png')):
+        outputs.append(os.path.join(out_dir, 'analysis_servers_visited.png'))
+    print("\nSaved " + ", ".join(f"'{path}'" for path in outputs))
+
+
+def _run_arg(value):
+    """--run LABEL=PATH, or just PATH (labelled with its file name)."""
+    label, sep, path = value.partition('=')
+    if not sep:
+        label, path = os.path.basename(value.rstrip('/')), value
+    return label, path
+
+
 if __name__ == "__main__":
-    create_plots()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Plot the Part D resolver log")
+    parser.add_argument("log", nargs="?",
+                        default=LOG_FILE if os.path.exists(LOG_FILE) else LOG_DIR,
+                        help=f"CSV log file or binary log directory (default: {LOG_FILE}, "
+                             f"or {LOG_DIR} if there is no CSV log)")
+    parser.add_argument("--analyze", action="store_true",
+                        help="analyze every query instead of plotting the first "
+                             f"{NUM_URLS_TO_PLOT} domains")
+    parser.add_argument("--run", action="append", type=_run_arg, metavar="[LABEL=]PATH",
+                        help="run to analyze: a resolver log or a Benchmark.py --output "
+                             "file; repeat to compare runs (default: the log argument)")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW,
+                        help="seconds per point in the over-time plots")
+    parser.add_argument("--out-dir", default=".", help="directory for the analysis output")
+    args = parser.parse_args()
+    if args.analyze:
+        analyze(args.run or [_run_arg(args.log)], args.window, args.out_dir)
+    else:
+        create_plots(args.log)
\ No newline at end of file
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Rate limiting and per-client fairness
+Three ways of keeping one busy client from starving the others:
+
+  * TokenBuckets: a token bucket per client address. The UDP server checks
+    it as soon as a datagram is read, so a client over its rate costs no
+    parsing, no queueing and no upstream work.
+  * ResponseRateLimiter: response rate limiting (RRL) as in BIND and NSD.
+    Identical responses (same name, type and rcode) to one client network
+    are limited per second; past the limit they are dropped, except every
+    slip-th one, which is sent back empty with TC set so a real client
+    can still get its answer over TCP while a spoofed victim gets nothing
+    bigger than the query.
+  * FairQueue: per-client queues served round-robin by the worker threads.
+    When it is full, the client with the most queued queries loses one,
+    so a flood mostly delays (and drops) its own queries.
+"""
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_MAX_CLIENTS = 65536   # Buckets kept before the least recently seen is forgotten
+DEFAULT_SLIP = 2              # Every 2nd rate-limited response is sent truncated (0 = none)
+DEFAULT_PREFIX_LEN = 32       # IPv4 prefix length that counts as one client for RRL
+
+# What ResponseRateLimiter.check() tells the caller to do with a response
+SEND = "send"
+SLIP = "slip"
+DROP = "drop"
+
+
+def client_prefix(ip, prefix_len=DEFAULT_PREFIX_LEN):
+    """The network of an IPv4 address as an int (other addresses are used whole)."""
+    if prefix_len >= 32:
+        return ip
+    try:
+        return struct.unpack("!I", socket.inet_aton(ip))[0] >> (32 - prefix_len)
+    except OSError:
+        return ip
+
+
+class TokenBuckets:
+    """
+    Thread-safe token bucket per key: rate tokens a second, at most burst
+    saved up. Only the max_keys most recently seen keys are remembered;
+    a forgotten key starts again with a full bucket.
+    """
+
+    def __init__(self, rate, burst=None, max_keys=DEFAULT_MAX_CLIENTS):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.max_keys = max_keys
+        self.allowed = 0
+        self.limited = 0
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, key, now=None):
+        """Takes a token from key's bucket. Returns False if it is empty."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[key] = [self.burst, now]
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                self.allowed += 1
+                return True
+            self.limited += 1
+            return False
+
+
+class ResponseRateLimiter:
+    """
+    Limits identical responses to a client network to rate a second
+    (with a burst of the same size).
+    """
+
+    def __init__(self, rate, slip=DEFAULT_SLIP, prefix_len=DEFAULT_PREFIX_LEN,
+                 max_keys=DEFAULT_MAX_CLIENTS):
+        self.slip = slip
+        self.prefix_len = prefix_len
+        self.buckets = TokenBuckets(rate, max_keys=max_keys)
+        self.dropped = 0
+        self.slipped = 0
+        self._lock = threading.Lock()
+
+    def check(self, client_ip, qname, qtype, rcode):
+        """SEND, SLIP (send header and question only, with TC) or DROP."""
+        key = (client_prefix(client_ip, self.prefix_len), qname.lower(), qtype, rcode)
+        if self.buckets.allow(key):
+            return SEND
+        with self._lock:
+            if self.slip and (self.dropped + self.slipped) % self.slip == self.slip - 1:
+                self.slipped += 1
+                return SLIP
+            self.dropped += 1
+            return DROP
+
+
+class FairQueue:
+    """
+    Bounded per-client FIFO queues, served round-robin one item per client
+    per turn. Holds at most limit items in total and client_limit per client.
+    """
+
+    def __init__(self, limit, client_limit=None):
+        self.limit = max(limit, 1)
+        self.client_limit = client_limit or self.limit
+        self.dropped = 0
+        self._queues = {}     # client -> deque of items
+        self._ring = deque()  # Clients with queued items, in serving order
+        self._size = 0
+        self._closed = False
+        self._ready = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def clients(self):
+        return len(self._queues)
+
+    def put(self, client, item):
+        """Queues item for client. Returns False if the item was dropped instead."""
+        with self._ready:
+            queue = self._queues.get(client)
+            queued = len(queue) if queue is not None else 0
+            if queued >= self.client_limit:
+                self.dropped += 1
+                return False
+            if self._size >= self.limit:
+                # Full: the client with the longest queue gives up its newest item
+                victim = max(self._queues, key=lambda c: len(self._queues[c]))
+                if len(self._queues[victim]) <= queued:
+                    self.dropped += 1
+                    return False
+                self._queues[victim].pop()
+                if not self._queues[victim]:
+                    del self._queues[victim]
+                    self._ring.remove(victim)
+                self._size -= 1
+                self.dropped += 1
+            if queue is None:
+                queue = self._queues[client] = deque()
+                self._ring.append(client)
+            queue.append(item)
+            self._size += 1
+            self._ready.notify()
+            return True
+
+    def get(self):
+        """The next item in round-robin order, waiting for one. None once closed."""
+        with self._ready:
+            while not self._ring and not self._closed:
+                self._ready.wait()
+            if not self._ring:
+                return None
+            client = self._ring.popleft()
+            queue = self._queues[client]
+            item = queue.popleft()
+            self._size -= 1
+            if queue:
+                self._ring.append(client)
+            else:
+                del self._queues[client]
+            return item
+
+    def close(self):
+        """Wakes every waiting get(); items still queued are served first."""
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
@@ -0,0 +1,290 @@
+#!/usr/bin/python3
+"""
+CS331 DNS Benchmark - Experiment runner
+Runs a whole Part D experiment without typing into the Mininet CLI: builds
+the topology (partd_dns_topo_custom.py), starts the resolver, waits until it
+answers, then starts Benchmark.py on every client host AT THE SAME TIME, each
+with its own capture, and waits for all of them. Per-host results, the
+resolver's log and its console output are collected into one directory and
+the network is torn down again, so the run can be repeated exactly:
+
+    sudo python3 run_experiment.py
+    sudo python3 run_experiment.py --bench-args "--replay --speed 10" --resolver-processes 4
+    sudo python3 run_experiment.py --topology scale_tree.json --clients 0
+
+By default h1..h4 replay PCAP_1_H1.pcap .. PCAP_4_H4.pcap (looked up in the
+current directory, the repository root and PARTD). Results go to
+experiments/<time>/: <host>.csv (per query), <host>.out (benchmark output),
+<resolver>_log.csv or <resolver>_log.d/ and <resolver>.out, plus experiment.json
+with every host's latency percentiles and the totals.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import shlex
+import shutil
+import sys
+import time
+
+from mininet.log import setLogLevel, info
+
+import loadgen
+import partd_dns_topo_custom
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BENCHMARK = os.path.join(HERE, "Benchmark.py")
+DEFAULT_PCAPS = [f"PCAP_{i}_H{i}.pcap" for i in range(1, 5)]
+DEFAULT_RESOLVER_ARGS = "--verbosity 0"
+START_TIMEOUT = 15.0   # Seconds to wait for the resolver to answer
+# Run on a client host: exits 0 once the resolver answers (from PARTD, for dns_wire)
+PROBE = """
+import socket, sys, time, dns_wire
+deadline = time.monotonic() + float(sys.argv[2])
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+sock.settimeout(0.2)
+while time.monotonic() < deadline:
+    sock.sendto(dns_wire.build_query("ready.experiment.invalid", dns_wire.TYPE_A, 1),
+                (sys.argv[1], 53))
+    try:
+        sock.recv(4096)
+        sys.exit(0)
+    except OSError:
+        pass
+sys.exit(1)
+"""
+
+
+def find_capture(path):
+    """path as given, or found in the repository root or PARTD."""
+    for candidate in (path, os.path.join(ROOT, path), os.path.join(HERE, path)):
+        if os.path.exists(candidate):
+            return os.path.abspath(candidate)
+    return None
+
+
+def assign_captures(pcaps, clients, limit):
+    """
+    {host: capture}. HOST=PATH entries go to that host; the other captures are
+    handed to the remaining clients in order, cycling through them when more
+    clients than captures take part (limit, 0 = every client).
+    """
+    named, unnamed = {}, []
+    for entry in pcaps:
+        host, sep, path = entry.partition("=")
+        if sep and host in clients:
+            named[host] = path
+        else:
+            unnamed.append(entry)
+    count = len(clients) if limit == 0 else min(limit or len(named) + len(unnamed), len(clients))
+    assigned = dict(named)
+    free = [name for name in clients if name not in named]
+    for index, host in enumerate(free[:max(count - len(named), 0)]):
+        if unnamed:
+            assigned[host] = unnamed[index % len(unnamed)]
+    if not assigned:
+        raise SystemExit("[Experiment] No client host has a capture to replay")
+    missing = sorted(path for path in set(assigned.values()) if find_capture(path) is None)
+    if missing:
+        raise SystemExit(f"[Experiment] Capture not found: {', '.join(missing)}")
+    return {host: find_capture(path) for host, path in assigned.items()}
+
+
+def wait_for_resolvers(net, plan, timeout=START_TIMEOUT):
+    """Waits until every resolver answers a client. Returns the ones that did not."""
+    client = net.get(plan.clients[0].name)
+    silent = []
+    for resolver in plan.resolvers:
+        ip = resolver.ip.split("/")[0]
+        client.cmd(f"cd {shlex.quote(HERE)} && python3 -c {shlex.quote(PROBE)} {ip} {timeout}")
+        if client.cmd("echo $?").strip() != "0":
+            silent.append(resolver.name)
+    return silent
+
+
+def run_benchmarks(net, plan, captures, out_dir, bench_args, timeout):
+    """
+    Starts Benchmark.py on every host of captures at once and waits for all of them.
+    Returns {host: exit code} (None if it was still running after timeout seconds).
+    """
+    processes = {}
+    for host, capture in captures.items():
+        server = plan.nameservers.get(host) or plan.resolvers[0].ip.split("/")[0]
+        command = (["python3", BENCHMARK, capture, "--server", server,
+                    "--output", os.path.join(out_dir, f"{host}.csv")]
+                   + shlex.split(bench_args))
+        output = open(os.path.join(out_dir, f"{host}.out"), "w")
+        processes[host] = (net.get(host).popen(command, cwd=HERE, stdout=output,
+                                               stderr=output), output)
+    info(f"*** Started {len(processes)} benchmarks\n")
+
+    deadline = time.monotonic() + timeout if timeout else None
+    codes = {}
+    while len(codes) < len(processes):
+        for host, (process, output) in processes.items():
+            if host not in codes and process.poll() is not None:
+                codes[host] = process.returncode
+                output.close()
+                info(f"*** {host} finished ({len(codes)}/{len(processes)})\n")
+        if deadline and time.monotonic() > deadline:
+            for host, (process, output) in processes.items():
+                if host not in codes:
+                    info(f"*** {host} still running after {timeout:g}s, stopping it\n")
+                    process.kill()
+                    process.wait()
+                    output.close()
+                    codes[host] = None
+            break
+        time.sleep(0.2)
+    return codes
+
+
+def summarize(path):
+    """Query counts and latency percentiles of a Benchmark.py --output file."""
+    latencies, total, truncated, first, last = [], 0, 0, None, None
+    rcodes = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            total += 1
+            truncated += row.get("truncated") == "1"
+            sent = float(row["sent_at_s"])
+            first = sent if first is None else min(first, sent)
+            last = sent if last is None else max(last, sent)
+            if row["rcode"]:
+                latencies.append(float(row["latency_ms"]))
+                rcodes[row["rcode"]] = rcodes.get(row["rcode"], 0) + 1
+    latencies.sort()
+    return {
+        "queries": total,
+        "successful": rcodes.get("NOERROR", 0),
+        "timeouts": total - len(latencies),
+        "truncated": truncated,
+        "rcodes": rcodes,
+        "duration_s": (last - first) if total > 1 else 0.0,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) if latencies else 0,
+            "p50": loadgen.percentile(latencies, 50),
+            "p90": loadgen.percentile(latencies, 90),
+            "p99": loadgen.percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0,
+        },
+    }, latencies
+
+
+def collect_resolver_output(plan, out_dir):
+    """Moves each resolver's console output from its working directory into out_dir."""
+    workdir = os.path.join(ROOT, plan.config["resolvers"]["workdir"] or "")
+    for resolver in plan.resolvers:
+        source = os.path.join(workdir, f"{resolver.name}.out")
+        if os.path.exists(source):
+            shutil.move(source, os.path.join(out_dir, f"{resolver.name}.out"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Part D benchmark on every client "
+                                                 "host at once and collect the results")
+    parser.add_argument("--pcap", action="append", metavar="[HOST=]PATH",
+                        help="capture to replay, for HOST or the next client; repeat for "
+                             f"several (default: {' '.join(DEFAULT_PCAPS)} on h1..h4)")
+    parser.add_argument("--clients", type=int, default=None,
+                        help="client hosts that run a benchmark, cycling through the "
+                             "captures (default: one per capture, 0 = every client)")
+    parser.add_argument("--topology", default=partd_dns_topo_custom.DEFAULT_TOPOLOGY,
+                        help="topology config (default: topologies/partd.json)")
+    parser.add_argument("--resolver-processes", type=int, default=1,
+                        help="worker processes of each resolver")
+    parser.add_argument("--resolver-args", default=DEFAULT_RESOLVER_ARGS,
+                        help=f"extra resolver options (default: {DEFAULT_RESOLVER_ARGS!r})")
+    parser.add_argument("--bench-args", default="",
+                        help="extra Benchmark.py options, e.g. \"--replay --speed 10\"")
+    parser.add_argument("--timeout", type=float, default=0,
+                        help="stop benchmarks still running after this many seconds (0 = wait)")
+    parser.add_argument("--out-dir", default=None,
+                        help="where results are collected (default: experiments/<time>)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    started = datetime.datetime.now()
+    out_dir = os.path.abspath(args.out_dir or os.path.join(
+        "experiments", started.strftime("%Y%m%d-%H%M%S")))
+    os.makedirs(out_dir, exist_ok=True)
+    # Every resolver logs into out_dir, named after its host
+    resolver_args = (f"{args.resolver_args} "
+                     f"--log-file {shlex.quote(os.path.join(out_dir, '{name}_log.csv'))} "
+                     f"--log-dir {shlex.quote(os.path.join(out_dir, '{name}_log.d'))}")
+
+    net, plan, pids = partd_dns_topo_custom.start_network(args.topology,
+                                                          args.resolver_processes,
+                                                          resolver_args)
+    try:
+        clients = [client.name for client in plan.clients]
+        captures = assign_captures(args.pcap or DEFAULT_PCAPS, clients, args.clients)
+        silent = wait_for_resolvers(net, plan)
+        if silent:
+            raise SystemExit(f"[Experiment] No answer from {', '.join(silent)} after "
+                             f"{START_TIMEOUT:g}s; see their .out files in {out_dir}")
+        start = time.monotonic()
+        codes = run_benchmarks(net, plan, captures, out_dir, args.bench_args, args.timeout)
+        elapsed = time.monotonic() - start
+    finally:
+        partd_dns_topo_custom.stop_network(net, pids)
+        collect_resolver_output(plan, out_dir)
+
+    hosts, everything = {}, []
+    for host, capture in captures.items():
+        result_file = os.path.join(out_dir, f"{host}.csv")
+        entry = {"pcap": os.path.basename(capture), "server": plan.nameservers.get(host),
+                 "exit_code": codes.get(host)}
+        if os.path.exists(result_file):
+            summary, latencies = summarize(result_file)
+            entry.update(summary)
+            everything.extend(latencies)
+        hosts[host] = entry
+    everything.sort()
+    queries = sum(entry.get("queries", 0) for entry in hosts.values())
+    results = {
+        "created": started.isoformat(timespec="seconds"),
+        "topology": args.topology,
+        "resolvers": {r.name: r.ip.split("/")[0] for r in plan.resolvers},
+        "resolver_processes": args.resolver_processes,
+        "resolver_args": args.resolver_args,
+        "bench_args": args.bench_args,
+        "elapsed_s": round(elapsed, 3),
+        "hosts": hosts,
+        "total": {
+            "queries": queries,
+            "timeouts": sum(entry.get("timeouts", 0) for entry in hosts.values()),
+            "truncated": sum(entry.get("truncated", 0) for entry in hosts.values()),
+            "qps": round(queries / elapsed, 1) if elapsed > 0 else 0,
+            "p50_ms": loadgen.percentile(everything, 50),
+            "p99_ms": loadgen.percentile(everything, 99),
+        },
+    }
+    with open(os.path.join(out_dir, "experiment.json"), "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+
+    print(f"{'host':<8} {'queries':>8} {'timeouts':>9} {'truncated':>9} {'p50_ms':>9} "
+          f"{'p99_ms':>9}  pcap")
+    for host, entry in hosts.items():
+        latency = entry.get("latency_ms", {})
+        print(f"{host:<8} {entry.get('queries', 0):>8} {entry.get('timeouts', 0):>9} "
+              f"{entry.get('truncated', 0):>9} {latency.get('p50', 0):>9.2f} "
+              f"{latency.get('p99', 0):>9.2f}  {entry['pcap']}")
+    total = results["total"]
+    print(f"{'total':<8} {total['queries']:>8} {total['timeouts']:>9} {total['truncated']:>9} "
+          f"{total['p50_ms']:>9.2f} {total['p99_ms']:>9.2f}  {total['qps']} qps over "
+          f"{elapsed:.1f}s")
+    print(f"[Experiment] Results collected in {out_dir}")
+    runs = " ".join(f"--run {host}={os.path.join(out_dir, host + '.csv')}" for host in hosts)
+    print(f"[Experiment] Compare hosts with: python3 plot_logs.py --analyze {runs}")
+    return 0 if all(code == 0 for code in codes.values()) else 1
+
+
+if __name__ == "__main__":
+    setLogLevel("info")
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Cross-process cache and stats
+Shared memory used when the resolver runs as several worker processes
+(--processes N). Both areas are anonymous shared mappings created before the
+workers are forked, so every worker sees the same bytes.
+
+SharedAnswerTable is a direct-mapped table of wire-format responses that
+backs each worker's own DNSCache: an answer cached by one worker is found by
+the others instead of being looked up upstream again. Each slot is guarded
+by a sequence number (odd while being written) so readers never take a
+lock; writers take one of a few striped locks.
+
+WorkerStats holds one row of counters per worker, written only by that
+worker and summed by the supervisor into one view.
+"""
+import mmap
+import multiprocessing
+import struct
+import zlib
+
+import dns_cache
+
+DEFAULT_SLOTS = 16384
+DEFAULT_SLOT_SIZE = 1024      # Bytes per slot; larger answers stay in the worker's own cache
+LOCK_STRIPES = 64
+
+# seq, key hash, stored_at, expires_at, ttl, kind, key length, response length, TTL count
+_SLOT = struct.Struct("!IIddIBHHH")
+_TTL = struct.Struct("!HI")
+_SEQ = struct.Struct("!I")
+
+
+def _key_bytes(key):
+    qname, qtype, qclass = key
+    return f"{qname}/{qtype}/{qclass}".encode("utf-8")
+
+
+class SharedAnswerTable:
+    """Fixed-size table of cached answers in memory shared by forked workers."""
+
+    def __init__(self, slots=DEFAULT_SLOTS, slot_size=DEFAULT_SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        # Anonymous mappings are MAP_SHARED, so they survive fork() as shared memory
+        self.buf = mmap.mmap(-1, slots * slot_size)
+        self._locks = [multiprocessing.Lock() for _ in range(LOCK_STRIPES)]
+
+    def get(self, key):
+        """
+        Returns (response, ttls, ttl, stored_at, expires_at, kind) for key, or
+        None if it is not in the table or its slot is being rewritten.
+        """
+        raw_key = _key_bytes(key)
+        key_hash = zlib.crc32(raw_key)
+        base = (key_hash % self.slots) * self.slot_size
+        buf = self.buf
+        (seq, slot_hash, stored_at, expires_at, ttl, kind, key_len, resp_len,
+         ttl_count) = _SLOT.unpack_from(buf, base)
+        if seq == 0 or seq & 1 or slot_hash != key_hash or key_len != len(raw_key):
+            return None
+        if not self._valid(kind, key_len, resp_len, ttl_count):
+            return None
+        offset = base + _SLOT.size
+        if buf[offset:offset + key_len] != raw_key:
+            return None
+        offset += key_len
+        ttls = [_TTL.unpack_from(buf, offset + i * _TTL.size) for i in range(ttl_count)]
+        offset += ttl_count * _TTL.size
+        response = buf[offset:offset + resp_len]
+        if _SEQ.unpack_from(buf, base)[0] != seq:
+            return None  # Overwritten while we were reading it
+        return response, ttls, ttl, stored_at, expires_at, dns_cache.KINDS[kind]
+
+    def snapshot(self):
+        """
+        Every answer in the table, in the tuples of DNSCache.snapshot()
+        (hits are not shared, so they are 0). Slots being rewritten are skipped.
+        """
+        entries = []
+        buf = self.buf
+        for base in range(0, self.slots * self.slot_size, self.slot_size):
+            (seq, _, stored_at, expires_at, ttl, kind, key_len, resp_len,
+             ttl_count) = _SLOT.unpack_from(buf, base)
+            if seq == 0 or seq & 1 or not self._valid(kind, key_len, resp_len, ttl_count):
+                continue
+            offset = base + _SLOT.size
+            raw_key = buf[offset:offset + key_len]
+            offset += key_len
+            ttls = [_TTL.unpack_from(buf, offset + i * _TTL.size) for i in range(ttl_count)]
+            offset += ttl_count * _TTL.size
+            response = buf[offset:offset + resp_len]
+            if _SEQ.unpack_from(buf, base)[0] != seq:
+                continue
+            qname, qtype, qclass = raw_key.decode("utf-8").rsplit("/", 2)
+            entries.append(((qname, int(qtype), int(qclass)), response, ttls, ttl, stored_at,
+                            expires_at, dns_cache.KINDS[kind], 0))
+        return entries
+
+    def _valid(self, kind, key_len, resp_len, ttl_count):
+        """
+        Whether a slot header read without the lock describes a slot that
+        fits. A read torn by a concurrent writer can see any lengths, and
+        following them would run past the slot or the mapping.
+        """
+        return (kind < len(dns_cache.KINDS) and
+                _SLOT.size + key_len + ttl_count * _TTL.size + resp_len <= self.slot_size)
+
+    def put(self, key, response, ttls, ttl, stored_at, expires_at, kind):
+        """Stores an answer, replacing whatever shared its slot. Returns False if too big."""
+        raw_key = _key_bytes(key)
+        size = _SLOT.size + len(raw_key) + len(ttls) * _TTL.size + len(response)
+        if size > self.slot_size:
+            return False
+        key_hash = zlib.crc32(raw_key)
+        index = key_hash % self.slots
+        base = index * self.slot_size
+        buf = self.buf
+        with self._locks[index % LOCK_STRIPES]:
+            seq = _SEQ.unpack_from(buf, base)[0]
+            _SEQ.pack_into(buf, base, seq + 1)  # Odd: readers back off
+            _SLOT.pack_into(buf, base, seq + 1, key_hash, stored_at, expires_at, ttl,
+                            dns_cache.KINDS.index(kind), len(raw_key), len(response),
+                            len(ttls))
+            offset = base + _SLOT.size
+            buf[offset:offset + len(raw_key)] = raw_key
+            offset += len(raw_key)
+            for ttl_offset, value in ttls:
+                _TTL.pack_into(buf, offset, ttl_offset, value)
+                offset += _TTL.size
+            buf[offset:offset + len(response)] = response
+            _SEQ.pack_into(buf, base, seq + 2)
+        return True
+
+
+STAT_FIELDS = ("queries", "hits", "negative_hits", "stale_hits", "misses", "shared_hits",
+               "refreshes", "coalesced", "hedged", "log_dropped", "throttled")
+_ROW = struct.Struct(f"={len(STAT_FIELDS)}Q")
+
+
+class WorkerStats:
+    """One row of counters per worker process in shared memory."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.buf = mmap.mmap(-1, workers * _ROW.size)
+
+    def publish(self, worker, values):
+        """Overwrites a worker's row with a dict keyed by STAT_FIELDS."""
+        _ROW.pack_into(self.buf, worker * _ROW.size,
+                       *(int(values.get(field, 0)) for field in STAT_FIELDS))
+
+    def row(self, worker):
+        return dict(zip(STAT_FIELDS, _ROW.unpack_from(self.buf, worker * _ROW.size)))
+
+    def totals(self):
+        totals = dict.fromkeys(STAT_FIELDS, 0)
+        for worker in range(self.workers):
+            for field, value in self.row(worker).items():
+                totals[field] += value
+        return totals
+
+    def report(self):
+        """The aggregated view as printable lines: one per worker plus a total."""
+        header = "worker  " + " ".join(f"{field:>13}" for field in STAT_FIELDS)
+        lines = [header]
+        for worker in range(self.workers):
+            row = self.row(worker)
+            lines.append(f"{worker:<7} " + " ".join(f"{row[f]:>13}" for f in STAT_FIELDS))
+        totals = self.totals()
+        lines.append("total   " + " ".join(f"{totals[f]:>13}" for f in STAT_FIELDS))
+        return lines
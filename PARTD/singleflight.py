@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - In-flight query coalescing
+While a lookup for a key (qname, qtype, qclass) is outstanding, identical
+lookups from other worker threads wait for it instead of sending their own
+upstream query, and all of them are answered from the single result.
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "followers")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Runs at most one lookup per key at a time and shares its outcome."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key, fn):
+        """
+        Returns (result, leader). The first caller for key runs fn() and gets
+        leader=True; callers arriving while it runs wait and get the same
+        result (or exception) with leader=False.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+            return call.result, True
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
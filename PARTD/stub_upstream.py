@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+"""
+CS331 DNS Benchmark - Stub upstream
+A local stand-in for 8.8.8.8 used by the offline benchmark (offline_bench.py).
+It answers every query itself from a table of zones, each with its own
+latency, jitter, loss, TTL, rcode and answer size, so a benchmark needs no
+network and behaves the same on every run (loss and jitter are drawn from a
+seeded random generator). UDP answers larger than the query's EDNS0 buffer
+come back truncated, and the full answers are served over TCP on the same
+port.
+
+Zones are given as JSON, e.g.
+    {".": {"latency_ms": 20},
+     "slow.test": {"latency_ms": 300, "jitter_ms": 50},
+     "lossy.test": {"loss": 0.2},
+     "big.test": {"size": 1500},
+     "nx.test": {"rcode": "NXDOMAIN"}}
+A query belongs to the longest zone its name ends with; "." matches everything.
+"""
+import argparse
+import asyncio
+import json
+import random
+import signal
+import struct
+import sys
+import zlib
+
+import dns_wire
+
+DEFAULT_PORT = 5300
+# Settings of a zone that does not override them
+ZONE_DEFAULTS = {
+    "latency_ms": 20.0,   # Delay before every answer
+    "jitter_ms": 0.0,     # Plus a uniform random delay up to this
+    "loss": 0.0,          # Share of UDP queries never answered
+    "ttl": 300,
+    "rcode": "NOERROR",
+    "answers": 1,         # Address records per answer
+    "size": 0,            # Add address records until the response is at least this long
+}
+_RCODES = {name: code for code, name in dns_wire.RCODE_NAMES.items()}
+
+
+class Zone:
+    """The answering behaviour of one zone."""
+
+    __slots__ = ("name", "latency", "jitter", "loss", "ttl", "rcode", "answers", "size",
+                 "queries", "dropped")
+
+    def __init__(self, name, settings):
+        unknown = set(settings) - set(ZONE_DEFAULTS)
+        if unknown:
+            raise ValueError(f"zone {name}: unknown settings {', '.join(sorted(unknown))}")
+        settings = dict(ZONE_DEFAULTS, **settings)
+        self.name = name.strip(".").lower()
+        self.latency = settings["latency_ms"] / 1000.0
+        self.jitter = settings["jitter_ms"] / 1000.0
+        self.loss = settings["loss"]
+        self.ttl = settings["ttl"]
+        rcode = settings["rcode"]
+        self.rcode = rcode if isinstance(rcode, int) else _RCODES[rcode.upper()]
+        self.answers = settings["answers"]
+        self.size = settings["size"]
+        self.queries = 0
+        self.dropped = 0
+
+    def records(self, qname, qtype, count=None):
+        """The answer section for qname: deterministic addresses derived from the name."""
+        if qtype not in (dns_wire.TYPE_A, dns_wire.TYPE_AAAA):
+            return [dns_wire.make_record(qname, dns_wire.TYPE_TXT, dns_wire.CLASS_IN, self.ttl,
+                                         b"\x04stub")]
+        base = zlib.crc32(qname.lower().encode("utf-8"))
+        records = []
+        for i in range(count or self.answers):
+            value = (base + i) & 0xFFFFFFFF
+            if qtype == dns_wire.TYPE_A:
+                rdata = struct.pack("!I", value)
+            else:
+                rdata = b"\x20\x01\x0d\xb8" + b"\x00" * 8 + struct.pack("!I", value)
+            records.append(dns_wire.make_record(qname, qtype, dns_wire.CLASS_IN, self.ttl, rdata))
+        return records
+
+    def soa(self):
+        """SOA for negative answers, so the resolver can cache them for the zone's TTL."""
+        rdata = (dns_wire.encode_name(f"ns.{self.name}")
+                 + dns_wire.encode_name(f"stub.{self.name}")
+                 + struct.pack("!5I", 1, 3600, 600, 86400, self.ttl))
+        return dns_wire.make_record(self.name, dns_wire.TYPE_SOA, dns_wire.CLASS_IN, self.ttl,
+                                    rdata)
+
+    def respond(self, query):
+        """The full (untruncated) response to a query."""
+        message = dns_wire.Message(query)
+        qname, qtype, _ = message.question
+        additional = [dns_wire.make_opt()] if dns_wire.edns_payload(message) else []
+        if self.rcode != dns_wire.RCODE_NOERROR:
+            authority = [self.soa()] if self.rcode == dns_wire.RCODE_NXDOMAIN else []
+            return dns_wire.build_response(message, self.rcode, (), authority, additional)
+        answers = self.records(qname, qtype)
+        response = dns_wire.build_response(message, self.rcode, answers, (), additional)
+        if self.size and len(response) < self.size and qtype in (dns_wire.TYPE_A,
+                                                                  dns_wire.TYPE_AAAA):
+            # Every extra address record adds the same number of bytes
+            step = len(dns_wire.build_response(message, self.rcode, answers * 2, (),
+                                               additional)) - len(response)
+            extra = -(-(self.size - len(response)) // step)
+            answers = self.records(qname, qtype, self.answers + extra)
+            response = dns_wire.build_response(message, self.rcode, answers, (), additional)
+        return response
+
+
+class StubZones:
+    """Finds the zone of a query name by longest suffix match."""
+
+    def __init__(self, zones):
+        self.zones = {}
+        for name, settings in zones.items():
+            zone = Zone(name, settings)
+            self.zones[zone.name] = zone
+        self.zones.setdefault("", Zone(".", {}))
+
+    def lookup(self, qname):
+        labels = qname.strip(".").lower().split(".")
+        for i in range(len(labels)):
+            zone = self.zones.get(".".join(labels[i:]))
+            if zone is not None:
+                return zone
+        return self.zones[""]
+
+    def stats(self):
+        """Queries and dropped queries per zone that saw any."""
+        return {zone.name or ".": {"queries": zone.queries, "dropped": zone.dropped}
+                for zone in self.zones.values() if zone.queries}
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, stub):
+        self.stub = stub
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        stub = self.stub
+        question = dns_wire.parse_question(data)
+        if question is None:
+            return
+        zone = stub.zones.lookup(question[0])
+        zone.queries += 1
+        if stub.rng.random() < zone.loss:
+            zone.dropped += 1
+            return
+        response = dns_wire.fit_response(zone.respond(data), dns_wire.edns_payload(data))
+        asyncio.get_running_loop().call_later(stub.delay(zone), self.transport.sendto,
+                                              response, addr)
+
+
+class StubUpstream:
+    """Serves the zones over UDP and TCP on host:port until stopped."""
+
+    def __init__(self, zones, host="127.0.0.1", port=DEFAULT_PORT, seed=0):
+        self.zones = StubZones(zones)
+        self.host = host
+        self.port = port
+        self.rng = random.Random(seed)
+        self.tcp_queries = 0
+
+    def delay(self, zone):
+        return zone.latency + (self.rng.uniform(0, zone.jitter) if zone.jitter else 0)
+
+    async def _tcp_client(self, reader, writer):
+        try:
+            while True:
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+                query = await reader.readexactly(length)
+                question = dns_wire.parse_question(query)
+                if question is None:
+                    break
+                zone = self.zones.lookup(question[0])
+                zone.queries += 1
+                self.tcp_queries += 1
+                await asyncio.sleep(self.delay(zone))
+                writer.write(dns_wire.tcp_frame(zone.respond(query)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, stop):
+        """Serves until the stop future completes."""
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _UDPProtocol(self), local_addr=(self.host, self.port))
+        server = await asyncio.start_server(self._tcp_client, self.host, self.port,
+                                            reuse_address=True)
+        try:
+            await stop
+        finally:
+            transport.close()
+            server.close()
+
+    def stats(self):
+        return {"zones": self.zones.stats(), "tcp_queries": self.tcp_queries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub DNS upstream for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--zones", default=None,
+                        help="JSON file of zone settings (default: every name in '.')")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the loss and jitter random generator")
+    args = parser.parse_args()
+    zones = {}
+    if args.zones:
+        with open(args.zones) as f:
+            zones = json.load(f)
+    stub = StubUpstream(zones, args.host, args.port, args.seed)
+
+    async def run():
+        stop = asyncio.get_running_loop().create_future()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            asyncio.get_running_loop().add_signal_handler(
+                signum, lambda: stop.done() or stop.set_result(None))
+        print(f"[Stub] Serving {len(stub.zones.zones)} zones on {args.host}:{args.port}",
+              flush=True)
+        await stub.serve(stop)
+
+    asyncio.run(run())
+    # The benchmark reads this last line to see what reached the upstream
+    print(json.dumps(stub.stats()), flush=True)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,558 @@
+#!/usr/bin/python3
+"""
+CS331 Custom DNS Resolver - Upstream socket pool
+A pool of UDP sockets shared by every worker thread. Each outgoing query
+gets a fresh random transaction ID and goes out from a randomly chosen
+socket, and a response is only accepted on that socket, from a server the
+query was sent to, matching (transaction ID, qname, qtype).
+
+Reusing sockets trades some source-port randomness for not opening a socket
+(and a reader thread) per query: a spoofer who learns one pooled port can
+aim at the next queries sent from it. To keep that window small, a socket is
+replaced with a freshly bound one on a new random port after rotate_after
+queries or max_age seconds, whichever comes first. A larger pool or
+rotate_after=1 gets closer to a port per query, at the cost of more sockets
+being opened and retired every second.
+
+UpstreamSet spreads queries over several upstream resolvers: it keeps a
+smoothed RTT and loss estimate per server, sends each query to the best one
+and, if no answer has arrived by that server's recent p95 RTT, hedges by
+sending the same query to the next best. Whichever answers first wins.
+
+Truncated (TC=1) answers are retried over TCP. UpstreamTCPPool keeps one
+persistent connection per server and pipelines queries on it (RFC 7766),
+matching responses by transaction ID, so a retry does not pay a handshake.
+"""
+import random
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+import dns_wire
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_ROTATE_AFTER = 32     # Queries sent on a socket before it is replaced
+DEFAULT_MAX_AGE = 5.0         # ...or seconds since it was opened, whichever comes first
+RETIRE_GRACE = 0.5            # Seconds a replaced socket keeps reading after its last timeout
+RECV_BUFSIZE = 65535
+
+# --- Upstream selection ---
+RTT_WINDOW = 128              # Recent RTT samples kept per server for percentiles
+MIN_RTT_SAMPLES = 8           # Samples needed before the percentile is trusted
+HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_DELAY = 0.25    # Seconds, until a server has enough samples
+MIN_HEDGE_DELAY = 0.005
+LOSS_ALPHA = 0.1              # Weight of the newest outcome in the loss estimate
+EXPLORE_PROBABILITY = 0.02    # Share of queries sent first to a random server
+
+# --- TCP ---
+TCP_CONNECT_TIMEOUT = 2.0
+TCP_IDLE_TIMEOUT = 30.0       # Close our side of a connection unused for this long
+
+# What UpstreamSet.query returns; transport is "UDP" or "TCP"
+Answer = namedtuple("Answer", "response server rtt asked transport")
+
+_rng = random.SystemRandom()
+
+
+class PendingQuery:
+    """A query waiting for its upstream response, possibly sent to several servers."""
+
+    __slots__ = ("key", "client_txid", "data", "sock", "sent_at", "event", "response",
+                 "server", "received_at")
+
+    def __init__(self, key, client_txid, data, sock):
+        self.key = key
+        self.client_txid = client_txid
+        self.data = data          # The query as sent, with the pool's txid
+        self.sock = sock          # Pooled socket every copy is sent from
+        self.sent_at = {}         # server -> time.monotonic() of the send
+        self.event = threading.Event()
+        self.response = None
+        self.server = None        # The server whose response arrived first
+        self.received_at = None
+
+
+def _bind_upstream():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # Port 0 lets the kernel pick a random ephemeral source port
+    sock.bind(("0.0.0.0", 0))
+    sock.setblocking(False)
+    return sock
+
+
+class UpstreamSocket:
+    """
+    One slot of the pool: its current UDP socket and the sockets it rotated
+    away from, which are still read until late replies are in. A single
+    thread reads them all, so rotating to a new port starts no thread.
+    """
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.uses = 0
+        self.rotating = False
+        self.opened_at = time.monotonic()
+        self.sock = _bind_upstream()
+        self.retired = []   # (socket, time.monotonic() to close it at)
+        self.closed = False
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self.thread = threading.Thread(target=self.receive_loop, daemon=True,
+                                       name=f"upstream-{index}")
+        self.thread.start()
+
+    def rotate(self, grace):
+        """
+        Moves the slot to a freshly bound socket on a new random port. The
+        old one keeps being read for grace seconds. Raises OSError if no
+        socket could be bound.
+        """
+        sock = _bind_upstream()
+        with self._lock:
+            self.retired.append((self.sock, time.monotonic() + grace))
+            self.sock = sock
+        self._wake()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass   # Buffer full: the reader is already due to wake
+
+    def receive_loop(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wake_r, selectors.EVENT_READ)
+        watched = set()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                expired = [sock for sock, close_at in self.retired
+                           if close_at <= now or self.closed]
+                self.retired = [(sock, close_at) for sock, close_at in self.retired
+                                if sock not in expired]
+                if self.closed:
+                    expired.append(self.sock)
+                current = {sock for sock, _ in self.retired}
+                if not self.closed:
+                    current.add(self.sock)
+                wait = min((close_at for _, close_at in self.retired), default=now + 0.5) - now
+            for sock in expired:
+                if sock in watched:
+                    selector.unregister(sock)
+                sock.close()
+            for sock in current - watched:
+                selector.register(sock, selectors.EVENT_READ)
+            watched = current
+            if self.closed:
+                break
+            for key, _ in selector.select(min(max(wait, 0.0), 0.5)):
+                if key.fileobj is self._wake_r:
+                    try:
+                        self._wake_r.recv(4096)
+                    except OSError:
+                        pass
+                else:
+                    self._drain(key.fileobj)
+        selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _drain(self, sock):
+        """Reads every datagram waiting on sock."""
+        while True:
+            try:
+                data, addr = sock.recvfrom(RECV_BUFSIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return   # e.g. an ICMP port unreachable reported on the socket
+            self.pool.dispatch(data, addr, sock)
+
+
+class UpstreamPool:
+    """Multiplexes upstream queries from many threads over a few UDP sockets."""
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, rotate_after=DEFAULT_ROTATE_AFTER,
+                 max_age=DEFAULT_MAX_AGE, grace=RETIRE_GRACE):
+        self.rotate_after = rotate_after
+        self.max_age = max_age
+        self.grace = grace
+        self._lock = threading.Lock()
+        self._pending = {}  # (txid, qname, qtype) -> PendingQuery
+        self._sockets = [UpstreamSocket(self, index) for index in range(max(size, 1))]
+
+    def query(self, data, server, timeout=2.0):
+        """
+        Sends a DNS query to server and waits for the matching response.
+        The response is returned with the caller's original transaction ID.
+        Raises socket.timeout if nothing arrives within timeout seconds.
+        """
+        pending = self.begin(data, timeout)
+        try:
+            self.send(pending, server)
+            if not pending.event.wait(timeout):
+                raise socket.timeout("upstream query timed out")
+        finally:
+            self.end(pending)
+        return self.response(pending)
+
+    def begin(self, data, timeout=2.0):
+        """
+        Registers a query under a fresh transaction ID without sending it.
+        Use send() to send it to one or more servers, then end().
+        """
+        question = dns_wire.parse_question(data)
+        if question is None:
+            raise ValueError("cannot forward a query without a question")
+        qname, qtype = question[0].lower(), question[1]
+        client_txid = struct.unpack_from("!H", data)[0]
+
+        with self._lock:
+            while True:
+                txid = _rng.randrange(0x10000)
+                key = (txid, qname, qtype)
+                if key not in self._pending:
+                    break
+            out = bytearray(data)
+            struct.pack_into("!H", out, 0, txid)
+            index = _rng.randrange(len(self._sockets))
+            upstream = self._sockets[index]
+            pending = PendingQuery(key, client_txid, bytes(out), upstream.sock)
+            self._pending[key] = pending
+            upstream.uses += 1
+            rotate = not upstream.rotating and (
+                upstream.uses >= self.rotate_after
+                or time.monotonic() - upstream.opened_at >= self.max_age)
+            if rotate:
+                upstream.rotating = True
+        if rotate:
+            # Bound outside the lock; queries keep using the old port until the swap
+            try:
+                upstream.rotate(timeout + self.grace)
+            except OSError:
+                pass   # No port free right now: keep the old one and retry next query
+            with self._lock:
+                if upstream.sock is not pending.sock:
+                    upstream.uses, upstream.opened_at = 0, time.monotonic()
+                upstream.rotating = False
+        return pending
+
+    def send(self, pending, server):
+        """Sends a registered query to server; its response is accepted too."""
+        with self._lock:
+            pending.sent_at[server] = time.monotonic()
+        pending.sock.sendto(pending.data, server)
+
+    def end(self, pending):
+        """Stops waiting for responses to a query."""
+        with self._lock:
+            self._pending.pop(pending.key, None)
+
+    @staticmethod
+    def response(pending):
+        """The response to a finished query, with the caller's transaction ID."""
+        response = bytearray(pending.response)
+        struct.pack_into("!H", response, 0, pending.client_txid)
+        return bytes(response)
+
+    def dispatch(self, data, addr, sock):
+        """Hands a datagram received on sock to the query waiting for it, if any."""
+        question = dns_wire.parse_question(data)
+        if question is None:
+            return
+        key = (struct.unpack_from("!H", data)[0], question[0].lower(), question[1])
+        with self._lock:
+            pending = self._pending.get(key)
+            if (pending is None or pending.sock is not sock or addr not in pending.sent_at
+                    or pending.event.is_set()):
+                return  # Late, duplicate or spoofed reply
+            pending.response = data
+            pending.server = addr
+            pending.received_at = time.monotonic()
+        pending.event.set()
+
+    def close(self):
+        with self._lock:
+            sockets = list(self._sockets)
+        for upstream in sockets:
+            upstream.close()
+
+
+def parse_server(text, default_port=53):
+    """Parses "host" or "host:port" into an (ip, port) address."""
+    host, sep, port = text.rpartition(":")
+    if not sep:
+        host, port = text, default_port
+    # Responses are matched on the source address, so names must become IPs
+    return socket.gethostbyname(host), int(port)
+
+
+def _percentile(sorted_values, pct):
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class UpstreamServer:
+    """Per-server RTT and loss estimates (RFC 6298 style smoothing)."""
+
+    def __init__(self, address):
+        self.address = address
+        self.srtt = None
+        self.rttvar = 0.0
+        self.loss = 0.0
+        self.samples = deque(maxlen=RTT_WINDOW)
+        self.sent = 0
+        self.wins = 0
+
+    @property
+    def ip(self):
+        return self.address[0]
+
+    def record_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples.append(rtt)
+        self.loss *= 1 - LOSS_ALPHA
+
+    def record_loss(self):
+        """The server did not answer before the query was settled."""
+        self.loss = self.loss * (1 - LOSS_ALPHA) + LOSS_ALPHA
+
+    def score(self):
+        """Expected cost of asking this server; untried servers go first."""
+        if self.srtt is None:
+            # Never answered: only worth trying until it has been asked once
+            return DEFAULT_HEDGE_DELAY / max(1.0 - self.loss, 0.05) if self.sent else 0.0
+        return self.srtt / max(1.0 - self.loss, 0.05)
+
+    def hedge_delay(self, timeout):
+        """How long to wait for this server before also asking another one."""
+        if len(self.samples) >= MIN_RTT_SAMPLES:
+            delay = _percentile(sorted(self.samples), HEDGE_PERCENTILE)
+        elif self.srtt is not None:
+            delay = max(self.srtt + 4 * self.rttvar, DEFAULT_HEDGE_DELAY)
+        else:
+            delay = DEFAULT_HEDGE_DELAY
+        return min(max(delay, MIN_HEDGE_DELAY), timeout / 2)
+
+
+class UpstreamSet:
+    """Races each query across the configured upstream servers."""
+
+    def __init__(self, pool, addresses, tcp=None):
+        if not addresses:
+            raise ValueError("at least one upstream server is required")
+        self.pool = pool
+        self.tcp = tcp  # UpstreamTCPPool for truncated answers, or None
+        self.servers = [UpstreamServer(address) for address in addresses]
+        self._by_address = {server.address: server for server in self.servers}
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def ranked(self):
+        """Servers ordered best first, with an occasional random probe first."""
+        with self._lock:
+            ranked = sorted(self.servers, key=UpstreamServer.score)
+        if len(ranked) > 1 and _rng.random() < EXPLORE_PROBABILITY:
+            ranked.insert(0, ranked.pop(_rng.randrange(1, len(ranked))))
+        return ranked
+
+    def query(self, data, timeout=2.0):
+        """
+        Sends data to the best server, hedging to the next best if it is slow,
+        and retries a truncated answer over TCP to the server that sent it.
+        Returns an Answer whose server is the winning UpstreamServer.
+        Raises socket.timeout if no server answers within timeout seconds.
+        """
+        ranked = self.ranked()
+        primary = ranked[0]
+        deadline = time.monotonic() + timeout
+        pending = self.pool.begin(data, timeout)
+        asked = [primary]
+        try:
+            self.pool.send(pending, primary.address)
+            if len(ranked) > 1 and not pending.event.wait(primary.hedge_delay(timeout)):
+                asked.append(ranked[1])
+                self.pool.send(pending, ranked[1].address)
+            if not pending.event.wait(max(deadline - time.monotonic(), 0)):
+                raise socket.timeout("upstream query timed out")
+        finally:
+            self.pool.end(pending)
+            self._settle(pending, asked)
+        winner = self._by_address[pending.server]
+        rtt = pending.received_at - pending.sent_at[pending.server]
+        response = UpstreamPool.response(pending)
+        if self.tcp is None or not dns_wire.is_truncated(response):
+            return Answer(response, winner, rtt, len(asked), "UDP")
+        start = time.monotonic()
+        response = self.tcp.query(data, winner.address, max(deadline - start, 0.1))
+        return Answer(response, winner, rtt + time.monotonic() - start, len(asked), "TCP")
+
+    def _settle(self, pending, asked):
+        with self._lock:
+            for server in asked:
+                server.sent += 1
+                if server.address == pending.server:
+                    server.wins += 1
+                    server.record_rtt(pending.received_at - pending.sent_at[server.address])
+                else:
+                    server.record_loss()
+            if len(asked) > 1:
+                self.hedged += 1
+                if pending.server == asked[1].address:
+                    self.hedge_wins += 1
+
+    def stats(self, timeout=2.0):
+        """One line per server with its current estimates."""
+        with self._lock:
+            return [
+                f"{server.address[0]}:{server.address[1]} sent={server.sent} "
+                f"won={server.wins} srtt={(server.srtt or 0) * 1000:.1f}ms "
+                f"loss={server.loss:.2f} hedge_after={server.hedge_delay(timeout) * 1000:.1f}ms"
+                for server in self.servers
+            ]
+
+
+class TCPConnection:
+    """A persistent TCP connection to one server with many queries in flight."""
+
+    def __init__(self, server):
+        self.server = server
+        self.sock = socket.create_connection(server, timeout=TCP_CONNECT_TIMEOUT)
+        self.sock.settimeout(TCP_IDLE_TIMEOUT)
+        self.closed = False
+        self.last_used = time.monotonic()
+        self._pending = {}  # txid -> PendingQuery
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.receive_loop, daemon=True,
+                                       name=f"upstream-tcp-{server[0]}")
+        self.thread.start()
+
+    def query(self, data, timeout):
+        """
+        Sends data on the connection and waits for its response. Raises
+        ConnectionError if the connection closes first, socket.timeout on timeout.
+        """
+        question = dns_wire.parse_question(data)
+        if question is None:
+            raise ValueError("cannot forward a query without a question")
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("upstream TCP connection closed")
+            while True:
+                txid = _rng.randrange(0x10000)
+                if txid not in self._pending:
+                    break
+            out = bytearray(data)
+            struct.pack_into("!H", out, 0, txid)
+            key = (txid, question[0].lower(), question[1])
+            pending = self._pending[txid] = PendingQuery(
+                key, struct.unpack_from("!H", data)[0], bytes(out), self.sock)
+            self.last_used = time.monotonic()
+        try:
+            with self._send_lock:
+                self.sock.sendall(dns_wire.tcp_frame(pending.data))
+            if not pending.event.wait(timeout):
+                raise socket.timeout("upstream TCP query timed out")
+        except OSError as e:
+            if isinstance(e, socket.timeout):
+                raise
+            self.close()
+            raise ConnectionError(f"upstream TCP send failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(txid, None)
+        if pending.response is None:
+            raise ConnectionError("upstream TCP connection closed")
+        return UpstreamPool.response(pending)
+
+    def receive_loop(self):
+        while True:
+            try:
+                data = dns_wire.recv_tcp_message(self.sock)
+            except socket.timeout:
+                # Only raised between messages, so the stream is still in step
+                with self._lock:
+                    if self._pending:
+                        continue
+                break  # Idle: let the connection go
+            except OSError:
+                break  # Includes a timeout part way through a message: never reuse it
+            if data is None:
+                break
+            question = dns_wire.parse_question(data)
+            with self._lock:
+                pending = self._pending.get(struct.unpack_from("!H", data)[0])
+            if (pending is None or question is None
+                    or (question[0].lower(), question[1]) != pending.key[1:]):
+                continue
+            pending.response = data
+            pending.server = self.server
+            pending.received_at = time.monotonic()
+            pending.event.set()
+        self.close()
+
+    def close(self):
+        """Marks the connection closed and wakes every query still waiting on it."""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            waiting = list(self._pending.values())
+        for pending in waiting:
+            pending.event.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)  # Wakes the receive thread
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class UpstreamTCPPool:
+    """One persistent, pipelined TCP connection per upstream server."""
+
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _connection(self, server, fresh=False):
+        with self._lock:
+            connection = self._connections.get(server)
+            if connection is None or connection.closed or fresh:
+                connection = self._connections[server] = TCPConnection(server)
+            return connection
+
+    def query(self, data, server, timeout=2.0):
+        """
+        Sends a DNS query to server over TCP and waits for the response.
+        A connection the server has closed is reopened once.
+        """
+        try:
+            return self._connection(server).query(data, timeout)
+        except ConnectionError:
+            # Servers drop idle connections (RFC 7766 6.2.3); retry on a new one
+            return self._connection(server, fresh=True).query(data, timeout)
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections.values():
+                connection.close()
+            self._connections.clear()
@@ -9,16 +9,16 @@ their resolution time using the system's default resolver.
 import sys
 import socket
 import time
-from scapy.all import rdpcap, DNS, DNSQR
+
+import pcap_stream
 
 def extract_domains_from_pcap(filename):
     """
-    Reads a pcap file and returns a set of unique domain names
-    from DNS query packets.
+    Streams a pcap/pcapng file and returns the unique domain names from
+    DNS query packets, in order of first appearance.
     """
-    domains = set()
     try:
-        packets = rdpcap(filename)
+        return pcap_stream.unique_domains(filename)
     except FileNotFoundError:
         print(f"Error: PCAP file '{filename}' not found.", file=sys.stderr)
         return None
@@ -26,20 +26,6 @@ def extract_domains_from_pcap(filename):
         print(f"Error reading PCAP file: {e}", file=sys.stderr)
         return None
 
-    # Iterate through all packets in the pcap
-    for pkt in packets:
-        # Check if it's a DNS packet, is a query (qr=0),
-        # and has a question (qdcount > 0)
-        if pkt.haslayer(DNS) and pkt[DNS].qr == 0 and pkt.haslayer(DNSQR):
-            try:
-                # Scapy stores qname as bytes, decode it
-                domain = pkt[DNS].qd.qname.decode('utf-8').rstrip('.')
-                domains.add(domain)
-            except Exception as e:
-                print(f"Error decoding domain name: {e}", file=sys.stderr)
-                
-    return list(domains)
-
 def benchmark_dns(domains, pcap_filename):
     """
     Resolves a list of domain names and calculates performance metrics.
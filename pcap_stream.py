@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+"""
+CS331 DNS Benchmark - Streaming PCAP reader
+Reads classic pcap and pcapng captures one packet at a time, looks only at
+UDP port 53 payloads and decodes just the DNS header and first question.
+Memory use stays constant however large the capture is, and queries come out
+in capture order with their timestamps and query types.
+"""
+import struct
+from collections import namedtuple
+
+DNSQuery = namedtuple("DNSQuery", "timestamp qname qtype")
+
+DNS_PORT = 53
+# Largest record libpcap writes; a bigger incl_len means a corrupt file. The header's
+# snaplen is not used as the bound because some writers get it wrong.
+MAX_SNAPLEN = 262144
+
+# Classic pcap magic numbers (as read little-endian) -> (byte order, timestamp divisor)
+_PCAP_MAGIC = {
+    0xA1B2C3D4: ("<", 1e6),
+    0xD4C3B2A1: (">", 1e6),
+    0xA1B23C4D: ("<", 1e9),
+    0x4D3CB2A1: (">", 1e9),
+}
+_PCAPNG_SHB = 0x0A0D0D0A
+_PCAPNG_IDB = 0x00000001
+_PCAPNG_SPB = 0x00000003
+_PCAPNG_OPB = 0x00000002
+_PCAPNG_EPB = 0x00000006
+
+# Link-layer types
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LOOP = 108
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+_ETH_IPV4 = 0x0800
+_ETH_IPV6 = 0x86DD
+_ETH_VLAN = (0x8100, 0x88A8, 0x9100)
+_IPPROTO_UDP = 17
+
+
+def _ip_payload(linktype, frame):
+    """Strips the link layer. Returns (ethertype, offset of the IP header) or None."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None
+        ethertype = struct.unpack_from("!H", frame, 12)[0]
+        offset = 14
+        while ethertype in _ETH_VLAN and len(frame) >= offset + 4:
+            ethertype = struct.unpack_from("!H", frame, offset + 2)[0]
+            offset += 4
+        return ethertype, offset
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16:
+            return None
+        return struct.unpack_from("!H", frame, 14)[0], 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20:
+            return None
+        return struct.unpack_from("!H", frame, 0)[0], 20
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if len(frame) < 4:
+            return None
+        family = struct.unpack_from("<I" if linktype == LINKTYPE_NULL else "!I", frame, 0)[0]
+        if family > 0xFFFF:  # Written with the other byte order
+            family = struct.unpack_from(">I" if linktype == LINKTYPE_NULL else "<I", frame, 0)[0]
+        return (_ETH_IPV4 if family == 2 else _ETH_IPV6), 4
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if not frame:
+            return None
+        return (_ETH_IPV4 if frame[0] >> 4 == 4 else _ETH_IPV6), 0
+    return None
+
+
+def _udp_dns_payload(linktype, frame):
+    """Returns the payload of a UDP packet to or from port 53, or None."""
+    link = _ip_payload(linktype, frame)
+    if link is None:
+        return None
+    ethertype, offset = link
+    if ethertype == _ETH_IPV4:
+        if len(frame) < offset + 20:
+            return None
+        ihl = (frame[offset] & 0x0F) * 4
+        flags_fragment = struct.unpack_from("!H", frame, offset + 6)[0]
+        if frame[offset + 9] != _IPPROTO_UDP or flags_fragment & 0x1FFF:
+            return None  # Not UDP, or a non-first fragment
+        offset += ihl
+    elif ethertype == _ETH_IPV6:
+        if len(frame) < offset + 40 or frame[offset + 6] != _IPPROTO_UDP:
+            return None  # Extension headers are not followed
+        offset += 40
+    else:
+        return None
+    if len(frame) < offset + 8:
+        return None
+    sport, dport = struct.unpack_from("!HH", frame, offset)
+    if DNS_PORT not in (sport, dport):
+        return None
+    return frame[offset + 8:]
+
+
+def _dns_query(payload):
+    """Decodes (qname, qtype) from a DNS query payload, or None for anything else."""
+    if len(payload) < 12:
+        return None
+    flags, qdcount = struct.unpack_from("!HH", payload, 2)
+    if flags & 0x8000 or qdcount == 0:
+        return None  # A response, or no question
+    labels = []
+    offset = 12
+    try:
+        while True:
+            length = payload[offset]
+            offset += 1
+            if length == 0:
+                break
+            if length & 0xC0:
+                return None
+            labels.append(bytes(payload[offset:offset + length]).decode("utf-8", "replace"))
+            offset += length
+        qtype = struct.unpack_from("!H", payload, offset)[0]
+    except (IndexError, struct.error):
+        return None
+    return ".".join(labels), qtype
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) < size:
+        raise EOFError
+    return data
+
+
+def _pcap_frames(f, header):
+    """Yields (timestamp, linktype, frame) from a classic pcap file."""
+    magic = struct.unpack_from("<I", header, 0)[0]
+    order, divisor = _PCAP_MAGIC[magic]
+    rest = _read_exact(f, 20)
+    linktype = struct.unpack_from(order + "I", rest, 16)[0] & 0x0FFFFFFF
+    record = struct.Struct(order + "IIII")
+    while True:
+        try:
+            ts_sec, ts_frac, incl_len, _ = record.unpack(_read_exact(f, 16))
+            if incl_len > MAX_SNAPLEN:
+                # Records carry no marker to resync on, so nothing after this can be trusted
+                return
+            frame = _read_exact(f, incl_len)
+        except EOFError:
+            return
+        yield ts_sec + ts_frac / divisor, linktype, frame
+
+
+def _valid_block_length(length):
+    """
+    pcapng blocks are at least 12 bytes (type, length, trailing length) and
+    padded to 32 bits. Anything else means a corrupt or truncated capture,
+    where reading length - 8 bytes could swallow the rest of the file.
+    """
+    return length >= 12 and length % 4 == 0
+
+
+def _pcapng_frames(f, first):
+    """Yields (timestamp, linktype, frame) from a pcapng file."""
+    order = "<"
+    interfaces = []   # (linktype, timestamp units per second)
+    block_head = first
+    while True:
+        try:
+            if block_head is None:
+                block_head = _read_exact(f, 8)
+            block_type = struct.unpack_from(order + "I", block_head, 0)[0]
+            if block_type == _PCAPNG_SHB:
+                bom = _read_exact(f, 4)
+                order = "<" if struct.unpack("<I", bom)[0] == 0x1A2B3C4D else ">"
+                length = struct.unpack_from(order + "I", block_head, 4)[0]
+                if not _valid_block_length(length):
+                    return
+                _read_exact(f, length - 12)
+                interfaces = []
+                block_head = None
+                continue
+            length = struct.unpack_from(order + "I", block_head, 4)[0]
+            if not _valid_block_length(length):
+                return
+            body = _read_exact(f, length - 8)
+        except EOFError:
+            return
+        block_head = None
+
+        if block_type == _PCAPNG_IDB:
+            linktype = struct.unpack_from(order + "H", body, 0)[0]
+            interfaces.append((linktype, _if_tsresol(body[8:-4], order)))
+        elif block_type == _PCAPNG_EPB:
+            if_id, ts_high, ts_low, cap_len = struct.unpack_from(order + "IIII", body, 0)
+            if if_id >= len(interfaces):
+                continue
+            linktype, units = interfaces[if_id]
+            yield ((ts_high << 32) | ts_low) / units, linktype, body[20:20 + cap_len]
+        elif block_type == _PCAPNG_SPB and interfaces:
+            orig_len = struct.unpack_from(order + "I", body, 0)[0]
+            linktype, _ = interfaces[0]
+            # Simple packets carry no timestamp
+            yield 0.0, linktype, body[4:4 + min(orig_len, len(body) - 8)]
+        elif block_type == _PCAPNG_OPB:
+            if_id, _, ts_high, ts_low, cap_len = struct.unpack_from(order + "HHIII", body, 0)
+            if if_id >= len(interfaces):
+                continue
+            linktype, units = interfaces[if_id]
+            yield ((ts_high << 32) | ts_low) / units, linktype, body[20:20 + cap_len]
+
+
+def _if_tsresol(options, order):
+    """Reads the if_tsresol option of an interface block (default microseconds)."""
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(order + "HH", options, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = options[offset + 4]
+            return 2 ** (value & 0x7F) if value & 0x80 else 10 ** value
+        offset += 4 + ((length + 3) & ~3)
+    return 10 ** 6
+
+
+def iter_queries(pcap_file):
+    """
+    Yields a DNSQuery for every DNS query packet in a pcap or pcapng file,
+    in capture order, reading one packet at a time.
+    """
+    with open(pcap_file, "rb") as f:
+        header = f.read(4)
+        if len(header) < 4:
+            return
+        magic = struct.unpack("<I", header)[0]
+        if magic in _PCAP_MAGIC:
+            frames = _pcap_frames(f, header)
+        elif magic == _PCAPNG_SHB:
+            frames = _pcapng_frames(f, header + f.read(4))
+        else:
+            raise ValueError(f"{pcap_file} is not a pcap or pcapng file")
+        for timestamp, linktype, frame in frames:
+            payload = _udp_dns_payload(linktype, frame)
+            if payload is None:
+                continue
+            query = _dns_query(payload)
+            if query is not None:
+                yield DNSQuery(timestamp, query[0], query[1])
+
+
+def unique_domains(pcap_file):
+    """The unique query names in a capture, in order of first appearance."""
+    seen = {}
+    for query in iter_queries(pcap_file):
+        domain = query.qname.rstrip(".")
+        if domain and domain not in seen:
+            seen[domain] = None
+    return list(seen)
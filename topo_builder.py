@@ -0,0 +1,372 @@
+#!/usr/bin/python3
+"""
+CS331 Assignment 2: Topology builder
+Builds the Mininet network of every part from a declarative config
+(topologies/*.json, or YAML if PyYAML is installed) instead of hand-written
+addHost/addLink calls: how many client hosts and switches, how the switches
+are connected (a chain like the assignment's, or a tree for hundreds of
+clients), bandwidth/delay/loss of each link, the NAT, and how many resolver
+replicas run on which switches.
+
+    sudo python3 topo_builder.py topologies/partd.json
+    python3 topo_builder.py topologies/scale_100.json --dry-run   (no Mininet needed)
+
+Addresses are handed out in order from the subnet: clients first (h1 =
+10.0.0.1, ...), then the resolvers, so the assignment layout keeps dns =
+10.0.0.5. Each client is paired with the nearest resolver (fewest switch
+hops, ties shared round-robin); Mininet hosts share /etc/resolv.conf, so
+that pairing is reported in the plan (and used by run_experiment.py) while
+resolv.conf gets the first resolver.
+"""
+import argparse
+import ipaddress
+import json
+import os
+import shlex
+import signal
+import time
+from collections import deque
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TOPOLOGY_DIR = os.path.join(ROOT, "topologies")
+STOP_TIMEOUT = 15.0   # Seconds resolvers get to save their cache and flush their logs
+# TCLink settings a link may have: bw in Mbit/s, delay/jitter like "5ms", loss in percent
+LINK_OPTIONS = ("bw", "delay", "jitter", "loss", "max_queue_size")
+
+# Every setting a config may leave out
+DEFAULTS = {
+    "subnet": "10.0.0.0/24",
+    "static_arp": False,
+    "switches": {
+        "layout": "chain",   # s1 - s2 - ... - sN, or "tree"
+        "count": 4,          # chain only
+        "fanout": 2,         # tree only: children per switch
+        "depth": 2,          # tree only: levels below the root
+        "stp": False,
+        "link": {"bw": 100, "delay": "5ms"},
+        "links": [],         # Per switch-to-switch link overrides, in build order
+    },
+    "clients": {
+        "count": 4,
+        "prefix": "h",
+        "switches": None,    # Switches to attach to, cycled (default: every edge switch)
+        "link": {"bw": 100, "delay": "2ms"},
+    },
+    "resolvers": {
+        "count": 1,
+        "name": "dns",       # dns, or dns1, dns2, ... for several replicas
+        "switches": ["s2"],  # Cycled over the replicas
+        "link": {"bw": 100, "delay": "1ms"},
+        "command": None,     # Started on each replica; {ip} and {name} are filled in
+        "workdir": None,     # Relative to the repository root
+    },
+    "nat": {"switch": "s1", "ip": None},   # null for no internet access
+    "nameserver": "resolver",              # an IP, "resolver", or null to leave it alone
+}
+
+
+class Node:
+    """A host of the plan: its name, address, switch and access link."""
+
+    __slots__ = ("name", "ip", "switch", "link")
+
+    def __init__(self, name, ip, switch, link):
+        self.name = name
+        self.ip = ip
+        self.switch = switch
+        self.link = link
+
+    def __repr__(self):
+        return f"{self.name}({self.ip} @ {self.switch})"
+
+
+class Plan:
+    """Everything the builder will create, worked out without touching Mininet."""
+
+    def __init__(self, config):
+        self.config = config
+        self.switches = []
+        self.switch_links = []   # (switch, switch, link options)
+        self.clients = []
+        self.resolvers = []
+        self.nat = None
+        self.nameservers = {}    # client name -> resolver IP
+
+    def summary(self):
+        lines = [f"{len(self.clients)} clients, {len(self.resolvers)} resolvers, "
+                 f"{len(self.switches)} switches, {len(self.switch_links)} switch links"]
+        for a, b, link in self.switch_links:
+            lines.append(f"  {a} - {b} {_describe(link)}")
+        for node in self.resolvers + ([self.nat] if self.nat else []) + self.clients:
+            extra = f" -> {self.nameservers[node.name]}" if node.name in self.nameservers else ""
+            lines.append(f"  {node.name:<8} {node.ip:<15} on {node.switch} "
+                         f"{_describe(node.link)}{extra}")
+        return lines
+
+
+def _describe(link):
+    return " ".join(f"{key}={link[key]}" for key in LINK_OPTIONS if key in link)
+
+
+def _merged(defaults, overrides):
+    """Config sections are dicts merged one level deep over DEFAULTS."""
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        if key not in defaults and key != "description":
+            raise ValueError(f"unknown topology setting {key!r}")
+        if isinstance(defaults.get(key), dict) and isinstance(value, dict):
+            unknown = set(value) - set(defaults[key])
+            if unknown:
+                raise ValueError(f"unknown {key} settings: {', '.join(sorted(unknown))}")
+            merged[key] = dict(defaults[key], **value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_config(path):
+    """Reads a topology config (JSON, or YAML if PyYAML is installed)."""
+    if not os.path.exists(path) and os.path.exists(os.path.join(TOPOLOGY_DIR, path)):
+        path = os.path.join(TOPOLOGY_DIR, path)
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("PyYAML is needed for YAML topologies: pip install pyyaml")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def plan(config):
+    """Works out the nodes, addresses and links a config describes."""
+    config = _merged(DEFAULTS, config or {})
+    result = Plan(config)
+    switches = config["switches"]
+
+    # --- Switches ---
+    edges = []
+    if switches["layout"] == "chain":
+        result.switches = [f"s{i}" for i in range(1, switches["count"] + 1)]
+        edges = list(zip(result.switches, result.switches[1:]))
+        edge_switches = result.switches
+    elif switches["layout"] == "tree":
+        result.switches = ["s1"]
+        level = ["s1"]
+        for _ in range(switches["depth"]):
+            children = []
+            for parent in level:
+                for _ in range(switches["fanout"]):
+                    child = f"s{len(result.switches) + 1}"
+                    result.switches.append(child)
+                    children.append(child)
+                    edges.append((parent, child))
+            level = children
+        edge_switches = level
+    else:
+        raise ValueError(f"unknown switch layout {switches['layout']!r}")
+    for index, (a, b) in enumerate(edges):
+        overrides = switches["links"][index] if index < len(switches["links"]) else {}
+        result.switch_links.append((a, b, dict(switches["link"], **overrides)))
+
+    def placed(names, default, count):
+        names = names or default
+        missing = [name for name in names if name not in result.switches]
+        if missing:
+            raise ValueError(f"no such switch: {', '.join(missing)}")
+        return [names[i % len(names)] for i in range(count)]
+
+    # --- Addresses ---
+    network = ipaddress.ip_network(config["subnet"])
+    addresses = network.hosts()
+    clients, resolvers = config["clients"], config["resolvers"]
+    needed = clients["count"] + resolvers["count"] + (1 if config["nat"] else 0)
+    if needed > network.num_addresses - 2:
+        raise ValueError(f"{config['subnet']} has room for {network.num_addresses - 2} hosts, "
+                         f"{needed} needed; use a larger subnet such as 10.0.0.0/16")
+    suffix = f"/{network.prefixlen}"
+
+    for switch, index in zip(placed(clients["switches"], edge_switches, clients["count"]),
+                             range(1, clients["count"] + 1)):
+        result.clients.append(Node(f"{clients['prefix']}{index}", str(next(addresses)) + suffix,
+                                   switch, dict(clients["link"])))
+    for index, switch in enumerate(placed(resolvers["switches"], ["s1"], resolvers["count"])):
+        name = resolvers["name"] if resolvers["count"] == 1 else f"{resolvers['name']}{index + 1}"
+        result.resolvers.append(Node(name, str(next(addresses)) + suffix, switch,
+                                     dict(resolvers["link"])))
+    if config["nat"]:
+        nat_ip = config["nat"]["ip"] or str(network.broadcast_address - 1)
+        result.nat = Node("nat0", f"{nat_ip}{suffix}", placed([config["nat"]["switch"]], None,
+                                                              1)[0], {})
+
+    # --- Which resolver each client uses ---
+    if config["nameserver"] == "resolver" and result.resolvers:
+        hops = _hops(result.switches, edges)
+        for index, client in enumerate(result.clients):
+            best = min(hops[client.switch][r.switch] for r in result.resolvers)
+            nearest = [r for r in result.resolvers if hops[client.switch][r.switch] == best]
+            result.nameservers[client.name] = _ip(nearest[index % len(nearest)])
+    elif config["nameserver"] and config["nameserver"] != "resolver":
+        result.nameservers = {client.name: config["nameserver"] for client in result.clients}
+    return result
+
+
+def _hops(switches, edges):
+    """Switch-to-switch hop counts (breadth-first search from every switch)."""
+    neighbours = {name: [] for name in switches}
+    for a, b in edges:
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+    hops = {}
+    for start in switches:
+        seen = {start: 0}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for other in neighbours[node]:
+                if other not in seen:
+                    seen[other] = seen[node] + 1
+                    queue.append(other)
+        hops[start] = seen
+    return hops
+
+
+def _ip(node):
+    return node.ip.split("/")[0]
+
+
+# --- Mininet ---
+
+def build(topology):
+    """Creates (but does not start) the Mininet network of a Plan."""
+    from mininet.net import Mininet
+    from mininet.node import Host, OVSKernelSwitch
+    from mininet.link import TCLink
+    from mininet.log import info
+
+    config = topology.config
+    net = Mininet(controller=None, switch=OVSKernelSwitch, host=Host, link=TCLink,
+                  autoSetMacs=True, autoStaticArp=config["static_arp"])
+    info('*** Adding Switches\n')
+    for name in topology.switches:
+        # failMode='standalone' makes the switches learn like plain L2 switches
+        net.addSwitch(name, failMode='standalone', stp=config["switches"]["stp"])
+    info(f'*** Adding {len(topology.clients)} client hosts and '
+         f'{len(topology.resolvers)} resolver hosts\n')
+    for node in topology.clients + topology.resolvers:
+        net.addHost(node.name, ip=node.ip)
+        net.addLink(node.name, node.switch, **_link_options(node.link))
+    if topology.nat:
+        info('*** Adding NAT for internet connectivity\n')
+        net.addNAT(name=topology.nat.name, ip=topology.nat.ip, inNamespace=False, connect=False)
+        net.addLink(topology.nat.name, topology.nat.switch)
+    info('*** Adding switch links\n')
+    for a, b, link in topology.switch_links:
+        net.addLink(a, b, **_link_options(link))
+    return net
+
+
+def _link_options(link):
+    return {key: link[key] for key in LINK_OPTIONS if key in link}
+
+
+def start(net, topology):
+    """Starts the network, routes, DNS settings and resolver replicas. Returns their PIDs."""
+    from mininet.log import info
+
+    config = topology.config
+    info('*** Starting network\n')
+    net.start()
+    hosts = [net.get(node.name) for node in topology.clients + topology.resolvers]
+    if topology.nat:
+        info('*** Setting default internet route for hosts\n')
+        for host in hosts:
+            host.cmd(f'ip route add default via {_ip(topology.nat)}')
+    if topology.nameservers:
+        # /etc/resolv.conf is shared by every Mininet host, so it is written once
+        first = next(iter(topology.nameservers.values()))
+        net.get(topology.clients[0].name).cmd(f'echo "nameserver {first}" > /etc/resolv.conf')
+        info(f'*** Clients use nameserver {first}\n')
+
+    pids = {}
+    command = config["resolvers"]["command"]
+    if command:
+        workdir = os.path.join(ROOT, config["resolvers"]["workdir"] or "")
+        for node in topology.resolvers:
+            info(f'*** Starting resolver on {node.name} ({_ip(node)})\n')
+            line = command.format(ip=_ip(node), name=node.name)
+            output = os.path.join(workdir, f"{node.name}.out")
+            # exec, so that $! is the resolver itself and not a subshell around it
+            pid = net.get(node.name).cmd(f'cd {shlex.quote(workdir)} && exec {line} '
+                                         f'> {shlex.quote(output)} 2>&1 & echo $!')
+            pids[node.name] = pid.strip().splitlines()[-1]
+    return pids
+
+
+def _signal(pid, signum):
+    try:
+        os.kill(int(pid), signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _running(pid):
+    """True until pid has exited (a zombie waiting to be reaped counts as exited)."""
+    try:
+        with open(f"/proc/{int(pid)}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return False
+
+
+def stop(net, pids):
+    """Stops the resolvers (so they save their cache and flush their logs), then the network."""
+    from mininet.log import info
+
+    if pids:
+        info('*** Stopping resolvers\n')
+        for pid in pids.values():
+            _signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for name, pid in pids.items():
+            while _running(pid) and time.monotonic() < deadline:
+                time.sleep(0.1)
+            if _running(pid):
+                info(f'*** {name} did not exit in {STOP_TIMEOUT:g}s, killing it\n')
+                _signal(pid, signal.SIGKILL)
+    info('*** Stopping network\n')
+    net.stop()
+
+
+def run(config_path):
+    """Builds a config's network, opens the Mininet CLI, and tears it down afterwards."""
+    from mininet.cli import CLI
+
+    topology = plan(load_config(config_path))
+    net = build(topology)
+    pids = start(net, topology)
+    try:
+        info_lines = ["**********************************************",
+                      f"* Network is up: {len(topology.clients)} clients, "
+                      f"{len(topology.resolvers)} resolvers.",
+                      "* Run 'pingall' to test, 'exit' to quit.",
+                      "**********************************************"]
+        print("\n".join(info_lines))
+        CLI(net)
+    finally:
+        stop(net, pids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a Mininet topology from a config file")
+    parser.add_argument('config', help="topology file, e.g. topologies/partd.json")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="print the hosts, addresses and links without starting Mininet")
+    args = parser.parse_args()
+    if args.dry_run:
+        for line in plan(load_config(args.config)).summary():
+            print(line)
+    else:
+        from mininet.log import setLogLevel
+        setLogLevel('info')
+        run(args.config)